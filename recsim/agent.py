@@ -20,6 +20,8 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import copy
+
 from absl import logging
 import six
 
@@ -79,6 +81,28 @@ class AbstractRecommenderAgent(object):
         empty dictionary.
     """
 
+  def checkpoint_snapshot(self, checkpoint_dir, iteration_number):
+    """Snapshots the agent's state for a checkpoint written later.
+
+    The returned function writes the checkpoint of the agent as it was when
+    the snapshot was taken, and may be called from another thread while the
+    agent keeps running. The default implementation checkpoints the agent
+    right away and returns a copy of its bundle; agents with large state
+    override it to defer the writing.
+
+    Args:
+      checkpoint_dir: A string for the directory where objects will be saved.
+      iteration_number: An integer of iteration number to use for naming the
+        checkpoint file.
+
+    Returns:
+      A function taking no arguments that writes the checkpoint and returns
+        the dictionary that bundle_and_checkpoint would have returned.
+    """
+    bundle_dict = copy.deepcopy(
+        self.bundle_and_checkpoint(checkpoint_dir, iteration_number))
+    return lambda: bundle_dict
+
   @abc.abstractmethod
   def unbundle(self, checkpoint_dir, iteration_number, bundle_dict):
     """Restores the agent from a checkpoint.
@@ -16,6 +16,7 @@
 """Convenience primitives relating to the implementation of agents."""
 from gym import spaces
 import numpy as np
+from recsim import space_layout
 
 
 class GymSpaceWalker(object):
@@ -38,15 +39,17 @@ class GymSpaceWalker(object):
   def __init__(self, gym_space, leaf_op):
     self._gym_space = gym_space
     self._leaf_op = leaf_op
+    # The nested structure is walked once; applications only visit the leaves.
+    self._leaves = space_layout.leaf_spaces(gym_space)
+    for _, space in self._leaves:
+      if not isinstance(space, (spaces.Box, spaces.Discrete)):
+        raise NotImplementedError('Gym space type ' + str(type(space)) +
+                                  ' not implemented yet.')
 
   def apply_and_flatten(self, gym_observations):
-    return self._descend_and_flatten(self._gym_space, gym_observations)
-
-  def _descend_and_flatten(self, gym_space, gym_observations):
-    """Recursive implementation of flattening and leaf op application.
+    """Applies leaf_op to the leaves of a list of observations.
 
     Args:
-      gym_space: An instance of an OpenAI Gym space.
       gym_observations: A list of observation conforming to the format
         of gym_space.
 
@@ -54,23 +57,14 @@ class GymSpaceWalker(object):
       flattened_apply: a list of the applications of leaf_op to the leaves of
         the gym space, as encountered in post-order traversal.
     """
-    if isinstance(gym_space, spaces.dict.Dict):
-      flattened_apply = []
-      for key, space in gym_space.spaces.items():
-        flattened_apply += self._descend_and_flatten(
-            space,
-            [gym_observation[key] for gym_observation in gym_observations])
-    elif isinstance(gym_space, spaces.tuple.Tuple):
-      flattened_apply = []
-      for i, space in enumerate(gym_space.spaces):
-        flattened_apply += self._descend_and_flatten(
-            space, [gym_observation[i] for gym_observation in gym_observations])
-    elif isinstance(gym_space, spaces.box.Box) or isinstance(
-        gym_space, spaces.discrete.Discrete):
-      return self._leaf_op(gym_space, gym_observations)
-    else:
-      raise NotImplementedError('Gym space type ' + str(type(gym_space)) +
-                                ' not implemented yet.')
+    if len(self._leaves) == 1 and not self._leaves[0][0]:
+      return self._leaf_op(self._gym_space, gym_observations)
+    flattened_apply = []
+    for path, space in self._leaves:
+      flattened_apply += self._leaf_op(space, [
+          space_layout.get_path(gym_observation, path)
+          for gym_observation in gym_observations
+      ])
     return flattened_apply
 
 
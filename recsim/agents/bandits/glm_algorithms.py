@@ -23,6 +23,13 @@ from scipy import special
 import six
 
 
+def _sherman_morrison_update(matrix_inv, x, weight):
+  """Returns the inverse of A + weight * x.x^T given matrix_inv = A^-1."""
+  matrix_inv_x = matrix_inv.dot(x)
+  return matrix_inv - (weight / (1. + weight * x.dot(matrix_inv_x))) * np.outer(
+      matrix_inv_x, matrix_inv_x)
+
+
 @six.add_metaclass(abc.ABCMeta)
 class GLMAlgorithm(object):
   """Base class for Generalized Linear Models (GLM) bandit algorithms.
@@ -43,16 +50,45 @@ class GLMAlgorithm(object):
     optimism_scaling: A float specifying the confidence level. Default value
       (1.0) corresponds to the exploration strategy presented in the literature.
       A smaller number means less exploration and more exploitation.
+    solver: The maximum-likelihood solver, one of 'irls' (iterative
+      reweighted least squares over the history) or 'online' (one Newton step
+      per update, with O(dim^2) cost).
+    window: If set, IRLS only fits the most recent window pulls, which bounds
+      the cost of solve_logistic_bandit.
     _rng: An instance of random.RandomState for random number generation
   """
 
-  def __init__(self, dim, sigma0=1., optimism_scaling=1.):
-    self._rewards = np.array([])  # stores all rewards
-    self._arms = np.ndarray([0, dim])  # stores arm differences
+  def __init__(self, dim, sigma0=1., optimism_scaling=1., solver='irls',
+               window=None):
+    if solver not in ('irls', 'online'):
+      raise ValueError('Unknown solver: {}'.format(solver))
     self._dim = dim
-    self._outer = np.zeros([dim, dim])
     self._sigma0 = sigma0
     self._optimism_scaling = optimism_scaling
+    self._solver = solver
+    self._window = window
+    # History of pulled arms and rewards, grown by doubling.
+    self._num_pulls = 0
+    self._arm_buffer = np.zeros([16, dim])
+    self._reward_buffer = np.zeros(16)
+    prior = np.eye(dim) / np.square(sigma0)
+    self._outer = np.zeros([dim, dim])
+    # Inverse of self._outer + prior, maintained with Sherman-Morrison updates.
+    self._gram_inv = np.linalg.inv(prior)
+    # State of the online Newton solver.
+    self._online_w = np.zeros(dim)
+    self._online_hessian = prior
+    self._online_hessian_inv = np.copy(self._gram_inv)
+
+  @property
+  def _arms(self):
+    """The arms pulled so far, a view of shape [num_pulls, dim]."""
+    return self._arm_buffer[:self._num_pulls]
+
+  @property
+  def _rewards(self):
+    """The rewards observed so far, a view of shape [num_pulls]."""
+    return self._reward_buffer[:self._num_pulls]
 
   def update(self, reward, arm):
     """Updates state with arm and reward.
@@ -63,9 +99,30 @@ class GLMAlgorithm(object):
     """
     assert len(arm) == self._dim, 'Expected dimension {}, got {}'.format(
         self._dim, len(arm))
-    self._rewards = np.append(self._rewards, reward)
-    self._arms = np.concatenate((self._arms, [arm]), axis=0)
+    arm = np.asarray(arm, dtype=np.float64)
+    if self._num_pulls == len(self._reward_buffer):
+      capacity = 2 * len(self._reward_buffer)
+      arm_buffer = np.zeros([capacity, self._dim])
+      arm_buffer[:self._num_pulls] = self._arm_buffer
+      reward_buffer = np.zeros(capacity)
+      reward_buffer[:self._num_pulls] = self._reward_buffer
+      self._arm_buffer, self._reward_buffer = arm_buffer, reward_buffer
+    self._arm_buffer[self._num_pulls] = arm
+    self._reward_buffer[self._num_pulls] = reward
+    self._num_pulls += 1
     self._outer += np.outer(arm, arm)
+    self._gram_inv = _sherman_morrison_update(self._gram_inv, arm, 1.)
+    if self._solver == 'online':
+      self._online_newton_step(reward, arm)
+
+  def _online_newton_step(self, reward, arm):
+    """Updates the online estimate with one Newton step on the new pull."""
+    prob = special.expit(arm.dot(self._online_w))
+    weight = prob * (1 - prob)
+    self._online_hessian += weight * np.outer(arm, arm)
+    self._online_hessian_inv = _sherman_morrison_update(
+        self._online_hessian_inv, arm, weight)
+    self._online_w -= self._online_hessian_inv.dot((prob - reward) * arm)
 
   def solve_logistic_bandit(self, init_iters=10, num_iters=20, tol=1e-3):
     """Solves the maximum-likelihood problem.
@@ -84,21 +141,30 @@ class GLMAlgorithm(object):
       gram: Gram matrix
     """
 
-    arms = self._arms
     w = np.zeros(self._dim)
     gram = np.eye(self._dim) / np.square(self._sigma0)
-    if len(self._arms) > init_iters:
-      for _ in range(num_iters):
-        prev_w = np.copy(w)
-        arms_w = arms.dot(w)
-        sig_arms_w = special.expit(arms_w)
-        r = np.diag(sig_arms_w * (1 - sig_arms_w))
-        gram = (((arms.T).dot(r)).dot(arms) +
-                np.eye(self._dim) / np.square(self._sigma0))
-        rz = r.dot(arms_w) - (sig_arms_w - self._rewards)
-        w = np.linalg.solve(gram, (arms.T).dot(rz))
-        if np.linalg.norm(w - prev_w) < tol:
-          break
+    if self._num_pulls <= init_iters:
+      return w, gram
+    if self._solver == 'online':
+      return np.copy(self._online_w), np.copy(self._online_hessian)
+
+    arms = self._arms
+    rewards = self._rewards
+    if self._window is not None:
+      arms = arms[-self._window:]
+      rewards = rewards[-self._window:]
+    for _ in range(num_iters):
+      prev_w = np.copy(w)
+      arms_w = arms.dot(w)
+      sig_arms_w = special.expit(arms_w)
+      # Diagonal IRLS weights, applied to the rows of arms.
+      r = sig_arms_w * (1 - sig_arms_w)
+      gram = ((arms.T * r).dot(arms) +
+              np.eye(self._dim) / np.square(self._sigma0))
+      rz = r * arms_w - (sig_arms_w - rewards)
+      w = np.linalg.solve(gram, (arms.T).dot(rz))
+      if np.linalg.norm(w - prev_w) < tol:
+        break
 
     return w, gram
 
@@ -127,8 +193,10 @@ class UCB_GLM(GLMAlgorithm):  # pylint: disable=invalid-name
   by Li et al. (2017).
   """
 
-  def __init__(self, dim, horizon, sigma0=1., optimism_scaling=1.):
-    super(UCB_GLM, self).__init__(dim, sigma0, optimism_scaling)
+  def __init__(self, dim, horizon, sigma0=1., optimism_scaling=1.,
+               solver='irls', window=None):
+    super(UCB_GLM, self).__init__(dim, sigma0, optimism_scaling, solver,
+                                  window)
     # Set confidence interval scaling, by
     # Theorem 2 in Li (2017)
     # Provably Optimal Algorithms for Generalized Linear Contextual Bandits
@@ -151,9 +219,8 @@ class UCB_GLM(GLMAlgorithm):  # pylint: disable=invalid-name
       The selected arm, its index in arms, and the computed scores
     """
     arm_matrix = self.get_arm_matrix(arms)
-    gram = self._outer + np.eye(self._dim) / np.square(self._sigma0)
-    gram_inv = np.linalg.inv(gram)
-    ucbs = np.sqrt((np.matmul(arm_matrix, gram_inv) * arm_matrix).sum(axis=1))
+    ucbs = np.sqrt(
+        (np.matmul(arm_matrix, self._gram_inv) * arm_matrix).sum(axis=1))
     # Estimate w
     w, _ = self.solve_logistic_bandit()
     # Compute UCB
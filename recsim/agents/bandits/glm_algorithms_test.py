@@ -40,6 +40,60 @@ class UCB_GLMTest(tf.test.TestCase):  # pylint: disable=invalid-name
     self.add_random_arms(n_arms)
     self.assertLen(self._alg._arms, n_arms)
 
+  def test_update_grows_history(self):
+    n_arms = 100
+    self.add_random_arms(n_arms)
+    self.assertEqual(self._alg._arms.shape, (n_arms, self._dim))
+    self.assertLen(self._alg._rewards, n_arms)
+
+  def test_gram_inverse(self):
+    self.add_random_arms(20)
+    gram = self._alg._outer + np.eye(self._dim) / np.square(self._alg._sigma0)
+    self.assertAllClose(self._alg._gram_inv, np.linalg.inv(gram))
+
+  def test_solve_logistic_bandit_matches_dense_irls(self):
+    self.add_random_arms(30)
+    arms = self._alg._arms
+    rewards = self._alg._rewards
+    w = np.zeros(self._dim)
+    for _ in range(20):
+      sig_arms_w = special.expit(arms.dot(w))
+      r = np.diag(sig_arms_w * (1 - sig_arms_w))
+      gram = arms.T.dot(r).dot(arms) + np.eye(self._dim)
+      rz = r.dot(arms.dot(w)) - (sig_arms_w - rewards)
+      w = np.linalg.solve(gram, arms.T.dot(rz))
+    expected_w, expected_gram = w, gram
+    w, gram = self._alg.solve_logistic_bandit(tol=0.)
+    self.assertAllClose(w, expected_w)
+    self.assertAllClose(gram, expected_gram)
+
+  def test_windowed_solver(self):
+    alg = glm_algorithms.UCB_GLM(self._dim, horizon=100, window=5)
+    arms = np.random.uniform(size=(20, self._dim))
+    rewards = np.random.binomial(1, 0.5, size=20)
+    for reward, arm in zip(rewards, arms):
+      alg.update(reward, arm)
+    recent = glm_algorithms.UCB_GLM(self._dim, horizon=100)
+    for reward, arm in zip(rewards[-5:], arms[-5:]):
+      recent.update(reward, arm)
+    self.assertAllClose(
+        alg.solve_logistic_bandit(init_iters=0),
+        recent.solve_logistic_bandit(init_iters=0))
+
+  def test_online_solver(self):
+    alg = glm_algorithms.UCB_GLM(self._dim, horizon=1000, solver='online')
+    w_star = np.array([2., -2., 1.])
+    for _ in range(2000):
+      arm = np.random.normal(size=self._dim)
+      alg.update(np.random.binomial(1, special.expit(arm.dot(w_star))), arm)
+    w, gram = alg.solve_logistic_bandit()
+    self.assertEqual(np.shape(gram), (self._dim, self._dim))
+    self.assertAllClose(w, w_star, atol=0.5)
+
+  def test_unknown_solver(self):
+    with self.assertRaises(ValueError):
+      glm_algorithms.GLM_TS(self._dim, solver='sgd')
+
   def test_arm_matrix(self):
     n_arms = 10
     arms = [np.random.uniform(size=self._dim) for _ in range(n_arms)]
@@ -77,9 +77,9 @@ class ClusterBanditAgentTest(tf.test.TestCase):
     sufficient_stats_observation = self.doc_user_to_sufficient_stats(
         documents, user_obs)
     slate = agent.step(0, sufficient_stats_observation)
-    # Documents in Topic 0 sorted by quality: 1, 2.
-    # Documents in Topic 1 sorted by quality: 0, 4, 3.
-    self.assertAllEqual(slate, [0, 4, 3, 1, 2])
+    # Documents in Topic 0 sorted by quality: 1.
+    # Documents in Topic 1 sorted by quality: 0, 3, 2, 4.
+    self.assertAllEqual(slate, [0, 3, 2, 4, 1])
 
   def test_bundle_and_unbundle_trivial(self):
     action_space = spaces.MultiDiscrete(2 * np.ones((2,)))
@@ -19,12 +19,16 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import copy
+import os
 
 from dopamine.agents.dqn import dqn_agent
 from dopamine.replay_memory import circular_replay_buffer
 import gin.tf
 from gym import spaces
 import numpy as np
+from recsim import space_layout
+from recsim.agents.dopamine import shared_replay_buffer
 import tensorflow.compat.v1 as tf
 
 DQNNetworkType = collections.namedtuple('dqn_network', ['q_values'])
@@ -62,7 +66,21 @@ class ResponseAdapter(object):
     return self._response_dtype
 
   def encode(self, responses):
+    """Encodes responses as a [slate_size, num_responses] array.
+
+    Args:
+      responses: A tuple of response observations, or a structured array of
+        response records (see user.encode_responses).
+
+    Returns:
+      The array of responses, padded with zeros for shorter slates.
+    """
     response_tensor = np.zeros(self._response_shape, dtype=self._response_dtype)
+    if isinstance(responses, np.ndarray) and responses.dtype.names:
+      # Records are copied one field (i.e. one column) at a time.
+      for j, key in enumerate(self.response_names):
+        response_tensor[:len(responses), j] = responses[key]
+      return response_tensor
     for i, response in enumerate(responses):
       # Note: the order of dictionary keys in the self._input_response_space is
       # not necessarily the same as the order of the keys in the observation
@@ -83,7 +101,16 @@ class ObservationAdapter(object):
     doc_space = input_observation_space.spaces['doc']
     self._num_candidates = len(doc_space.spaces)
 
-    doc_space_shape = spaces.flatdim(list(doc_space.spaces.values())[0])
+    single_doc_space = list(doc_space.spaces.values())[0]
+    doc_space_shape = spaces.flatdim(single_doc_space)
+    # Box document observations can be stacked directly without flattening
+    # every document separately.
+    self._stack_doc_obs = all(
+        isinstance(d, spaces.Box) for d in doc_space.spaces.values())
+    # Flat layouts of the observations are compiled once.
+    self._user_layout = space_layout.SpaceLayout(user_space)
+    self._doc_layouts = space_layout.compile_layouts(
+        doc_space.spaces.values())
     # Use the longer of user_space and doc_space as the shape of each row.
     obs_shape = (np.max([spaces.flatdim(user_space), doc_space_shape]),)
     self._observation_shape = (self._num_candidates + 1,) + obs_shape
@@ -124,19 +151,94 @@ class ObservationAdapter(object):
     image = np.zeros(
         self._observation_shape + (self._stack_size,),
         dtype=self._observation_dtype)
-    image[0, :, 0] = self._pad_with_zeros(
-        spaces.flatten(self._input_observation_space.spaces['user'],
-                       observation['user']))
-    doc_space = zip(self._input_observation_space.spaces['doc'].spaces.values(),
-                    observation['doc'].values())
-    image[1:, :, 0] = np.array([
-        self._pad_with_zeros(spaces.flatten(doc_space, d))
-        for doc_space, d in doc_space
-    ])
+    self._user_layout.encode_into(observation['user'], image[0, :, 0])
+    if self._stack_doc_obs:
+      doc_obs = np.array(list(observation['doc'].values()))
+      doc_obs = doc_obs.reshape((self._num_candidates, -1))
+      image[1:, :doc_obs.shape[1], 0] = doc_obs
+      return image
+    for i, (doc_layout, d) in enumerate(
+        zip(self._doc_layouts, observation['doc'].values())):
+      doc_layout.encode_into(d, image[i + 1, :, 0])
 
     return image
 
 
+class _VariableCheckpointWriter(object):
+  """Writes TensorFlow checkpoints of snapshotted variable values.
+
+  The values are loaded into copies of the variables in a private graph and
+  session, so that checkpoints can be written from another thread while the
+  agent's session keeps training. Checkpoints have the variable names of the
+  agent's graph and are restored by its Saver.
+  """
+
+  def __init__(self, variables, max_to_keep):
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._variables = [
+          tf.Variable(
+              tf.zeros(variable.shape, dtype=variable.dtype.base_dtype),
+              name=variable.op.name) for variable in variables
+      ]
+      self._saver = tf.train.Saver(
+          var_list={
+              variable.op.name: copy_variable
+              for variable, copy_variable in zip(variables, self._variables)
+          },
+          max_to_keep=max_to_keep)
+    self._sess = tf.Session(graph=self._graph)
+
+  def save(self, values, save_path, global_step):
+    for variable, value in zip(self._variables, values):
+      variable.load(value, self._sess)
+    self._saver.save(
+        self._sess, save_path, global_step=global_step,
+        write_meta_graph=False)
+
+
+def _snapshot_replay_memory(memory):
+  """Returns a copy of the checkpointed state of a replay memory.
+
+  Args:
+    memory: An OutOfGraphReplayBuffer or a ShardedReplayBuffer.
+
+  Returns:
+    An object whose save method writes the same files as memory.save would
+      have when the snapshot was taken.
+  """
+  if isinstance(memory, shared_replay_buffer.ShardedReplayBuffer):
+    snapshot = copy.copy(memory)
+    snapshot.shards = [
+        _snapshot_replay_memory(shard) for shard in memory.shards
+    ]
+    return snapshot
+  if isinstance(memory, shared_replay_buffer.SharedMemoryReplayBuffer):
+    # The actor writing the shard must not update its storage and cursor
+    # while they are copied.
+    with memory.pause_writes():
+      return _copy_replay_memory(memory)
+  return _copy_replay_memory(memory)
+
+
+def _copy_replay_memory(memory):
+  """Returns an OutOfGraphReplayBuffer copy of the state of memory."""
+  # A plain OutOfGraphReplayBuffer, even for a shared-memory buffer, whose
+  # checkpointed elements are its storage and public attributes.
+  snapshot = circular_replay_buffer.OutOfGraphReplayBuffer.__new__(
+      circular_replay_buffer.OutOfGraphReplayBuffer)
+  snapshot.__dict__.update(memory.__dict__)
+  for name, value in memory.__dict__.items():
+    if not name.startswith('_'):
+      snapshot.__dict__[name] = copy.deepcopy(value)
+  # pylint: disable=protected-access
+  snapshot._store = {
+      name: np.array(array) for name, array in memory._store.items()
+  }
+  # pylint: enable=protected-access
+  return snapshot
+
+
 # The following functions creates the DQN network for RecSim.
 def recsim_dqn_network(user, doc, scope):
   inputs = tf.concat([user, doc], axis=1)
@@ -151,13 +253,41 @@ class DQNAgentRecSim(dqn_agent.DQNAgent):
   """RecSim-specific Dopamine DQN agent that converts the observation space."""
 
   def __init__(self, sess, observation_space, num_actions, stack_size,
-               optimizer_name, eval_mode, **kwargs):
+               optimizer_name, eval_mode, num_replay_shards=0,
+               replay_memory=None, **kwargs):
+    """Initializes a DQNAgentRecSim.
+
+    Besides the usual serial mode, the agent can take either role of the
+    actor/learner mode, where actor processes collect experience into a
+    shared-memory replay buffer from which a learner trains.
+
+    Args:
+      sess: a Tensorflow session.
+      observation_space: A gym.spaces object that specifies the format of
+        observations.
+      num_actions: int, number of actions the agent can take at any state.
+      stack_size: int, number of frames to use in state stack.
+      optimizer_name: The name of the optimizer.
+      eval_mode: A bool for whether the agent is in training or evaluation mode.
+      num_replay_shards: int, if positive, the agent is a learner whose replay
+        memory is a ShardedReplayBuffer with this many shards, one for each
+        actor process. The shards are available as replay_memory.shards.
+      replay_memory: An OutOfGraphReplayBuffer, typically a shard of the
+        learner's replay memory. If set, the agent is an actor: it stores its
+        transitions in replay_memory but does not train.
+      **kwargs: Keyword arguments to the DQNAgent.
+    """
     if stack_size != 1:
       raise ValueError(
           'Invalid stack_size: %s. Only stack_size=1 is supported for now.' %
           stack_size)
 
     self._env_observation_space = observation_space
+    self._max_tf_checkpoints_to_keep = kwargs.get('max_tf_checkpoints_to_keep',
+                                                  4)
+    self._variable_checkpoint_writer = None
+    self._num_replay_shards = num_replay_shards
+    self._replay_memory = replay_memory
     # In our case, the observation is a data structure that stores observation
     # of the user and candidate documents. We uses an observation adapter to
     # convert it to an "image", which is required by dopamine DQNAgent.
@@ -187,6 +317,78 @@ class DQNAgentRecSim(dqn_agent.DQNAgent):
         eval_mode=eval_mode,
         **kwargs)
 
+  @property
+  def replay_memory(self):
+    """The out-of-graph replay memory of the agent."""
+    return self._replay.memory
+
+  def train_step(self):
+    """Runs one training step on the replay memory.
+
+    In the actor/learner mode, the learner calls this once for every
+    transition added by the actors instead of stepping through episodes.
+    """
+    self._train_step()
+
+  def _train_step(self):
+    if self._replay_memory is not None:
+      # Actors only collect experience. Training steps are still counted to
+      # decay the exploration rate.
+      self.training_steps += 1
+      return
+    super(DQNAgentRecSim, self)._train_step()
+
+  def checkpoint_snapshot(self, checkpoint_dir, iteration_number):
+    """Snapshots the agent's state for a checkpoint written later.
+
+    The variable values and the replay memory are copied to host memory, and
+    the returned function writes the same checkpoint as bundle_and_checkpoint
+    from the copies.
+
+    Args:
+      checkpoint_dir: str, directory where TensorFlow objects will be saved.
+      iteration_number: int, iteration number to use for naming the checkpoint
+        file.
+
+    Returns:
+      A function taking no arguments that writes the checkpoint and returns
+        the dictionary that bundle_and_checkpoint would have returned.
+    """
+    if not tf.io.gfile.exists(checkpoint_dir):
+      return lambda: None
+    variables = self._sess.graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)
+    if self._variable_checkpoint_writer is None:
+      self._variable_checkpoint_writer = _VariableCheckpointWriter(
+          variables, self._max_tf_checkpoints_to_keep)
+    values = self._sess.run(variables)
+    replay_snapshot = _snapshot_replay_memory(self._replay.memory)
+    bundle_dictionary = {
+        'state': np.copy(self.state),
+        'training_steps': self.training_steps
+    }
+
+    def write_checkpoint():
+      self._variable_checkpoint_writer.save(
+          values, os.path.join(checkpoint_dir, 'tf_ckpt'), iteration_number)
+      replay_snapshot.save(checkpoint_dir, iteration_number)
+      return bundle_dictionary
+
+    return write_checkpoint
+
+  def _wrapped_replay_buffer(self, **kwargs):
+    """Creates the replay buffer, honoring the actor/learner roles.
+
+    Args:
+      **kwargs: Keyword arguments to the WrappedReplayBuffer.
+
+    Returns:
+      A WrappedReplayBuffer object.
+    """
+    return wrapped_replay_buffer(
+        replay_memory=self._replay_memory,
+        num_replay_shards=self._num_replay_shards,
+        **kwargs)
+
   def _validate_states(self, states):
     shape = states.get_shape()
     if len(shape) != 4 or shape[1] != self._num_candidates + 1:
@@ -195,5 +397,25 @@ class DQNAgentRecSim(dqn_agent.DQNAgent):
                        (shape, self._num_candidates + 1))
 
 
-def wrapped_replay_buffer(**kwargs):
-  return circular_replay_buffer.WrappedReplayBuffer(**kwargs)
+def wrapped_replay_buffer(replay_memory=None, num_replay_shards=0, **kwargs):
+  """Creates a WrappedReplayBuffer.
+
+  Args:
+    replay_memory: An optional OutOfGraphReplayBuffer to wrap.
+    num_replay_shards: int, if positive and replay_memory is None, wraps a new
+      ShardedReplayBuffer with this many shards.
+    **kwargs: Keyword arguments to the WrappedReplayBuffer.
+
+  Returns:
+    A WrappedReplayBuffer object.
+  """
+  if replay_memory is None and num_replay_shards > 0:
+    memory_kwargs = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in ('use_staging', 'replay_capacity', 'batch_size')
+    }
+    replay_memory = shared_replay_buffer.ShardedReplayBuffer(
+        num_replay_shards, **memory_kwargs)
+  return circular_replay_buffer.WrappedReplayBuffer(
+      wrapped_memory=replay_memory, **kwargs)
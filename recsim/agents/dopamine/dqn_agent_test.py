@@ -0,0 +1,81 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.dopamine.dqn_agent."""
+
+import numpy as np
+from recsim.agents import full_slate_q_agent
+from recsim.environments import interest_evolution
+import tensorflow.compat.v1 as tf
+
+
+class DQNAgentRecSimTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(DQNAgentRecSimTest, self).setUp()
+    self._env = interest_evolution.create_environment({
+        'num_candidates': 4,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    })
+
+  def _create_agent(self, sess):
+    return full_slate_q_agent.FullSlateQAgent(
+        sess,
+        observation_space=self._env.observation_space,
+        action_space=self._env.action_space,
+        factorized_head=True,
+        min_replay_history=2,
+        update_period=1)
+
+  def _run_steps(self, agent, num_steps):
+    observation = self._env.reset()
+    slate = agent.begin_episode(observation)
+    for _ in range(num_steps):
+      observation, reward, _, _ = self._env.step(slate)
+      slate = agent.step(reward, observation)
+
+  def test_checkpoint_snapshot(self):
+    checkpoint_dir = self.get_temp_dir()
+    with tf.Graph().as_default(), tf.Session() as sess:
+      agent = self._create_agent(sess)
+      sess.run(tf.global_variables_initializer())
+      self._run_steps(agent, 5)
+      variables = tf.trainable_variables()
+      snapshot_values = sess.run(variables)
+      add_count = int(agent.replay_memory.add_count)
+      write_checkpoint = agent.checkpoint_snapshot(checkpoint_dir, 0)
+      # The agent keeps training before the checkpoint is written.
+      self._run_steps(agent, 5)
+      self.assertNotAllClose(sess.run(variables[0]), snapshot_values[0])
+      bundle_dict = write_checkpoint()
+    self.assertEqual(bundle_dict['training_steps'], 6)
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+      agent = self._create_agent(sess)
+      sess.run(tf.global_variables_initializer())
+      self.assertTrue(agent.unbundle(checkpoint_dir, 0, bundle_dict))
+      for expected, value in zip(snapshot_values,
+                                 sess.run(tf.trainable_variables())):
+        self.assertAllClose(expected, value)
+      self.assertEqual(int(agent.replay_memory.add_count), add_count)
+      self.assertEqual(agent.training_steps, 6)
+      self.assertEqual(np.asarray(agent.state).shape,
+                       np.asarray(bundle_dict['state']).shape)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,355 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Replay memories in shared memory for actor/learner training.
+
+A SharedMemoryReplayBuffer is a Dopamine OutOfGraphReplayBuffer whose storage
+arrays, insertion counter and episode boundaries live in a single
+multiprocessing.shared_memory block. The buffer can be passed to a child
+process, which attaches to the same block when unpickling it, so transitions
+added by one process are visible to all others without any copy.
+
+Each buffer has a single writer. A ShardedReplayBuffer therefore holds one
+buffer (shard) per actor process, keeping the transitions of an episode
+contiguous as the circular buffer requires, and samples minibatches for the
+learner across all shards.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+
+from dopamine.replay_memory import circular_replay_buffer
+import gin.tf
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+# Shared arrays are aligned to cache lines.
+_ALIGNMENT = 64
+
+
+def _aligned_size(shape, dtype):
+  size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+  return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+class _SharedIndexSet(object):
+  """A set of replay indices stored as flags in a shared array."""
+
+  def __init__(self, flags):
+    self._flags = flags
+
+  def __contains__(self, index):
+    return bool(self._flags[index])
+
+  def add(self, index):
+    self._flags[index] = 1
+
+  def discard(self, index):
+    self._flags[index] = 0
+
+  def __reduce__(self):
+    # Checkpoints hold a plain set, as for OutOfGraphReplayBuffer. The flags
+    # are copied first since an actor may be updating them.
+    return set, (np.flatnonzero(np.copy(self._flags)).tolist(),)
+
+
+class SharedMemoryReplayBuffer(circular_replay_buffer.OutOfGraphReplayBuffer):
+  """An OutOfGraphReplayBuffer stored in shared memory.
+
+  Only one process may add transitions to the buffer; any number of processes
+  may sample from it concurrently. Transitions that may be partially written
+  are excluded from sampling by the invalid range around the shared cursor.
+  Checkpoints are taken while writes are paused, so that they are consistent.
+
+  The process creating the buffer owns the shared memory and frees it in
+  close(). Copies of the buffer unpickled in other processes attach to the
+  same memory.
+  """
+
+  def __init__(self, *args, **kwargs):
+    """Initializes a SharedMemoryReplayBuffer.
+
+    Args:
+      *args: Positional arguments to the OutOfGraphReplayBuffer.
+      **kwargs: Keyword arguments to the OutOfGraphReplayBuffer.
+    """
+    self._shm = None
+    self._owner = True
+    # Held by the writer while adding a transition. Actors are spawned, so the
+    # lock must be usable by spawned processes.
+    self._write_lock = multiprocessing.get_context('spawn').Lock()
+    super(SharedMemoryReplayBuffer, self).__init__(*args, **kwargs)
+    # OutOfGraphReplayBuffer resets the counters to private objects.
+    self._map_storage()
+
+  def _layout(self):
+    """Returns the (name, shape, dtype) of the arrays in shared memory."""
+    layout = [(element.name, (self._replay_capacity,) + tuple(element.shape),
+               element.type) for element in self.get_storage_signature()]
+    layout.append(('episode_end', (self._replay_capacity,), np.uint8))
+    layout.append(('add_count', (), np.int64))
+    return layout
+
+  def _create_storage(self):
+    size = sum(
+        _aligned_size(shape, dtype) for _, shape, dtype in self._layout())
+    self._shm = shared_memory.SharedMemory(create=True, size=size)
+    self._map_storage()
+
+  def _map_storage(self):
+    """Maps the storage arrays and counters onto the shared memory."""
+    shared = {}
+    offset = 0
+    for name, shape, dtype in self._layout():
+      shared[name] = np.ndarray(
+          shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+      offset += _aligned_size(shape, dtype)
+    self.add_count = shared.pop('add_count')
+    self.episode_end_indices = _SharedIndexSet(shared.pop('episode_end'))
+    self._store = shared
+
+  @property
+  def invalid_range(self):
+    # Derived from the shared cursor so that all processes agree on it.
+    return circular_replay_buffer.invalid_range(self.cursor(),
+                                                self._replay_capacity,
+                                                self._stack_size,
+                                                self._update_horizon)
+
+  @invalid_range.setter
+  def invalid_range(self, value):
+    del value  # Always derived from the cursor.
+
+  def add(self, *args, **kwargs):
+    """Adds a transition, unless writes are paused."""
+    with self._write_lock:
+      super(SharedMemoryReplayBuffer, self).add(*args, **kwargs)
+
+  def pause_writes(self):
+    """Returns a context manager during which no transition is added."""
+    return self._write_lock
+
+  def save(self, checkpoint_dir, iteration_number):
+    """Saves the buffer while writes are paused.
+
+    Args:
+      checkpoint_dir: str, the directory where to write the numpy checkpoint
+        files.
+      iteration_number: int, the iteration number used as a suffix of the
+        checkpoint files.
+    """
+    with self.pause_writes():
+      super(SharedMemoryReplayBuffer, self).save(checkpoint_dir,
+                                                 iteration_number)
+
+  def num_sampleable(self):
+    """Returns the number of stored transitions, or 0 if none can be sampled."""
+    if self.is_full():
+      return self._replay_capacity
+    num_transitions = int(self.add_count)
+    if num_transitions - self._update_horizon <= self._stack_size - 1:
+      return 0
+    return num_transitions
+
+  def load(self, checkpoint_dir, suffix):
+    """Restores the buffer from a checkpoint into shared memory.
+
+    Args:
+      checkpoint_dir: str, the directory where to read the numpy checkpointed
+        files from.
+      suffix: str, the suffix to use in numpy checkpoint files.
+    """
+    super(SharedMemoryReplayBuffer, self).load(checkpoint_dir, suffix)
+    # The base class replaces the arrays with the loaded ones.
+    loaded_store = self._store
+    add_count = int(self.add_count)
+    episode_end_indices = set(self.episode_end_indices)
+    self._map_storage()
+    for name, array in loaded_store.items():
+      self._store[name][...] = array
+    self.add_count[...] = add_count
+    flags = self.episode_end_indices._flags  # pylint: disable=protected-access
+    flags[...] = 0
+    flags[list(episode_end_indices)] = 1
+
+  def close(self):
+    """Detaches from the shared memory, which is freed by its owner."""
+    if self._shm is None:
+      return
+    # Views must be released before the memory can be closed.
+    self.add_count = np.array(int(self.add_count))
+    self.episode_end_indices = set()
+    self._store = {}
+    self._shm.close()
+    if self._owner:
+      self._shm.unlink()
+    self._shm = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    for key in ['_shm', '_store', 'add_count', 'episode_end_indices']:
+      del state[key]
+    state['_shm_name'] = self._shm.name
+    state['_owner'] = False
+    return state
+
+  def __setstate__(self, state):
+    shm_name = state.pop('_shm_name')
+    self.__dict__.update(state)
+    self._shm = shared_memory.SharedMemory(name=shm_name)
+    self._map_storage()
+
+
+@gin.configurable
+class ShardedReplayBuffer(object):
+  """A replay memory made of one SharedMemoryReplayBuffer per actor.
+
+  Actor processes add transitions to their own shard. The learner samples
+  minibatches across shards, assigning the rows of each minibatch to shards in
+  proportion to the number of transitions they hold, so that transitions are
+  sampled uniformly as from a single buffer.
+
+  It implements the parts of the OutOfGraphReplayBuffer interface used by
+  WrappedReplayBuffer and the DQN agent.
+  """
+
+  def __init__(self,
+               num_shards,
+               observation_shape,
+               stack_size,
+               replay_capacity=1000000,
+               batch_size=32,
+               update_horizon=1,
+               gamma=0.99,
+               **kwargs):
+    """Initializes a ShardedReplayBuffer.
+
+    Args:
+      num_shards: int, the number of shards, i.e. of actor processes.
+      observation_shape: tuple of ints.
+      stack_size: int, number of frames to use in state stack.
+      replay_capacity: int, number of transitions to keep in memory, split
+        evenly between shards.
+      batch_size: int.
+      update_horizon: int, length of update ('n' in n-step update).
+      gamma: int, the discount factor.
+      **kwargs: Keyword arguments to the SharedMemoryReplayBuffers.
+    """
+    self._batch_size = batch_size
+    self._shard_capacity = replay_capacity // num_shards
+    self.shards = [
+        SharedMemoryReplayBuffer(
+            observation_shape,
+            stack_size,
+            self._shard_capacity,
+            batch_size,
+            update_horizon=update_horizon,
+            gamma=gamma,
+            **kwargs) for _ in range(num_shards)
+    ]
+
+  @property
+  def add_count(self):
+    """The total number of transitions added to all shards."""
+    return sum(int(shard.add_count) for shard in self.shards)
+
+  def add(self, *args, **kwargs):
+    del args, kwargs  # Unused.
+    raise NotImplementedError(
+        'Transitions are added to the shards by the actor processes.')
+
+  def get_transition_elements(self, batch_size=None):
+    """Returns a 'type signature' for sample_transition_batch."""
+    return self.shards[0].get_transition_elements(batch_size or
+                                                  self._batch_size)
+
+  def sample_transition_batch(self, batch_size=None, indices=None):
+    """Returns a batch of transitions sampled across shards.
+
+    Args:
+      batch_size: int, number of transitions returned. If None, the default
+        batch_size will be used.
+      indices: None or list of ints, the indices of every transition in the
+        batch, where index i refers to transition i % shard_capacity of shard
+        i // shard_capacity. If None, sample the indices uniformly.
+
+    Returns:
+      transition_batch: tuple of np.arrays with the shape and type as in
+        get_transition_elements().
+
+    Raises:
+      RuntimeError: If no shard holds enough transitions to be sampled.
+    """
+    if batch_size is None:
+      batch_size = self._batch_size
+    if indices is None:
+      sizes = np.array([shard.num_sampleable() for shard in self.shards])
+      if not sizes.sum():
+        raise RuntimeError('Cannot sample from an empty replay buffer.')
+      shard_ids = np.repeat(
+          np.arange(len(self.shards)),
+          np.random.multinomial(batch_size, sizes / sizes.sum()))
+    else:
+      indices = np.asarray(indices)
+      shard_ids = indices // self._shard_capacity
+      shard_indices = indices % self._shard_capacity
+
+    transition_elements = self.get_transition_elements(batch_size)
+    batch_arrays = [
+        np.empty(element.shape, dtype=element.type)
+        for element in transition_elements
+    ]
+    for shard_id, shard in enumerate(self.shards):
+      rows = np.flatnonzero(shard_ids == shard_id)
+      if not rows.size:
+        continue
+      if indices is None:
+        shard_batch = shard.sample_transition_batch(rows.size)
+      else:
+        shard_batch = shard.sample_transition_batch(
+            rows.size, list(shard_indices[rows]))
+      for element, batch_array, shard_array in zip(transition_elements,
+                                                   batch_arrays, shard_batch):
+        if element.name == 'indices':
+          shard_array = shard_array + shard_id * self._shard_capacity
+        batch_array[rows] = shard_array
+    return tuple(batch_arrays)
+
+  def _shard_dir(self, checkpoint_dir, shard_id):
+    return os.path.join(checkpoint_dir, 'replay_shard_%d' % shard_id)
+
+  def save(self, checkpoint_dir, iteration_number):
+    """Saves every shard in a subdirectory of checkpoint_dir."""
+    if not tf.io.gfile.exists(checkpoint_dir):
+      return
+    for shard_id, shard in enumerate(self.shards):
+      shard_dir = self._shard_dir(checkpoint_dir, shard_id)
+      tf.io.gfile.makedirs(shard_dir)
+      shard.save(shard_dir, iteration_number)
+
+  def load(self, checkpoint_dir, suffix):
+    """Restores every shard from a subdirectory of checkpoint_dir."""
+    for shard_id, shard in enumerate(self.shards):
+      shard.load(self._shard_dir(checkpoint_dir, shard_id), suffix)
+
+  def close(self):
+    """Detaches from, and frees, the shared memory of all shards."""
+    for shard in self.shards:
+      shard.close()
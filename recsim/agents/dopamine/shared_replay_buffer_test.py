@@ -0,0 +1,152 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.dopamine.shared_replay_buffer."""
+
+import multiprocessing
+import os
+
+import numpy as np
+from recsim.agents.dopamine import shared_replay_buffer
+import tensorflow.compat.v1 as tf
+
+_OBSERVATION_SHAPE = (3, 2)
+
+
+def _add_episodes(memory, first_episode, num_episodes, episode_length):
+  """Adds episodes whose observations hold the episode and step numbers."""
+  for episode in range(first_episode, first_episode + num_episodes):
+    for step in range(episode_length):
+      observation = np.full(_OBSERVATION_SHAPE, episode * 100 + step,
+                            dtype=np.float32)
+      memory.add(observation, step, float(episode), step == episode_length - 1)
+  memory.close()
+
+
+class SharedReplayBufferTest(tf.test.TestCase):
+
+  def _create_buffer(self, **kwargs):
+    return shared_replay_buffer.ShardedReplayBuffer(
+        num_shards=2,
+        observation_shape=_OBSERVATION_SHAPE,
+        stack_size=1,
+        replay_capacity=200,
+        batch_size=16,
+        observation_dtype=np.float32,
+        **kwargs)
+
+  def _check_batch(self, buffer, batch):
+    elements = [element.name for element in buffer.get_transition_elements()]
+    batch = dict(zip(elements, batch))
+    self.assertEqual(batch['state'].shape, (16,) + _OBSERVATION_SHAPE + (1,))
+    for i in range(16):
+      value = batch['state'][i, 0, 0, 0]
+      episode, step = divmod(int(value), 100)
+      self.assertEqual(batch['action'][i], step)
+      self.assertEqual(batch['reward'][i], episode)
+      if not batch['terminal'][i]:
+        self.assertEqual(batch['next_state'][i, 0, 0, 0], value + 1)
+
+  def test_sample_from_shards_filled_by_other_processes(self):
+    buffer = self._create_buffer()
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(
+            target=_add_episodes, args=(shard, 10 * shard_id, 5, 6))
+        for shard_id, shard in enumerate(buffer.shards)
+    ]
+    for process in processes:
+      process.start()
+    for process in processes:
+      process.join()
+      self.assertEqual(process.exitcode, 0)
+
+    self.assertEqual(buffer.add_count, 60)
+    for shard in buffer.shards:
+      self.assertIn(5, shard.episode_end_indices)
+      self.assertNotIn(4, shard.episode_end_indices)
+    batch = buffer.sample_transition_batch()
+    self._check_batch(buffer, batch)
+    indices = batch[-1]
+    # Rows are drawn from both shards, with global indices.
+    self.assertTrue(np.any(indices < 100))
+    self.assertTrue(np.any(indices >= 100))
+    buffer.close()
+
+  def test_sample_given_indices(self):
+    buffer = self._create_buffer()
+    for shard_id, shard in enumerate(buffer.shards):
+      for step in range(4):
+        shard.add(
+            np.full(_OBSERVATION_SHAPE, shard_id * 100 + step,
+                    dtype=np.float32), step, float(shard_id), False)
+    batch = buffer.sample_transition_batch(batch_size=2, indices=[101, 2])
+    self.assertAllEqual(batch[0][:, 0, 0, 0], [101, 2])
+    self.assertAllEqual(batch[-1], [101, 2])
+    buffer.close()
+
+  def test_pause_writes(self):
+    buffer = self._create_buffer()
+    shard = buffer.shards[0]
+    process = multiprocessing.get_context('spawn').Process(
+        target=_add_episodes, args=(shard, 0, 1, 6))
+    with shard.pause_writes():
+      process.start()
+      process.join(timeout=2)
+      # The writer is blocked on its first transition.
+      self.assertTrue(process.is_alive())
+      self.assertEqual(buffer.add_count, 0)
+    process.join()
+    self.assertEqual(process.exitcode, 0)
+    self.assertEqual(buffer.add_count, 6)
+    buffer.close()
+
+  def test_empty_buffer(self):
+    buffer = self._create_buffer()
+    with self.assertRaises(RuntimeError):
+      buffer.sample_transition_batch()
+    with self.assertRaises(NotImplementedError):
+      buffer.add(np.zeros(_OBSERVATION_SHAPE), 0, 0., False)
+    buffer.close()
+
+  def test_save_and_load(self):
+    checkpoint_dir = os.path.join(self.get_temp_dir(), 'replay')
+    tf.io.gfile.makedirs(checkpoint_dir)
+    buffer = self._create_buffer()
+    for shard in buffer.shards:
+      for step in range(5):
+        shard.add(
+            np.full(_OBSERVATION_SHAPE, step, dtype=np.float32), step,
+            float(step), step == 4)
+    buffer.save(checkpoint_dir, 0)
+    buffer.close()
+
+    restored = self._create_buffer()
+    restored.load(checkpoint_dir, 0)
+    self.assertEqual(restored.add_count, 10)
+    shard = restored.shards[1]
+    self.assertAllEqual(shard._store['action'][:5], np.arange(5))
+    self.assertIn(4, shard.episode_end_indices)
+    # The restored storage is still shared with attached copies.
+    attached = shard.__class__.__new__(shard.__class__)
+    attached.__setstate__(shard.__getstate__())
+    attached._store['action'][0] = 7
+    self.assertEqual(shard._store['action'][0], 7)
+    attached.close()
+    restored.close()
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -15,21 +15,96 @@
 # limitations under the License.
 """Agent that implements the Slate-Q algorithms."""
 
-import itertools
 import gin.tf
 from gym import spaces
+import numpy as np
 from recsim import agent as abstract_agent
+from recsim.agents import slate_indexing
 from recsim.agents.dopamine import dqn_agent
 import tensorflow.compat.v1 as tf
 
 
+def _assign_positions(values):
+  """Returns the distinct documents maximizing the summed position values.
+
+  Solves the rectangular assignment problem with the Hungarian algorithm
+  (shortest augmenting paths with potentials) in O(slate_size^2 *
+  num_candidates) time.
+
+  Args:
+    values: [slate_size, num_candidates] float array, where values[i, j] is the
+      value of document j at position i. slate_size <= num_candidates.
+
+  Returns:
+    An int32 array of slate_size distinct document indices.
+  """
+  num_positions, num_docs = values.shape
+  # Arrays are 1-indexed; row and column 0 are the virtual start of the
+  # augmenting paths.
+  cost = np.zeros((num_positions + 1, num_docs + 1))
+  cost[1:, 1:] = -values
+  row_potentials = np.zeros(num_positions + 1)
+  col_potentials = np.zeros(num_docs + 1)
+  # The position assigned to each document, 0 if none.
+  assigned = np.zeros(num_docs + 1, dtype=np.int64)
+  previous = np.zeros(num_docs + 1, dtype=np.int64)
+  for position in range(1, num_positions + 1):
+    assigned[0] = position
+    col = 0
+    min_slack = np.full(num_docs + 1, np.inf)
+    used = np.zeros(num_docs + 1, dtype=bool)
+    while assigned[col]:
+      used[col] = True
+      row = assigned[col]
+      slack = cost[row] - row_potentials[row] - col_potentials
+      improved = ~used & (slack < min_slack)
+      min_slack[improved] = slack[improved]
+      previous[improved] = col
+      free_slack = np.where(used, np.inf, min_slack)
+      next_col = int(np.argmin(free_slack))
+      delta = free_slack[next_col]
+      row_potentials[assigned[used]] += delta
+      col_potentials[used] -= delta
+      min_slack[~used] -= delta
+      col = next_col
+    # Augments the matching along the path ending at col.
+    while col:
+      assigned[col] = assigned[previous[col]]
+      col = previous[col]
+  slate = np.empty(num_positions, dtype=np.int32)
+  docs = np.flatnonzero(assigned[1:])
+  slate[assigned[1:][docs] - 1] = docs
+  return slate
+
+
+def best_ordered_slates(position_values):
+  """Returns the ordered slates maximizing the sum of their position values.
+
+  Args:
+    position_values: [batch_size, slate_size, num_candidates] float array of
+      the value of every document at every position.
+
+  Returns:
+    [batch_size, slate_size] int32 array of slates.
+  """
+  return np.stack([_assign_positions(values) for values in position_values])
+
+
 @gin.configurable
 class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
                       abstract_agent.AbstractEpisodicRecommenderAgent):
   """A recommender agent implements full slate Q-learning based on DQN agent.
 
   This is a standard, nondecomposed Q-learning method that treats each slate
-  atomically (i.e., holistically) as a single action.
+  atomically (i.e., holistically) as a single action. Slates are numbered by
+  slate_indexing, so the agent never materializes the list of all slates.
+
+  By default, the Q-network has a tower, and an output, for every slate. With
+  factorized_head, the Q-value of a slate is instead the sum of the Q-values of
+  its documents at their positions, computed by a single tower applied to
+  every (document, position) pair. The greedy slate is then found without
+  enumerating slates, by a top-K selection for unordered slates or an
+  assignment of documents to positions for ordered ones.
   """
 
   def __init__(self,
@@ -38,6 +113,8 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
                action_space,
                optimizer_name='',
                eval_mode=False,
+               ordered_slates=True,
+               factorized_head=False,
                **kwargs):
     """Initializes a FullSlateQAgent.
 
@@ -48,16 +125,26 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
       action_space: A gym.spaces object that specifies the format of actions.
       optimizer_name: The name of the optimizer.
       eval_mode: A bool for whether the agent is in training or evaluation mode.
+      ordered_slates: A bool for whether the order of documents in a slate
+        matters, i.e. whether actions are permutations or combinations.
+      factorized_head: A bool for whether to use the factorized Q-network head
+        instead of one tower per slate.
       **kwargs: Keyword arguments to the DQNAgent.
+
+    Raises:
+      ValueError: If the number of slates does not fit in an int32 action.
     """
     self._num_candidates = int(action_space.nvec[0])
     abstract_agent.AbstractEpisodicRecommenderAgent.__init__(self, action_space)
-    # Each slate is a single action. Assume ordering of items matters.
-    self._all_possible_slates = [
-        x for x in itertools.permutations(
-            range(self._num_candidates), action_space.nvec.shape[0])
-    ]
-    num_actions = len(self._all_possible_slates)
+    self._slate_size = action_space.nvec.shape[0]
+    self._ordered_slates = ordered_slates
+    self._factorized_head = factorized_head
+    # Each slate is a single action.
+    num_actions = slate_indexing.num_slates(
+        self._num_candidates, self._slate_size, ordered=ordered_slates)
+    if num_actions > np.iinfo(np.int32).max:
+      raise ValueError('Too many slates to index with int32 actions: %d.' %
+                       num_actions)
     self._env_action_space = spaces.Discrete(num_actions)
 
     dqn_agent.DQNAgentRecSim.__init__(
@@ -70,22 +157,80 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
         eval_mode=eval_mode,
         **kwargs)
 
+  def _index_to_slate(self, index):
+    return slate_indexing.index_to_slate(
+        index, self._num_candidates, self._slate_size,
+        ordered=self._ordered_slates)
+
   # Builds a tower to compute Q-value for each possible slate.
   def _network_adapter(self, states, scope):
     self._validate_states(states)
 
     with tf.name_scope('network'):
+      if self._factorized_head:
+        return dqn_agent.DQNNetworkType(
+            self._position_q_values(states, scope))
       q_value_list = []
-      for slate in self._all_possible_slates:
+      for index in range(self.num_actions):
         user = tf.squeeze(states[:, 0, :, :], axis=2)
         docs = []
-        for i in slate:
+        for i in self._index_to_slate(index):
           docs.append(tf.squeeze(states[:, i + 1, :, :], axis=2))
         q_value_list.append(self.network(user, tf.concat(docs, axis=1), scope))
       q_values = tf.concat(q_value_list, axis=1)
 
     return dqn_agent.DQNNetworkType(q_values)
 
+  def _position_q_values(self, states, scope):
+    """Returns the Q-values of the documents at every slate position.
+
+    Args:
+      states: [batch_size, num_candidates + 1, num_features, 1] tensor.
+      scope: The variable scope of the network.
+
+    Returns:
+      [batch_size, num_positions, num_candidates] tensor, where num_positions
+        is slate_size for ordered slates and 1 otherwise.
+    """
+    num_positions = self._slate_size if self._ordered_slates else 1
+    num_features = states.get_shape().as_list()[2]
+    user = tf.squeeze(states[:, 0, :, :], axis=2)
+    docs = tf.squeeze(states[:, 1:, :, :], axis=3)
+    shape = [tf.shape(input=states)[0], num_positions, self._num_candidates]
+    user = tf.broadcast_to(user[:, tf.newaxis, tf.newaxis, :],
+                           shape + [num_features])
+    docs = tf.broadcast_to(docs[:, tf.newaxis, :, :], shape + [num_features])
+    num_doc_features = num_features
+    if self._ordered_slates:
+      # Each document is scored at every position, given as a one-hot.
+      positions = tf.eye(num_positions)[tf.newaxis, :, tf.newaxis, :]
+      docs = tf.concat(
+          [docs, tf.broadcast_to(positions, shape + [num_positions])], axis=3)
+      num_doc_features += num_positions
+    q_values = self.network(
+        tf.reshape(user, [-1, num_features]),
+        tf.reshape(docs, [-1, num_doc_features]), scope)
+    return tf.reshape(q_values, shape)
+
+  def _slate_q_values(self, position_q_values, slates):
+    """Returns the Q-values of slates from their position Q-values."""
+    if self._ordered_slates:
+      doc_q_values = tf.gather(position_q_values, slates, batch_dims=2)
+    else:
+      doc_q_values = tf.gather(
+          position_q_values[:, 0, :], slates, batch_dims=1)
+    return tf.reduce_sum(input_tensor=doc_q_values, axis=1)
+
+  def _best_slates(self, position_q_values):
+    """Returns the slates with the highest Q-values."""
+    if not self._ordered_slates:
+      return tf.math.top_k(position_q_values[:, 0, :], k=self._slate_size,
+                           sorted=False).indices
+    slates = tf.numpy_function(best_ordered_slates, [position_q_values],
+                               tf.int32)
+    slates.set_shape([None, self._slate_size])
+    return slates
+
   def _build_networks(self):
     with tf.name_scope('networks'):
       self._replay_net_outputs = self._network_adapter(self._replay.states,
@@ -93,7 +238,38 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
       self._replay_next_target_net_outputs = self._network_adapter(
           self._replay.states, 'Target')
       self._net_outputs = self._network_adapter(self.state_ph, 'Online')
-      self._q_argmax = tf.argmax(input=self._net_outputs.q_values, axis=1)[0]
+      if self._factorized_head:
+        self._q_argmax = slate_indexing.slates_to_indices_tf(
+            self._best_slates(self._net_outputs.q_values),
+            self._num_candidates,
+            ordered=self._ordered_slates)[0]
+      else:
+        self._q_argmax = tf.argmax(input=self._net_outputs.q_values, axis=1)[0]
+
+  def _build_target_q_op(self):
+    if not self._factorized_head:
+      return super(FullSlateQAgent, self)._build_target_q_op()
+    next_q_values = self._replay_next_target_net_outputs.q_values
+    replay_next_qt_max = self._slate_q_values(
+        next_q_values, self._best_slates(next_q_values))
+    return self._replay.rewards + self.cumulative_gamma * replay_next_qt_max * (
+        1. - tf.cast(self._replay.terminals, tf.float32))
+
+  def _build_train_op(self):
+    if not self._factorized_head:
+      return super(FullSlateQAgent, self)._build_train_op()
+    replay_slates = slate_indexing.indices_to_slates_tf(
+        self._replay.actions, self._num_candidates, self._slate_size,
+        ordered=self._ordered_slates)
+    replay_chosen_q = self._slate_q_values(self._replay_net_outputs.q_values,
+                                           replay_slates)
+    target = tf.stop_gradient(self._build_target_q_op())
+    loss = tf.losses.huber_loss(
+        target, replay_chosen_q, reduction=tf.losses.Reduction.NONE)
+    if self.summary_writer is not None:
+      with tf.variable_scope('Losses'):
+        tf.summary.scalar('HuberLoss', tf.reduce_mean(input_tensor=loss))
+    return self.optimizer.minimize(tf.reduce_mean(input_tensor=loss))
 
   def step(self, reward, observation):
     """Receives observations of environment and returns a slate.
@@ -110,8 +286,8 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
       slate: An integer array of size _slate_size, where each element is an
         index in the list of document observvations.
     """
-    return self._all_possible_slates[super(FullSlateQAgent, self).step(
-        reward, self._obs_adapter.encode(observation))]
+    return self._index_to_slate(super(FullSlateQAgent, self).step(
+        reward, self._obs_adapter.encode(observation)))
 
   def _build_replay_buffer(self, use_staging):
     """Creates the replay buffer used by the agent.
@@ -123,7 +299,7 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
     Returns:
       A WrapperReplayBuffer object.
     """
-    return dqn_agent.wrapped_replay_buffer(
+    return self._wrapped_replay_buffer(
         observation_shape=self.observation_shape,
         stack_size=self.stack_size,
         use_staging=use_staging,
@@ -141,8 +317,8 @@ class FullSlateQAgent(dqn_agent.DQNAgentRecSim,
       An integer array of size _slate_size, the selected slated, each
       element of which is an index in the list of doc_obs.
     """
-    return self._all_possible_slates[super(FullSlateQAgent, self).begin_episode(
-        self._obs_adapter.encode(observation))]
+    return self._index_to_slate(super(FullSlateQAgent, self).begin_episode(
+        self._obs_adapter.encode(observation)))
 
   def end_episode(self, reward, observation):
     """Signals the end of the episode to the agent.
@@ -0,0 +1,101 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.full_slate_q_agent."""
+
+import itertools
+
+import numpy as np
+from recsim.agents import full_slate_q_agent
+from recsim.environments import interest_evolution
+import tensorflow.compat.v1 as tf
+
+
+class FullSlateQAgentTest(tf.test.TestCase):
+
+  def test_best_ordered_slates(self):
+    rng = np.random.RandomState(0)
+    for slate_size, num_candidates in [(1, 4), (3, 6), (4, 4)]:
+      values = rng.normal(size=(20, slate_size, num_candidates))
+      slates = full_slate_q_agent.best_ordered_slates(values)
+      self.assertEqual(slates.shape, (20, slate_size))
+      for i in range(20):
+        best = max(
+            values[i, range(slate_size), list(slate)].sum()
+            for slate in itertools.permutations(range(num_candidates),
+                                                slate_size))
+        self.assertLen(set(slates[i]), slate_size)
+        self.assertAllClose(values[i, range(slate_size), slates[i]].sum(),
+                            best)
+
+  def _run_episode(self, **kwargs):
+    env = interest_evolution.create_environment({
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    })
+    with tf.Graph().as_default(), tf.Session() as sess:
+      agent = full_slate_q_agent.FullSlateQAgent(
+          sess,
+          observation_space=env.observation_space,
+          action_space=env.action_space,
+          min_replay_history=2,
+          update_period=1,
+          **kwargs)
+      sess.run(tf.global_variables_initializer())
+      observation = env.reset()
+      slate = agent.begin_episode(observation)
+      for _ in range(5):
+        self.assertLen(slate, 2)
+        if kwargs.get('ordered_slates', True):
+          self.assertLen(set(slate), 2)
+        else:
+          self.assertLess(slate[0], slate[1])
+        observation, reward, _, _ = env.step(slate)
+        slate = agent.step(reward, observation)
+      agent.end_episode(reward, observation)
+      return agent
+
+  def test_full_head(self):
+    agent = self._run_episode()
+    self.assertEqual(agent.num_actions, 20)
+    self.assertEqual(agent._net_outputs.q_values.shape.as_list(), [1, 20])
+
+  def test_factorized_head(self):
+    for ordered in [True, False]:
+      agent = self._run_episode(
+          ordered_slates=ordered, factorized_head=True, epsilon_train=0.)
+      self.assertEqual(agent.num_actions, 20 if ordered else 10)
+      self.assertEqual(agent._net_outputs.q_values.shape.as_list(),
+                       [1, 2 if ordered else 1, 5])
+
+  def test_too_many_slates(self):
+    env = interest_evolution.create_environment({
+        'num_candidates': 100,
+        'slate_size': 6,
+        'resample_documents': True,
+        'seed': 0,
+    })
+    with self.assertRaises(ValueError):
+      full_slate_q_agent.FullSlateQAgent(
+          tf.Session(),
+          observation_space=env.observation_space,
+          action_space=env.action_space,
+          factorized_head=True)
+
+
+if __name__ == '__main__':
+  tf.test.main()
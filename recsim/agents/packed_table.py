@@ -0,0 +1,259 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tables keyed by tuples of integers, checkpointed as sorted arrays.
+
+A PackedTable is a mapping from tuples of non-negative integers, such as the
+state-action indices of the tabular agent, to numbers. Updates go to an
+in-memory dict. Checkpoints write only the entries updated since the previous
+checkpoint to a new segment: a pair of .npy files holding the sorted keys,
+packed into the smallest unsigned integer type that fits, and the values.
+Restoring a table memory-maps its segments instead of reading them, and
+entries are looked up in the segments by binary search. Checkpoint and restore
+times therefore scale with the number of updated entries rather than with the
+size of the table.
+
+Keys are packed as big-endian integers, so that comparing them as raw bytes
+orders them as tuples and a row of a segment can be searched as a single
+np.void value. When a table has max_segments segments, the next checkpoint
+compacts them into one. The files of compacted segments are deleted at the
+following compaction, by which time no retained checkpoint refers to them.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections.abc
+import os
+
+import numpy as np
+
+# The number of missing keys remembered before the miss cache is cleared.
+_MAX_CACHED_MISSES = 1 << 16
+
+_KEY_DTYPES = [np.dtype('>u1'), np.dtype('>u2'), np.dtype('>u4'),
+               np.dtype('>u8')]
+
+
+def _pack_keys(keys):
+  """Returns keys packed as a [num_keys, key_length] big-endian array."""
+  keys = np.array(keys, dtype=np.int64)
+  if keys.size and keys.min() < 0:
+    raise ValueError('Keys must hold non-negative integers.')
+  max_value = keys.max() if keys.size else 0
+  dtype = next(dtype for dtype in _KEY_DTYPES
+               if max_value <= np.iinfo(dtype).max)
+  return np.ascontiguousarray(keys, dtype=dtype)
+
+
+def _as_void(packed_keys):
+  """Views each row of a packed key array as a single np.void value."""
+  row_dtype = np.dtype((np.void, packed_keys.dtype.itemsize *
+                        packed_keys.shape[1]))
+  return packed_keys.view(row_dtype).reshape(-1)
+
+
+class _Segment(object):
+  """The sorted keys and values of a memory-mapped segment."""
+
+  def __init__(self, keys, values):
+    self.keys = keys
+    self.values = values
+    self.void_keys = _as_void(keys)
+
+  def find(self, key):
+    """Returns the position of key in the segment, or None."""
+    if len(key) != self.keys.shape[1]:
+      return None
+    key = np.array(key, dtype=np.int64)
+    if key.min() < 0 or key.max() > np.iinfo(self.keys.dtype).max:
+      return None
+    void_key = _as_void(key.astype(self.keys.dtype)[np.newaxis])[0]
+    position = np.searchsorted(self.void_keys, void_key)
+    if position < len(self.void_keys) and self.void_keys[position] == void_key:
+      return position
+    return None
+
+  def items(self):
+    return zip(map(tuple, self.keys.tolist()), self.values.tolist())
+
+
+class PackedTable(collections.abc.MutableMapping):
+  """A mapping from tuples of integers to numbers with streaming checkpoints.
+
+  Entries cannot be deleted. Values read from the checkpoint segments are
+  cached in memory, and so are up to _MAX_CACHED_MISSES keys found in none of
+  them, so that repeated lookups of missing keys do not search the segments
+  again. The number of entries is tracked as they are added.
+  """
+
+  def __init__(self, dtype, entries=None, max_segments=8):
+    """Initializes a PackedTable.
+
+    Args:
+      dtype: The numpy dtype of the values in checkpoints.
+      entries: An optional mapping of initial entries.
+      max_segments: int, the number of segments beyond which checkpoints
+        compact the table into a single segment.
+    """
+    self._dtype = np.dtype(dtype)
+    self._max_segments = max_segments
+    self._entries = {}
+    self._dirty = set()
+    # Keys known to be in neither the entries nor the segments, only recorded
+    # when there are segments to search.
+    self._misses = set()
+    self._size = 0
+    # Memory-mapped segments, newest last, and the file prefixes of the
+    # segments making up the latest checkpoint.
+    self._segments = []
+    self._segment_files = []
+    # Files of compacted segments, deleted at the next compaction.
+    self._stale_files = []
+    if entries is not None:
+      self.update(entries)
+
+  def __getitem__(self, key):
+    value = self.get(key)
+    if value is None:
+      raise KeyError(key)
+    return value
+
+  def get(self, key, default=None):
+    value = self._entries.get(key)
+    if value is not None:
+      return value
+    if key in self._misses:
+      return default
+    for segment in reversed(self._segments):
+      position = segment.find(key)
+      if position is not None:
+        value = segment.values[position].item()
+        self._entries[key] = value
+        return value
+    if self._segments:
+      if len(self._misses) >= _MAX_CACHED_MISSES:
+        self._misses = set()
+      self._misses.add(key)
+    return default
+
+  def __setitem__(self, key, value):
+    if key not in self._entries and self.get(key) is None:
+      self._misses.discard(key)
+      self._size += 1
+    self._entries[key] = value
+    self._dirty.add(key)
+
+  def __delitem__(self, key):
+    raise NotImplementedError('Entries cannot be deleted from a PackedTable.')
+
+  def __iter__(self):
+    seen = set(self._entries)
+    for key in self._entries:
+      yield key
+    for segment in reversed(self._segments):
+      for key, _ in segment.items():
+        if key not in seen:
+          seen.add(key)
+          yield key
+
+  def __len__(self):
+    return self._size
+
+  def _write_segment(self, directory, file_prefix, entries):
+    """Writes entries as a sorted segment and returns its file prefix."""
+    keys = _pack_keys([key for key, _ in entries])
+    values = np.array([value for _, value in entries], dtype=self._dtype)
+    order = np.argsort(_as_void(keys), kind='stable')
+    for suffix, array in [('keys', keys[order]), ('values', values[order])]:
+      path = os.path.join(directory, '%s.%s.npy' % (file_prefix, suffix))
+      # Files are renamed once complete, so a segment is never partially
+      # written.
+      with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+      os.replace(path + '.tmp', path)
+    return file_prefix
+
+  def _load_segment(self, directory, file_prefix):
+    keys, values = [
+        np.load(
+            os.path.join(directory, '%s.%s.npy' % (file_prefix, suffix)),
+            mmap_mode='r') for suffix in ['keys', 'values']
+    ]
+    return _Segment(keys, values)
+
+  def _remove_files(self, directory, file_prefixes):
+    for file_prefix in file_prefixes:
+      for suffix in ['keys', 'values']:
+        path = os.path.join(directory, '%s.%s.npy' % (file_prefix, suffix))
+        if os.path.exists(path):
+          os.remove(path)
+
+  def save(self, directory, file_prefix):
+    """Writes the entries updated since the last checkpoint.
+
+    Args:
+      directory: str, the checkpoint directory.
+      file_prefix: str, the prefix of the new segment files, unique to the
+        table and checkpoint.
+
+    Returns:
+      A dict describing the checkpoint, to be passed to restore.
+    """
+    if len(self._segment_files) >= self._max_segments:
+      # Rewrites the whole table as a single segment and memory-maps it.
+      entries = [(key, self[key]) for key in self]
+      if entries:
+        self._remove_files(directory, self._stale_files)
+        self._stale_files = self._segment_files
+        self._segment_files = [
+            self._write_segment(directory, file_prefix, entries)
+        ]
+        self._segments = [self._load_segment(directory, file_prefix)]
+        self._entries = {}
+        self._misses = set()
+    elif self._dirty:
+      entries = [(key, self._entries[key]) for key in self._dirty]
+      self._segment_files = self._segment_files + [
+          self._write_segment(directory, file_prefix, entries)
+      ]
+    self._dirty = set()
+    return {
+        'segments': self._segment_files,
+        'stale': self._stale_files,
+        'size': self._size
+    }
+
+  def restore(self, directory, checkpoint):
+    """Memory-maps the segments of a checkpoint written by save.
+
+    Args:
+      directory: str, the checkpoint directory.
+      checkpoint: dict, the description of the checkpoint returned by save.
+    """
+    self._segment_files = list(checkpoint['segments'])
+    self._stale_files = list(checkpoint['stale'])
+    self._segments = [
+        self._load_segment(directory, file_prefix)
+        for file_prefix in self._segment_files
+    ]
+    self._entries = {}
+    self._dirty = set()
+    self._misses = set()
+    self._size = checkpoint.get('size')
+    if self._size is None:
+      # Checkpoints written before sizes were recorded.
+      self._size = sum(1 for _ in self)
@@ -0,0 +1,127 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.packed_table."""
+
+import os
+
+import numpy as np
+from recsim.agents import packed_table
+import tensorflow.compat.v1 as tf
+
+
+class PackedTableTest(tf.test.TestCase):
+
+  def test_mapping(self):
+    table = packed_table.PackedTable(np.float32, {(1, 2): 0.5})
+    table[(3, 4)] = 1.5
+    self.assertEqual(table[(1, 2)], 0.5)
+    self.assertEqual(table.get((5, 6), 0.), 0.)
+    self.assertIn((3, 4), table)
+    self.assertLen(table, 2)
+    self.assertEqual(table, {(1, 2): 0.5, (3, 4): 1.5})
+    with self.assertRaises(KeyError):
+      _ = table[(5, 6)]
+
+  def test_incremental_checkpoints(self):
+    directory = self.get_temp_dir()
+    table = packed_table.PackedTable(np.float32)
+    for i in range(100):
+      table[(i % 7, i, 300 * i)] = float(i)
+    checkpoint = table.save(directory, 'table.0')
+    table[(0, 0, 0)] = -1.
+    table[(1, 2, 3)] = 2.
+    checkpoint = table.save(directory, 'table.1')
+    self.assertEqual(checkpoint['segments'], ['table.0', 'table.1'])
+    # Only the updated entries are written.
+    self.assertLen(np.load(os.path.join(directory, 'table.1.keys.npy')), 2)
+    # Keys are packed into the smallest type that fits.
+    self.assertEqual(
+        np.load(os.path.join(directory, 'table.0.keys.npy')).dtype,
+        np.dtype('>u2'))
+
+    restored = packed_table.PackedTable(np.float32)
+    restored.restore(directory, checkpoint)
+    self.assertEqual(restored, table)
+    self.assertEqual(restored[(0, 0, 0)], -1.)
+    self.assertEqual(restored.get((1, 2, 4)), None)
+    self.assertEqual(restored.get((1, 2, 70000)), None)
+    self.assertEqual(restored.get((1, 2)), None)
+    # Updates after a restore are written to a new segment.
+    restored[(1, 2, 3)] = 3.
+    checkpoint = restored.save(directory, 'table.2')
+    self.assertLen(checkpoint['segments'], 3)
+
+  def test_compaction(self):
+    directory = self.get_temp_dir()
+    table = packed_table.PackedTable(np.float32, max_segments=2)
+    for i in range(6):
+      table[(i,)] = float(i)
+      table[(0,)] = float(i)
+      checkpoint = table.save(directory, 'table.%d' % i)
+    # Segments are compacted at checkpoints 2 and 4, and the segments compacted
+    # at checkpoint 2 are deleted at checkpoint 4.
+    self.assertEqual(checkpoint['segments'], ['table.4', 'table.5'])
+    self.assertEqual(checkpoint['stale'], ['table.2', 'table.3'])
+    self.assertFalse(
+        os.path.exists(os.path.join(directory, 'table.1.keys.npy')))
+    self.assertTrue(
+        os.path.exists(os.path.join(directory, 'table.2.keys.npy')))
+    restored = packed_table.PackedTable(np.float32)
+    restored.restore(directory, checkpoint)
+    expected = {(i,): float(i) for i in range(6)}
+    expected[(0,)] = 5.
+    self.assertEqual(restored, expected)
+
+  def test_cached_lookups(self):
+    directory = self.get_temp_dir()
+    table = packed_table.PackedTable(np.float32, {(1, 2): 0.5})
+    checkpoint = table.save(directory, 'table.0')
+    restored = packed_table.PackedTable(np.float32)
+    restored.restore(directory, checkpoint)
+    self.assertLen(restored, 1)
+    self.assertIsNone(restored.get((3, 4)))
+    # Misses are cached and only searched for once.
+    self.assertIn((3, 4), restored._misses)
+    restored[(3, 4)] = 1.5
+    restored[(1, 2)] = 1.
+    self.assertEqual(restored[(3, 4)], 1.5)
+    self.assertLen(restored, 2)
+    self.assertEqual(len(list(restored)), 2)
+    del checkpoint['size']
+    restored.restore(directory, checkpoint)
+    self.assertLen(restored, 1)
+
+  def test_bounded_miss_cache(self):
+    table = packed_table.PackedTable(np.float32, {(0, 0): 1.})
+    for i in range(1000):
+      self.assertIsNone(table.get((1, i)))
+    # Without segments, misses are answered by the dict and not cached.
+    self.assertEmpty(table._misses)
+    directory = self.get_temp_dir()
+    table.restore(directory, table.save(directory, 'table.0'))
+    for i in range(packed_table._MAX_CACHED_MISSES + 10):
+      self.assertIsNone(table.get((1, i)))
+    self.assertLessEqual(len(table._misses), packed_table._MAX_CACHED_MISSES)
+    self.assertEqual(table[(0, 0)], 1.)
+
+  def test_negative_keys(self):
+    table = packed_table.PackedTable(np.float32, {(-1,): 0.})
+    with self.assertRaises(ValueError):
+      table.save(self.get_temp_dir(), 'table.0')
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -116,6 +116,167 @@ def score_documents(user_obs,
   return all_scores[:-1], all_scores[-1]
 
 
+def batch_score_documents_tf(user_obs,
+                             doc_obs,
+                             no_click_mass=1.0,
+                             is_mnl=False,
+                             min_normalizer=-1.0):
+  """Computes unnormalized scores for a batch of user and document observations.
+
+  Similar to score_documents_tf but works on a batch of candidate sets.
+
+  Args:
+    user_obs: [batch_size, num_of_features] tensor, the user observations.
+    doc_obs: [batch_size, num_of_documents, num_of_features] tensor, the
+      observations of the documents in the candidate sets.
+    no_click_mass: a float indicating the mass given to a no click option
+    is_mnl: whether to use a multinomial logit model instead of a multinomial
+      proportional model.
+    min_normalizer: A float (<= 0) used to offset the scores to be positive when
+      using multinomial proportional model.
+
+  Returns:
+    A [batch_size, num_of_documents] tensor that stores unnormalized scores of
+      documents and a [batch_size] tensor that represents the scores for the
+      action of picking no document.
+  """
+  scores = tf.reduce_sum(
+      input_tensor=tf.expand_dims(user_obs, 1) * doc_obs, axis=2)
+  no_click_scores = tf.fill([tf.shape(input=scores)[0], 1], no_click_mass)
+  all_scores = tf.concat([scores, no_click_scores], axis=1)
+  if is_mnl:
+    all_scores = tf.nn.softmax(all_scores)
+  else:
+    all_scores = all_scores - min_normalizer
+  return all_scores[:, :-1], all_scores[:, -1]
+
+
+def _slate_value(slates, s_no_click, s, q):
+  """Returns the expected Q value sum(s*q)/(s_no_click+sum(s)) of each slate.
+
+  Args:
+    slates: [batch_size, slate_size] int tensor, the slates.
+    s_no_click: [batch_size] tensor, the scores for not clicking any document.
+    s: [batch_size, num_of_documents] tensor, the scores for clicking documents.
+    q: [batch_size, num_of_documents] tensor, the predicted q values.
+
+  Returns:
+    [batch_size] tensor, the expected Q value of each slate.
+  """
+  s_selected = tf.gather(s, slates, batch_dims=1)
+  q_selected = tf.gather(q, slates, batch_dims=1)
+  return tf.reduce_sum(
+      input_tensor=s_selected * q_selected, axis=1) / (
+          tf.reduce_sum(input_tensor=s_selected, axis=1) + s_no_click)
+
+
+def batch_select_slate_topk(slate_size, s_no_click, s, q):
+  """Selects the slates of a batch of candidate sets with the top-K algorithm.
+
+  Args:
+    slate_size: int, the size of the recommendation slate.
+    s_no_click: [batch_size] tensor, the scores for not clicking any document.
+    s: [batch_size, num_of_documents] tensor, the scores for clicking documents.
+    q: [batch_size, num_of_documents] tensor, the predicted q values for
+      documents.
+
+  Returns:
+    [batch_size, slate_size] int32 tensor, the selected slates.
+  """
+  del s_no_click  # Unused argument.
+  _, slates = tf.math.top_k(s * q, k=slate_size)
+  return slates
+
+
+def batch_select_slate_greedy(slate_size, s_no_click, s, q):
+  """Selects the slates of a batch of candidate sets with the greedy algorithm.
+
+  Documents are added one at a time, each time picking the document which
+  maximizes the expected Q value of the partial slate. Documents already in the
+  slate are masked out in-graph.
+
+  Args:
+    slate_size: int, the size of the recommendation slate.
+    s_no_click: [batch_size] tensor, the scores for not clicking any document.
+    s: [batch_size, num_of_documents] tensor, the scores for clicking documents.
+    q: [batch_size, num_of_documents] tensor, the predicted q values for
+      documents.
+
+  Returns:
+    [batch_size, slate_size] int32 tensor, the selected slates.
+  """
+  sq = s * q
+  numerator = tf.zeros_like(s_no_click)
+  denominator = s_no_click
+  available = tf.ones_like(s, dtype=tf.bool)
+  excluded = tf.fill(tf.shape(input=s), -np.inf)
+  slate = []
+  for _ in range(slate_size):
+    values = (tf.expand_dims(numerator, 1) + sq) / (
+        tf.expand_dims(denominator, 1) + s)
+    k = tf.argmax(
+        input=tf.where(available, values, excluded),
+        axis=1,
+        output_type=tf.int32)
+    selected = tf.one_hot(k, tf.shape(input=s)[1], on_value=True,
+                          off_value=False, dtype=tf.bool)
+    available = tf.logical_and(available, tf.logical_not(selected))
+    numerator += tf.gather(sq, k, batch_dims=1)
+    denominator += tf.gather(s, k, batch_dims=1)
+    slate.append(k)
+  return tf.stack(slate, axis=1)
+
+
+def batch_select_slate_optimal(slate_size, s_no_click, s, q):
+  """Selects the optimal slates of a batch of candidate sets.
+
+  The slate maximizing sum(s*q)/(s_no_click+sum(s)) is found exactly with
+  Dinkelbach's parametric method instead of enumerating all slates. For a
+  given value lambda, the slate maximizing sum(s*(q-lambda)) is the top
+  slate_size documents of s*(q-lambda). Starting from the top-K slate, lambda
+  is set to the value of the current slate until the value stops increasing,
+  at which point no slate improves on the current one. Each row of the batch
+  is iterated independently; this typically converges in a few iterations.
+
+  Scores must be positive, e.g., the outputs of score_documents_tf.
+
+  Args:
+    slate_size: int, the size of the recommendation slate.
+    s_no_click: [batch_size] tensor, the scores for not clicking any document.
+    s: [batch_size, num_of_documents] tensor, the scores for clicking documents.
+    q: [batch_size, num_of_documents] tensor, the predicted q values for
+      documents.
+
+  Returns:
+    [batch_size, slate_size] int32 tensor, the selected slates.
+  """
+  slates = batch_select_slate_topk(slate_size, s_no_click, s, q)
+  values = _slate_value(slates, s_no_click, s, q)
+
+  def improve(slates, values, unused_improved):
+    _, new_slates = tf.math.top_k(
+        s * (q - tf.expand_dims(values, 1)), k=slate_size)
+    new_values = _slate_value(new_slates, s_no_click, s, q)
+    improved = tf.greater(new_values, values)
+    slates = tf.where(improved, new_slates, slates)
+    values = tf.where(improved, new_values, values)
+    return slates, values, tf.reduce_any(input_tensor=improved)
+
+  slates, _, _ = tf.while_loop(
+      cond=lambda unused_slates, unused_values, improved: improved,
+      body=improve,
+      loop_vars=(slates, values, tf.constant(True)),
+      back_prop=False)
+  return slates
+
+
+def _select_single_slate(batch_select_slate_fn, slate_size, s_no_click, s, q):
+  """Applies a batched slate selector to a single candidate set."""
+  slates = batch_select_slate_fn(slate_size, tf.reshape(s_no_click, [1]),
+                                 tf.expand_dims(s, 0), tf.expand_dims(q, 0))
+  return slates[0]
+
+
 def select_slate_topk(slate_size, s_no_click, s, q):
   """Selects the slate using the top-K algorithm.
 
@@ -131,9 +292,8 @@ def select_slate_topk(slate_size, s_no_click, s, q):
   Returns:
     [slate_size] tensor, the selected slate.
   """
-  del s_no_click  # Unused argument.
-  _, output_slate = tf.math.top_k(s * q, k=slate_size)
-  return output_slate
+  return _select_single_slate(batch_select_slate_topk, slate_size, s_no_click,
+                              s, q)
 
 
 def select_slate_greedy(slate_size, s_no_click, s, q):
@@ -151,35 +311,16 @@ def select_slate_greedy(slate_size, s_no_click, s, q):
   Returns:
     [slate_size] tensor, the selected slate.
   """
-
-  def argmax(v, mask):
-    return tf.argmax(
-        input=(v - tf.reduce_min(input_tensor=v) + 1) * mask, axis=0)
-
-  numerator = tf.constant(0.)
-  denominator = tf.constant(0.) + s_no_click
-  mask = tf.ones(tf.shape(input=q)[0])
-
-  def set_element(v, i, x):
-    mask = tf.one_hot(i, tf.shape(input=v)[0])
-    v_new = tf.ones_like(v) * x
-    return tf.where(tf.equal(mask, 1), v_new, v)
-
-  for _ in range(slate_size):
-    k = argmax((numerator + s * q) / (denominator + s), mask)
-    mask = set_element(mask, k, 0)
-    numerator = numerator + tf.gather(s * q, k)
-    denominator = denominator + tf.gather(s, k)
-
-  output_slate = tf.where(tf.equal(mask, 0))
-  return output_slate
+  return _select_single_slate(batch_select_slate_greedy, slate_size,
+                              s_no_click, s, q)
 
 
 def select_slate_optimal(slate_size, s_no_click, s, q):
-  """Selects the slate using exhaustive search.
+  """Selects the optimal slate.
 
   This algorithm corresponds to the method "OS" in
-  Ie et al. https://arxiv.org/abs/1905.12767.
+  Ie et al. https://arxiv.org/abs/1905.12767. The slate is found without
+  enumerating all slates, see batch_select_slate_optimal.
 
   Args:
     slate_size: int, the size of the recommendation slate.
@@ -190,31 +331,24 @@ def select_slate_optimal(slate_size, s_no_click, s, q):
   Returns:
     [slate_size] tensor, the selected slate.
   """
+  return _select_single_slate(batch_select_slate_optimal, slate_size,
+                              s_no_click, s, q)
 
-  num_candidates = s.shape.as_list()[0]
 
-  # Obtain all possible slates given current docs in the candidate set.
-  mesh_args = [list(range(num_candidates))] * slate_size
-  slates = tf.stack(tf.meshgrid(*mesh_args), axis=-1)
-  slates = tf.reshape(slates, shape=(-1, slate_size))
-
-  # Filter slates that include duplicates to ensure each document is picked
-  # at most once.
-  unique_mask = tf.map_fn(
-      lambda x: tf.equal(tf.size(input=x), tf.size(input=tf.unique(x)[0])),
-      slates,
-      dtype=tf.bool)
-  slates = tf.boolean_mask(tensor=slates, mask=unique_mask)
+def _get_unnormalized_scores(states):
+  """Computes the unnormalized scores for the docs."""
+  stack_number = -1
+  user_obs = states[:, 0, :, stack_number]
+  doc_obs = states[:, 1:, :, stack_number]
+  return batch_score_documents_tf(user_obs, doc_obs)
 
-  slate_q_values = tf.gather(s * q, slates)
-  slate_scores = tf.gather(s, slates)
-  slate_normalizer = tf.reduce_sum(
-      input_tensor=slate_scores, axis=1) + s_no_click
 
-  slate_q_values = slate_q_values / tf.expand_dims(slate_normalizer, 1)
-  slate_sum_q_values = tf.reduce_sum(input_tensor=slate_q_values, axis=1)
-  max_q_slate_index = tf.argmax(input=slate_sum_q_values)
-  return tf.gather(slates, max_q_slate_index, axis=0)
+def _compute_target(reward, gamma, next_slates, next_q_values, scores,
+                    score_no_click, terminals):
+  """Computes the target Q value given the slates of the next step."""
+  next_q_target = _slate_value(next_slates, score_no_click, scores,
+                               next_q_values)
+  return reward + gamma * next_q_target * (1. - tf.cast(terminals, tf.float32))
 
 
 def compute_target_sarsa(reward, gamma, next_actions, next_q_values,
@@ -234,26 +368,9 @@ def compute_target_sarsa(reward, gamma, next_actions, next_q_values,
   Returns:
     [batch_size] tensor, the target q values.
   """
-  stack_number = -1
-  user_obs = next_states[:, 0, :, stack_number]
-  doc_obs = next_states[:, 1:, :, stack_number]
-
-  batch_size = next_q_values.get_shape().as_list()[0]
-  next_sarsa_q_list = []
-  for i in range(batch_size):
-    s, s_no_click = score_documents_tf(user_obs[i], doc_obs[i])
-    q = next_q_values[i]
-
-    slate = tf.expand_dims(next_actions[i], 1)
-    p_selected = compute_probs_tf(slate, s, s_no_click)
-    q_selected = tf.gather(q, slate)
-    next_sarsa_q_list.append(
-        tf.reduce_sum(input_tensor=p_selected * q_selected))
-
-  next_sarsa_q_values = tf.stack(next_sarsa_q_list)
-
-  return reward + gamma * next_sarsa_q_values * (1. -
-                                                 tf.cast(terminals, tf.float32))
+  scores, score_no_click = _get_unnormalized_scores(next_states)
+  return _compute_target(reward, gamma, tf.cast(next_actions, tf.int32),
+                         next_q_values, scores, score_no_click, terminals)
 
 
 # The top-K and greedy algorithms rely on the fact that the
@@ -279,45 +396,11 @@ def compute_target_greedy_q(reward, gamma, next_actions, next_q_values,
     [batch_size] tensor, the target q values.
   """
   slate_size = next_actions.get_shape().as_list()[1]
-  stack_number = -1
-  user_obs = next_states[:, 0, :, stack_number]
-  doc_obs = next_states[:, 1:, :, stack_number]
-
-  batch_size = next_q_values.get_shape().as_list()[0]
-  next_greedy_q_list = []
-  for i in range(batch_size):
-    s, s_no_click = score_documents_tf(user_obs[i], doc_obs[i])
-    q = next_q_values[i]
-
-    slate = select_slate_greedy(slate_size, s_no_click, s, q)
-    p_selected = compute_probs_tf(slate, s, s_no_click)
-    q_selected = tf.gather(q, slate)
-    next_greedy_q_list.append(
-        tf.reduce_sum(input_tensor=p_selected * q_selected))
-
-  next_greedy_q_values = tf.stack(next_greedy_q_list)
-
-  return reward + gamma * next_greedy_q_values * (
-      1. - tf.cast(terminals, tf.float32))
-
-
-def _get_unnormalized_scores(states):
-  """Computes the unnormalized scores for the docs."""
-  stack_number = -1
-  user_obs = states[:, 0, :, stack_number]
-  doc_obs = states[:, 1:, :, stack_number]
-
-  batch_size = states.get_shape().as_list()[0]
-  scores_list = []
-  score_no_click_list = []
-  for i in range(batch_size):
-    scores_tf, score_no_click_tf = score_documents_tf(user_obs[i], doc_obs[i])
-    scores_list.append(scores_tf)
-    score_no_click_list.append(score_no_click_tf)
-  scores = tf.stack(scores_list)
-  score_no_click = tf.stack(score_no_click_list)
-
-  return scores, score_no_click
+  scores, score_no_click = _get_unnormalized_scores(next_states)
+  greedy_slates = batch_select_slate_greedy(slate_size, score_no_click, scores,
+                                            next_q_values)
+  return _compute_target(reward, gamma, greedy_slates, next_q_values, scores,
+                         score_no_click, terminals)
 
 
 def compute_target_topk_q(reward, gamma, next_actions, next_q_values,
@@ -342,29 +425,12 @@ def compute_target_topk_q(reward, gamma, next_actions, next_q_values,
   """
   slate_size = next_actions.get_shape().as_list()[1]
   scores, score_no_click = _get_unnormalized_scores(next_states)
-
   # Choose the documents with top affinity_scores * Q values to fill a slate and
   # treat it as if it is the optimal slate.
-  unnormalized_next_q_target = next_q_values * scores
-  _, topk_optimal_slate = tf.math.top_k(
-      unnormalized_next_q_target, k=slate_size)
-
-  # Get the expected Q-value of the slate containing top-K items.
-  # [batch_size, slate_size]
-  next_q_values_selected = tf.batch_gather(
-      next_q_values, tf.cast(topk_optimal_slate, dtype=tf.int32))
-
-  # Get normalized affinity scores on the slate.
-  # [batch_size, slate_size]
-  scores_selected = tf.batch_gather(scores,
-                                    tf.cast(topk_optimal_slate, dtype=tf.int32))
-
-  next_q_target_topk = tf.reduce_sum(
-      input_tensor=next_q_values_selected * scores_selected, axis=1) / (
-          tf.reduce_sum(input_tensor=scores_selected, axis=1) + score_no_click)
-
-  return reward + gamma * next_q_target_topk * (
-      1. - tf.cast(terminals, tf.float32))
+  topk_slates = batch_select_slate_topk(slate_size, score_no_click, scores,
+                                        next_q_values)
+  return _compute_target(reward, gamma, topk_slates, next_q_values, scores,
+                         score_no_click, terminals)
 
 
 def compute_target_optimal_q(reward, gamma, next_actions, next_q_values,
@@ -387,43 +453,12 @@ def compute_target_optimal_q(reward, gamma, next_actions, next_q_values,
   Returns:
     [batch_size] tensor, the target q values.
   """
-  scores, score_no_click = _get_unnormalized_scores(next_states)
-
-  # Obtain all possible slates given current docs in the candidate set.
   slate_size = next_actions.get_shape().as_list()[1]
-  num_candidates = next_q_values.get_shape().as_list()[1]
-  mesh_args = [list(range(num_candidates))] * slate_size
-  slates = tf.stack(tf.meshgrid(*mesh_args), axis=-1)
-  slates = tf.reshape(slates, shape=(-1, slate_size))
-  # Filter slates that include duplicates to ensure each document is picked
-  # at most once.
-  unique_mask = tf.map_fn(
-      lambda x: tf.equal(tf.size(input=x), tf.size(input=tf.unique(x)[0])),
-      slates,
-      dtype=tf.bool)
-  # [num_of_slates, slate_size]
-  slates = tf.boolean_mask(tensor=slates, mask=unique_mask)
-
-  # [batch_size, num_of_slates, slate_size]
-  next_q_values_slate = tf.gather(next_q_values, slates, axis=1)
-  # [batch_size, num_of_slates, slate_size]
-  scores_slate = tf.gather(scores, slates, axis=1)
-  # [batch_size, num_of_slates]
-  batch_size = next_states.get_shape().as_list()[0]
-  score_no_click_slate = tf.reshape(
-      tf.tile(score_no_click,
-              tf.shape(input=slates)[:1]), [batch_size, -1])
-
-  # [batch_size, num_of_slates]
-  next_q_target_slate = tf.reduce_sum(
-      input_tensor=next_q_values_slate * scores_slate, axis=2) / (
-          tf.reduce_sum(input_tensor=scores_slate, axis=2) +
-          score_no_click_slate)
-
-  next_q_target_max = tf.reduce_max(input_tensor=next_q_target_slate, axis=1)
-
-  return reward + gamma * next_q_target_max * (1. -
-                                               tf.cast(terminals, tf.float32))
+  scores, score_no_click = _get_unnormalized_scores(next_states)
+  optimal_slates = batch_select_slate_optimal(slate_size, score_no_click,
+                                              scores, next_q_values)
+  return _compute_target(reward, gamma, optimal_slates, next_q_values, scores,
+                         score_no_click, terminals)
 
 
 @gin.configurable
@@ -440,6 +475,7 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
                compute_target_fn=None,
                stack_size=1,
                eval_mode=False,
+               print_selected_slates=False,
                **kwargs):
     """Initializes SlateDecompQAgent.
 
@@ -453,6 +489,9 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
       compute_target_fn: A function that omputes the target q value.
       stack_size: The stack size for the replay buffer.
       eval_mode: A bool for whether the agent is in training or evaluation mode.
+      print_selected_slates: A bool for whether to print the selected slate
+        together with the document scores and Q values on every action. This
+        is meant for debugging only.
       **kwargs: Keyword arguments to the DQNAgent.
     """
     self._response_adapter = dqn_agent.ResponseAdapter(
@@ -473,12 +512,7 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
     self._num_candidates = int(action_space.nvec[0])
     abstract_agent.AbstractEpisodicRecommenderAgent.__init__(self, action_space)
 
-    # The doc score is a [num_candidates] vector.
-    self._doc_affinity_scores_ph = tf.placeholder(
-        tf.float32, (self._num_candidates,), name='doc_affinity_scores_ph')
-    self._prob_no_click_ph = tf.placeholder(
-        tf.float32, (), name='prob_no_click_ph')
-
+    self._print_selected_slates = print_selected_slates
     self._select_slate_fn = select_slate_fn
     self._compute_target_fn = compute_target_fn
 
@@ -602,34 +636,40 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
     del reward  # Unused argument.
 
     responses = observation['response']
-    self._raw_observation = observation
     return super(SlateDecompQAgent,
                  self).step(self._response_adapter.encode(responses),
                             self._obs_adapter.encode(observation))
 
   def _build_select_slate_op(self):
-    p_no_click = self._prob_no_click_ph
-    p = self._doc_affinity_scores_ph
-    q = self._net_outputs.q_values[0]
-    with tf.name_scope('select_slate'):
-      self._output_slate = self._select_slate_fn(self._slate_size, p_no_click,
-                                                 p, q)
+    """Builds the op selecting a slate from the current state.
 
-    self._output_slate = tf.Print(
-        self._output_slate, [tf.constant('cp 1'), self._output_slate, p, q],
-        summarize=10000)
-    self._output_slate = tf.reshape(self._output_slate, (self._slate_size,))
+    The documents are scored from the user and document features in
+    self.state_ph, so that scoring, slate selection and the update of the
+    action counts run in a single session call.
+    """
+    with tf.name_scope('select_slate'):
+      scores, score_no_click = _get_unnormalized_scores(self.state_ph)
+      p_no_click = score_no_click[0]
+      p = scores[0]
+      q = self._net_outputs.q_values[0]
+      output_slate = self._select_slate_fn(self._slate_size, p_no_click, p, q)
+      if self._print_selected_slates:
+        output_slate = tf.Print(
+            output_slate, [tf.constant('cp 1'), output_slate, p, q],
+            summarize=10000)
+      output_slate = tf.reshape(output_slate, (self._slate_size,))
 
     self._action_counts = tf.get_variable(
         'action_counts',
         shape=[self._num_candidates],
         initializer=tf.zeros_initializer())
-    output_slate = tf.reshape(self._output_slate, [-1])
-    output_one_hot = tf.one_hot(output_slate, self._num_candidates)
-    update_ops = []
-    for i in range(self._slate_size):
-      update_ops.append(tf.assign_add(self._action_counts, output_one_hot[i]))
-    self._select_action_update_op = tf.group(*update_ops)
+    self._select_action_update_op = tf.assign_add(
+        self._action_counts,
+        tf.reduce_sum(
+            input_tensor=tf.one_hot(output_slate, self._num_candidates),
+            axis=0))
+    with tf.control_dependencies([self._select_action_update_op]):
+      self._output_slate = tf.identity(output_slate)
 
   def _select_action(self):
     """Selects an slate based on the trained model.
@@ -654,20 +694,7 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
       return np.random.choice(
           self._num_candidates, self._slate_size, replace=False)
     else:
-      observation = self._raw_observation
-      user_obs = observation['user']
-      doc_obs = np.array(list(observation['doc'].values()))
-      tf.logging.debug('cp 1: %s, %s', doc_obs, observation)
-      # TODO(cwhsu): Use score_documents_tf() and remove score_documents().
-      scores, score_no_click = score_documents(user_obs, doc_obs)
-      output_slate, _ = self._sess.run(
-          [self._output_slate, self._select_action_update_op], {
-              self.state_ph: self.state,
-              self._doc_affinity_scores_ph: scores,
-              self._prob_no_click_ph: score_no_click,
-          })
-
-      return output_slate
+      return self._sess.run(self._output_slate, {self.state_ph: self.state})
 
   # Other functions.
   def _build_replay_buffer(self, use_staging):
@@ -680,7 +707,7 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
     Returns:
       A WrapperReplayBuffer object.
     """
-    return dqn_agent.wrapped_replay_buffer(
+    return self._wrapped_replay_buffer(
         observation_shape=self.observation_shape,
         stack_size=self.stack_size,
         use_staging=use_staging,
@@ -708,7 +735,6 @@ class SlateDecompQAgent(dqn_agent.DQNAgentRecSim,
       An integer array of size _slate_size, the selected slated, each
       element of which is an index in the list of doc_obs.
     """
-    self._raw_observation = observation
     return super(SlateDecompQAgent,
                  self).begin_episode(self._obs_adapter.encode(observation))
 
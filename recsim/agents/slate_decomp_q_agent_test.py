@@ -0,0 +1,226 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.slate_decomp_q_agent."""
+
+import itertools
+
+import numpy as np
+from recsim.agents import slate_decomp_q_agent
+from recsim.environments import interest_evolution
+import tensorflow.compat.v1 as tf
+
+
+def _brute_force_optimal_value(slate_size, s_no_click, s, q):
+  return max(
+      np.sum(s[list(slate)] * q[list(slate)]) /
+      (s_no_click + np.sum(s[list(slate)]))
+      for slate in itertools.combinations(range(len(s)), slate_size))
+
+
+def _greedy_slate(slate_size, s_no_click, s, q):
+  slate = []
+  for _ in range(slate_size):
+    values = (np.sum(s[slate] * q[slate]) + s * q) / (
+        s_no_click + np.sum(s[slate]) + s)
+    values[slate] = -np.inf
+    slate.append(int(np.argmax(values)))
+  return slate
+
+
+def _slate_value(slate, s_no_click, s, q):
+  return np.sum(s[slate] * q[slate]) / (s_no_click + np.sum(s[slate]))
+
+
+class SlateDecompQAgentTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SlateDecompQAgentTest, self).setUp()
+    rng = np.random.RandomState(0)
+    self._batch_size = 50
+    self._num_candidates = 8
+    self._s = rng.uniform(
+        0.05, 2.0, (self._batch_size, self._num_candidates)).astype(np.float32)
+    self._q = rng.normal(
+        size=(self._batch_size, self._num_candidates)).astype(np.float32)
+    self._s_no_click = rng.uniform(
+        0.1, 2.0, self._batch_size).astype(np.float32)
+
+  def test_batch_select_slate_optimal(self):
+    for slate_size in [1, 3, 5]:
+      slates = slate_decomp_q_agent.batch_select_slate_optimal(
+          slate_size, tf.constant(self._s_no_click), tf.constant(self._s),
+          tf.constant(self._q))
+      with self.cached_session() as sess:
+        slates = sess.run(slates)
+      self.assertEqual(slates.shape, (self._batch_size, slate_size))
+      for i in range(self._batch_size):
+        self.assertLen(set(slates[i]), slate_size)
+        self.assertAllClose(
+            _slate_value(slates[i], self._s_no_click[i], self._s[i],
+                         self._q[i]),
+            _brute_force_optimal_value(slate_size, self._s_no_click[i],
+                                       self._s[i], self._q[i]),
+            atol=1e-5)
+
+  def test_batch_select_slate_greedy(self):
+    slates = slate_decomp_q_agent.batch_select_slate_greedy(
+        3, tf.constant(self._s_no_click), tf.constant(self._s),
+        tf.constant(self._q))
+    with self.cached_session() as sess:
+      slates = sess.run(slates)
+    for i in range(self._batch_size):
+      self.assertAllEqual(
+          slates[i],
+          _greedy_slate(3, self._s_no_click[i], self._s[i], self._q[i]))
+
+  def test_batch_select_slate_topk(self):
+    slates = slate_decomp_q_agent.batch_select_slate_topk(
+        3, tf.constant(self._s_no_click), tf.constant(self._s),
+        tf.constant(self._q))
+    with self.cached_session() as sess:
+      slates = sess.run(slates)
+    self.assertAllEqual(slates,
+                        np.argsort(-self._s * self._q, axis=1)[:, :3])
+
+  def test_single_slate_selectors(self):
+    s_no_click = tf.constant(self._s_no_click[0])
+    s = tf.constant(self._s[0])
+    q = tf.constant(self._q[0])
+    with self.cached_session() as sess:
+      greedy, topk = sess.run([
+          slate_decomp_q_agent.select_slate_greedy(3, s_no_click, s, q),
+          slate_decomp_q_agent.select_slate_topk(3, s_no_click, s, q),
+      ])
+    self.assertAllEqual(
+        greedy,
+        _greedy_slate(3, self._s_no_click[0], self._s[0], self._q[0]))
+    self.assertAllEqual(topk, np.argsort(-self._s[0] * self._q[0])[:3])
+
+  def test_select_slate_optimal(self):
+    slate = slate_decomp_q_agent.select_slate_optimal(
+        3, tf.constant(self._s_no_click[0]), tf.constant(self._s[0]),
+        tf.constant(self._q[0]))
+    with self.cached_session() as sess:
+      slate = sess.run(slate)
+    self.assertEqual(slate.shape, (3,))
+    self.assertAllClose(
+        _slate_value(slate, self._s_no_click[0], self._s[0], self._q[0]),
+        _brute_force_optimal_value(3, self._s_no_click[0], self._s[0],
+                                   self._q[0]),
+        atol=1e-5)
+
+  def _compute_target(self, compute_target_fn, next_actions):
+    num_features = 3
+    rng = np.random.RandomState(1)
+    self._next_states = rng.uniform(
+        size=(self._batch_size, 1 + self._num_candidates, num_features,
+              1)).astype(np.float32)
+    self._reward = rng.uniform(size=self._batch_size).astype(np.float32)
+    self._terminals = np.zeros(self._batch_size, dtype=np.float32)
+    self._terminals[::5] = 1.
+    target = compute_target_fn(
+        reward=tf.constant(self._reward),
+        gamma=0.9,
+        next_actions=tf.constant(next_actions),
+        next_q_values=tf.constant(self._q),
+        next_states=tf.constant(self._next_states),
+        terminals=tf.constant(self._terminals))
+    with self.cached_session() as sess:
+      return sess.run(target)
+
+  def _expected_target(self, i, select_slate_fn):
+    s, s_no_click = slate_decomp_q_agent.score_documents(
+        self._next_states[i, 0, :, -1], self._next_states[i, 1:, :, -1])
+    value = select_slate_fn(s_no_click, s, self._q[i])
+    return self._reward[i] + 0.9 * (1. - self._terminals[i]) * value
+
+  def test_compute_target_sarsa(self):
+    next_actions = np.tile([[4, 1]], (self._batch_size, 1))
+    target = self._compute_target(slate_decomp_q_agent.compute_target_sarsa,
+                                  next_actions)
+    for i in range(self._batch_size):
+      self.assertAllClose(
+          target[i],
+          self._expected_target(
+              i, lambda s_no_click, s, q: _slate_value([4, 1], s_no_click, s,
+                                                       q)),
+          atol=1e-5)
+
+  def test_compute_target_greedy_q(self):
+    target = self._compute_target(
+        slate_decomp_q_agent.compute_target_greedy_q,
+        np.zeros((self._batch_size, 2), dtype=np.int32))
+    for i in range(self._batch_size):
+      self.assertAllClose(
+          target[i],
+          self._expected_target(
+              i, lambda s_no_click, s, q: _slate_value(
+                  _greedy_slate(2, s_no_click, s, q), s_no_click, s, q)),
+          atol=1e-5)
+
+  def test_compute_target_topk_q(self):
+    target = self._compute_target(
+        slate_decomp_q_agent.compute_target_topk_q,
+        np.zeros((self._batch_size, 2), dtype=np.int32))
+    for i in range(self._batch_size):
+      self.assertAllClose(
+          target[i],
+          self._expected_target(
+              i, lambda s_no_click, s, q: _slate_value(
+                  np.argsort(-s * q)[:2], s_no_click, s, q)),
+          atol=1e-5)
+
+  def test_compute_target_optimal_q(self):
+    target = self._compute_target(
+        slate_decomp_q_agent.compute_target_optimal_q,
+        np.zeros((self._batch_size, 2), dtype=np.int32))
+    for i in range(self._batch_size):
+      self.assertAllClose(
+          target[i],
+          self._expected_target(
+              i, lambda s_no_click, s, q: _brute_force_optimal_value(
+                  2, s_no_click, s, q)),
+          atol=1e-5)
+
+  def test_select_action_scores_documents_in_graph(self):
+    env = interest_evolution.create_environment({
+        'num_candidates': 6,
+        'slate_size': 3,
+        'resample_documents': True,
+        'seed': 0,
+    })
+    with tf.Graph().as_default(), tf.Session() as sess:
+      agent = slate_decomp_q_agent.create_agent(
+          'slate_greedy_greedy_q',
+          sess,
+          observation_space=env.observation_space,
+          action_space=env.action_space,
+          eval_mode=True,
+          epsilon_eval=0.)
+      sess.run(tf.global_variables_initializer())
+      observation = env.reset()
+      slate = agent.begin_episode(observation)
+      q = sess.run(agent._net_outputs.q_values,
+                   {agent.state_ph: agent.state})[0]
+      counts = sess.run(agent._action_counts)
+    s, s_no_click = slate_decomp_q_agent.score_documents(
+        observation['user'], np.array(list(observation['doc'].values())))
+    self.assertAllEqual(slate, _greedy_slate(3, s_no_click, s, q))
+    self.assertAllEqual(counts, np.bincount(slate, minlength=6))
+
+
+if __name__ == '__main__':
+  tf.test.main()
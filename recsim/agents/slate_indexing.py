@@ -0,0 +1,210 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Conversions between slates and integer indices without an action table.
+
+Slates of slate_size distinct documents out of num_candidates are numbered in
+lexicographic order, the order in which itertools.permutations (ordered
+slates) or itertools.combinations (unordered slates) generates them. Indices
+are computed with the combinatorial number system: the index of a slate is a
+sum over its positions of counts of the slates preceding it, so converting
+either way takes slate_size steps and no table of slates.
+
+The TensorFlow versions convert batches of slates and indices in-graph.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+
+def num_slates(num_candidates, slate_size, ordered=True):
+  """Returns the number of slates of slate_size documents.
+
+  Args:
+    num_candidates: int, the number of candidate documents.
+    slate_size: int, the number of distinct documents in a slate.
+    ordered: bool, whether slates are ordered (permutations) or not
+      (combinations).
+  """
+  if ordered:
+    return math.perm(num_candidates, slate_size)
+  return math.comb(num_candidates, slate_size)
+
+
+def _position_counts(num_candidates, slate_size, ordered):
+  """Returns, for each position, the count used to rank its document.
+
+  For ordered slates, this is the number of completions of a slate prefix
+  ending at the position. For unordered slates, entry [i, n] is the number of
+  (slate_size - i)-combinations of n documents.
+  """
+  if ordered:
+    return [
+        math.perm(num_candidates - 1 - i, slate_size - 1 - i)
+        for i in range(slate_size)
+    ]
+  return [[math.comb(n, slate_size - i)
+           for n in range(num_candidates)]
+          for i in range(slate_size)]
+
+
+def slate_to_index(slate, num_candidates, ordered=True):
+  """Returns the index of a slate.
+
+  Args:
+    slate: A sequence of distinct document indices. Unordered slates need not
+      be sorted.
+    num_candidates: int, the number of candidate documents.
+    ordered: bool, whether slates are ordered.
+
+  Returns:
+    The int index of the slate in lexicographic order.
+  """
+  slate_size = len(slate)
+  if ordered:
+    index = 0
+    counts = _position_counts(num_candidates, slate_size, ordered)
+    for i, doc in enumerate(slate):
+      # The rank of doc among the documents not yet in the slate.
+      rank = int(doc) - sum(1 for previous in slate[:i] if previous < doc)
+      index += rank * counts[i]
+    return index
+  index = num_slates(num_candidates, slate_size, ordered=False) - 1
+  for i, doc in enumerate(sorted(slate)):
+    index -= math.comb(num_candidates - 1 - int(doc), slate_size - i)
+  return index
+
+
+def index_to_slate(index, num_candidates, slate_size, ordered=True):
+  """Returns the slate of an index.
+
+  Args:
+    index: int, the index of the slate in lexicographic order.
+    num_candidates: int, the number of candidate documents.
+    slate_size: int, the number of documents in the slate.
+    ordered: bool, whether slates are ordered.
+
+  Returns:
+    A tuple of slate_size document indices, sorted for unordered slates.
+  """
+  index = int(index)
+  slate = []
+  if ordered:
+    available = list(range(num_candidates))
+    for count in _position_counts(num_candidates, slate_size, ordered):
+      rank, index = divmod(index, count)
+      slate.append(available.pop(rank))
+    return tuple(slate)
+  # Unranks the complement index in the combinatorial number system.
+  remainder = num_slates(num_candidates, slate_size, ordered=False) - 1 - index
+  complement = num_candidates - 1
+  for i in range(slate_size):
+    while math.comb(complement, slate_size - i) > remainder:
+      complement -= 1
+    remainder -= math.comb(complement, slate_size - i)
+    slate.append(num_candidates - 1 - complement)
+    complement -= 1
+  return tuple(slate)
+
+
+def slates_to_indices_tf(slates, num_candidates, ordered=True):
+  """Returns the indices of a batch of slates.
+
+  Args:
+    slates: [batch_size, slate_size] int tensor, the slates.
+    num_candidates: int, the number of candidate documents.
+    ordered: bool, whether slates are ordered.
+
+  Returns:
+    [batch_size] int64 tensor, the indices of the slates.
+  """
+  slates = tf.cast(slates, tf.int64)
+  slate_size = slates.get_shape().as_list()[1]
+  counts = _position_counts(num_candidates, slate_size, ordered)
+  if ordered:
+    # Number of earlier positions holding a smaller document.
+    earlier = tf.constant(np.tril(np.ones((slate_size, slate_size)), -1),
+                          dtype=tf.bool)
+    smaller = tf.logical_and(
+        tf.less(tf.expand_dims(slates, 1), tf.expand_dims(slates, 2)),
+        earlier)
+    ranks = slates - tf.reduce_sum(
+        input_tensor=tf.cast(smaller, tf.int64), axis=2)
+    return tf.reduce_sum(
+        input_tensor=ranks * tf.constant(counts, dtype=tf.int64), axis=1)
+  complements = num_candidates - 1 - tf.sort(slates, axis=1)
+  combinations = tf.stack([
+      tf.gather(tf.constant(counts[i], dtype=tf.int64), complements[:, i])
+      for i in range(slate_size)
+  ], axis=1)
+  return (num_slates(num_candidates, slate_size, ordered=False) - 1 -
+          tf.reduce_sum(input_tensor=combinations, axis=1))
+
+
+def indices_to_slates_tf(indices, num_candidates, slate_size, ordered=True):
+  """Returns the slates of a batch of indices.
+
+  Args:
+    indices: [batch_size] int tensor, the indices of the slates.
+    num_candidates: int, the number of candidate documents.
+    slate_size: int, the number of documents in a slate.
+    ordered: bool, whether slates are ordered.
+
+  Returns:
+    [batch_size, slate_size] int32 tensor, the slates, sorted for unordered
+      slates.
+  """
+  indices = tf.cast(indices, tf.int64)
+  counts = _position_counts(num_candidates, slate_size, ordered)
+  slate = []
+  if ordered:
+    available = tf.ones_like(
+        tf.tile(tf.expand_dims(indices, 1), [1, num_candidates]),
+        dtype=tf.bool)
+    for count in counts:
+      ranks = indices // count
+      indices = indices % count
+      # The document whose rank among the available documents is ranks.
+      available_ranks = tf.cumsum(tf.cast(available, tf.int64), axis=1) - 1
+      doc = tf.argmax(
+          input=tf.logical_and(
+              available, tf.equal(available_ranks, tf.expand_dims(ranks, 1))),
+          axis=1,
+          output_type=tf.int32)
+      available = tf.logical_and(
+          available,
+          tf.logical_not(tf.one_hot(doc, num_candidates, on_value=True,
+                                    off_value=False, dtype=tf.bool)))
+      slate.append(doc)
+    return tf.stack(slate, axis=1)
+  remainders = num_slates(num_candidates, slate_size, ordered=False) - 1 - (
+      indices)
+  for i in range(slate_size):
+    position_counts = tf.constant(counts[i], dtype=tf.int64)
+    # The largest complement whose count does not exceed the remainder.
+    complement = tf.reduce_sum(
+        input_tensor=tf.cast(
+            tf.less_equal(position_counts, tf.expand_dims(remainders, 1)),
+            tf.int64),
+        axis=1) - 1
+    remainders -= tf.gather(position_counts, complement)
+    slate.append(tf.cast(num_candidates - 1 - complement, tf.int32))
+  return tf.stack(slate, axis=1)
@@ -0,0 +1,75 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.agents.slate_indexing."""
+
+import itertools
+
+import numpy as np
+from recsim.agents import slate_indexing
+import tensorflow.compat.v1 as tf
+
+
+class SlateIndexingTest(tf.test.TestCase):
+
+  def _all_slates(self, num_candidates, slate_size, ordered):
+    if ordered:
+      return list(
+          itertools.permutations(range(num_candidates), slate_size))
+    return list(itertools.combinations(range(num_candidates), slate_size))
+
+  def test_matches_itertools_order(self):
+    for ordered in [True, False]:
+      for num_candidates, slate_size in [(5, 1), (6, 3), (7, 7)]:
+        slates = self._all_slates(num_candidates, slate_size, ordered)
+        self.assertEqual(
+            slate_indexing.num_slates(num_candidates, slate_size, ordered),
+            len(slates))
+        for index, slate in enumerate(slates):
+          self.assertEqual(
+              slate_indexing.slate_to_index(slate, num_candidates, ordered),
+              index)
+          self.assertEqual(
+              slate_indexing.index_to_slate(index, num_candidates, slate_size,
+                                            ordered), slate)
+
+  def test_unordered_slates_need_not_be_sorted(self):
+    self.assertEqual(
+        slate_indexing.slate_to_index((4, 0, 2), 6, ordered=False),
+        slate_indexing.slate_to_index((0, 2, 4), 6, ordered=False))
+
+  def test_large_candidate_sets(self):
+    slate = (999, 3, 512, 0, 77)
+    for ordered in [True, False]:
+      index = slate_indexing.slate_to_index(slate, 1000, ordered)
+      self.assertLess(index, slate_indexing.num_slates(1000, 5, ordered))
+      restored = slate_indexing.index_to_slate(index, 1000, 5, ordered)
+      self.assertEqual(restored, slate if ordered else tuple(sorted(slate)))
+
+  def test_tf_conversions(self):
+    for ordered in [True, False]:
+      slates = np.array(self._all_slates(6, 3, ordered), dtype=np.int32)
+      indices = slate_indexing.slates_to_indices_tf(
+          tf.constant(slates), 6, ordered)
+      restored = slate_indexing.indices_to_slates_tf(
+          tf.range(len(slates)), 6, 3, ordered)
+      with self.cached_session() as sess:
+        indices, restored = sess.run([indices, restored])
+      self.assertAllEqual(indices, np.arange(len(slates)))
+      self.assertAllEqual(restored, slates)
+
+
+if __name__ == '__main__':
+  tf.test.main()
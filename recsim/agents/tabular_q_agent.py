@@ -18,14 +18,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import heapq
 import itertools
+import math
+import os
 
 from absl import logging
 from gym import spaces
 import numpy as np
 
 from recsim import agent
+from recsim import space_layout
 from recsim.agents import agent_utils
+from recsim.agents import packed_table
 
 
 class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
@@ -50,6 +55,17 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
   Q-function. Producing ground truth Q-functions is the main intended use of
   this agent, since discretization is prohibitively expensive in
   high-dimensional environments.
+
+  Documents and the user are discretized once per step, and the index of each
+  state-action pair is assembled by concatenating the cached index tuples of
+  its parts. If the number of slates exceeds max_enumerated_slates, the agent
+  only considers slates found by a beam search, which scores a partial slate by
+  summing, over its positions, the largest Q-value observed in the current
+  state with the same document features at that position.
+
+  The Q-table and the state-action counts are PackedTables: checkpoints only
+  write the entries updated since the previous checkpoint, and restoring a
+  checkpoint memory-maps the tables.
   """
 
   def __init__(self,
@@ -64,6 +80,9 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
                learning_rate=0.1,
                gamma=0.99,
                ordinal_slates=False,
+               max_enumerated_slates=None,
+               beam_width=10,
+               max_checkpoint_segments=8,
                **kwargs):
     """TabularQAgent init.
 
@@ -95,6 +114,13 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
       ordinal_slates: boolean indicating whether slate ordering matters, e.g.
         whether the slates (1, 2) and (2, 1) should be considered different
         actions. Using ordinal slates increases complexity factorially.
+      max_enumerated_slates: if not None, the largest number of slates for
+        which all slates are enumerated at each step. Beyond it, only the slates
+        found by beam search and a random slate are considered.
+      beam_width: the number of partial slates kept by the beam search.
+      max_checkpoint_segments: the number of incremental checkpoint segments
+        of a table beyond which the table is compacted into a single segment.
+        Must be at least the number of checkpoints kept by the experiment.
       **kwargs: additional arguments like eval_mode.
     """
     self._kwargs = kwargs
@@ -104,10 +130,13 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     self._eval_mode = eval_mode
     self._previous_slate = None
     self._ordinal_slates = ordinal_slates
+    self._max_enumerated_slates = max_enumerated_slates
+    self._beam_width = beam_width
     self._learning_rate = learning_rate
     # storage
-    self._q_value_table = {}
-    self._state_action_counts = {}
+    self._max_checkpoint_segments = max_checkpoint_segments
+    self._q_value_table = self._new_table(np.float32)
+    self._state_action_counts = self._new_table(np.uint32)
     self._previous_state_action_index = None
     # discretization and spaces
     self._discretization_bins = np.linspace(
@@ -123,23 +152,46 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     if not self._ignore_response:
       state_action_space['response'] = observation_space.spaces['response']
     self._state_action_space = spaces.Dict(state_action_space)
-    self._observation_featurizer = agent_utils.GymSpaceWalker(
-        self._state_action_space, self._discretize_gym_leaf)
+    # State-action indices are concatenations of the indices of the parts of
+    # the state-action space, in its (sorted) key order.
+    self._part_featurizers = [
+        (key, agent_utils.GymSpaceWalker(
+            single_doc_space if key == 'action' else space,
+            self._discretize_gym_leaf))
+        for key, space in self._state_action_space.spaces.items()
+    ]
+    # Position of the slate in state-action indices.
+    part_keys = list(self._state_action_space.spaces)
+    self._action_start = sum(
+        self._index_length(self._state_action_space.spaces[key])
+        for key in part_keys[:part_keys.index('action')])
+    self._doc_index_length = self._index_length(single_doc_space)
+    # Per-step cache of the document indices and of the state index parts.
+    self._doc_indices = None
+    self._state_prefix = None
+    self._state_suffix = None
+    # Beam search heuristic: the largest Q-value per state index, position
+    # and document index, concatenated into a single key.
+    self._position_values = self._new_table(np.float32)
     # exploration
     self._exploration_policy = exploration_policy
     self._exploration_temperature = exploration_temperature
     self._base_exploration_temperature = self._exploration_temperature
     self._exploration_functions = {
         'epsilon_greedy':
-            lambda observation: agent_utils.epsilon_greedy_exploration(  # pylint: disable=g-long-lambda
-                self._enumerate_state_action_indices(observation), self.
-                _q_value_table, self._exploration_temperature),
+            lambda state_actions, q_values: (  # pylint: disable=g-long-lambda
+                agent_utils.epsilon_greedy_exploration(
+                    state_actions, q_values, self._exploration_temperature)),
         'min_count':
-            lambda observation: agent_utils.min_count_exploration(  # pylint: disable=g-long-lambda
-                self._enumerate_state_action_indices(observation),
-                self._state_action_counts)
+            lambda state_actions, q_values: (  # pylint: disable=g-long-lambda
+                agent_utils.min_count_exploration(
+                    state_actions, self._state_action_counts))
     }
 
+  def _new_table(self, dtype, entries=None):
+    return packed_table.PackedTable(
+        dtype, entries, max_segments=self._max_checkpoint_segments)
+
   def _discretize_gym_leaf(self, gym_space, gym_observations):
 
     index = []
@@ -157,6 +209,13 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
                                   ' not implemented yet.')
     return index
 
+  @staticmethod
+  def _index_length(gym_space):
+    """Returns the length of the discretized index of gym_space."""
+    return sum(
+        int(np.prod(leaf.shape)) if isinstance(leaf, spaces.Box) else 1
+        for _, leaf in space_layout.leaf_spaces(gym_space))
+
   def _enumerate_slates(self, doc_dict):
     documents = list(doc_dict.values())
     num_documents = len(documents)
@@ -167,19 +226,102 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     for slate in generator_fn(range(num_documents), self._slate_size):
       yield slate, tuple([documents[i] for i in slate])
 
+  def _num_slates(self, num_documents):
+    if num_documents < self._slate_size:
+      return 0
+    num_slates = math.factorial(num_documents) // math.factorial(
+        num_documents - self._slate_size)
+    if not self._ordinal_slates:
+      num_slates //= math.factorial(self._slate_size)
+    return num_slates
+
+  def _featurize(self, observation):
+    """Caches the indices of the documents and the state of an observation."""
+    self._doc_indices = []
+    self._state_prefix = ()
+    self._state_suffix = ()
+    for key, featurizer in self._part_featurizers:
+      if key == 'action':
+        self._doc_indices = [
+            tuple(featurizer.apply_and_flatten([doc]))
+            for doc in observation['doc'].values()
+        ]
+      elif self._doc_indices:
+        self._state_suffix += tuple(
+            featurizer.apply_and_flatten([observation[key]]))
+      else:
+        self._state_prefix += tuple(
+            featurizer.apply_and_flatten([observation[key]]))
+
+  def _state_action_index(self, slate):
+    return self._state_prefix + sum(
+        (self._doc_indices[i] for i in slate), ()) + self._state_suffix
+
+  def _split_state_action_index(self, state_action_index):
+    """Returns the state index and the document indices of a slate."""
+    start = self._action_start
+    end = start + self._doc_index_length * self._slate_size
+    state_index = state_action_index[:start] + state_action_index[end:]
+    length = self._doc_index_length
+    doc_indices = [
+        state_action_index[i:i + length] for i in range(start, end, length)
+    ]
+    return state_index, doc_indices
+
+  def _update_position_values(self, state_action_index, q_value):
+    state_index, doc_indices = self._split_state_action_index(
+        state_action_index)
+    for position, doc_index in enumerate(doc_indices):
+      key = state_index + (position,) + doc_index
+      self._position_values[key] = max(
+          self._position_values.get(key, q_value), q_value)
+
+  def _beam_search(self):
+    """Returns the slates found by beam search over the cached documents."""
+    num_documents = len(self._doc_indices)
+    state_index = self._state_prefix + self._state_suffix
+    beam = [((), 0.)]
+    for position in range(self._slate_size):
+      # Non-ordinal slates list documents in increasing order, so the document
+      # at this position must leave room for the remaining positions.
+      last = num_documents - self._slate_size + position
+      expanded = []
+      for slate, score in beam:
+        if self._ordinal_slates:
+          candidates = (i for i in range(num_documents) if i not in slate)
+        else:
+          candidates = range(slate[-1] + 1 if slate else 0, last + 1)
+        for i in candidates:
+          value = self._position_values.get(
+              state_index + (position,) + self._doc_indices[i], 0.)
+          expanded.append((slate + (i,), score + value))
+      beam = heapq.nlargest(self._beam_width, expanded, key=lambda b: b[1])
+    slates = [slate for slate, _ in beam]
+    random_slate = tuple(
+        np.random.choice(num_documents, self._slate_size, replace=False))
+    if not self._ordinal_slates:
+      random_slate = tuple(sorted(random_slate))
+    if random_slate not in slates:
+      slates.append(random_slate)
+    return slates
+
   def _enumerate_state_action_indices(self, observation):
-    for (slate, slate_features) in self._enumerate_slates(observation['doc']):
-      state_action_pair = {
-          'user': observation['user'],
-          'action': slate_features
-      }
-      if not self._ignore_response:
-        state_action_pair['response'] = observation['response']
-      state_action_index = self._observation_featurizer.apply_and_flatten([
-          state_action_pair,
-      ])
-      state_action_index = tuple(state_action_index)
-      yield slate, state_action_index
+    """Yields the slates to consider with their state-action indices.
+
+    Args:
+      observation: the current observation. Its document and state indices
+        must have been cached by _featurize.
+    """
+    num_documents = len(observation['doc'])
+    if (self._max_enumerated_slates is not None and
+        self._num_slates(num_documents) > self._max_enumerated_slates):
+      slates = self._beam_search()
+    elif self._ordinal_slates:
+      slates = itertools.permutations(range(num_documents), self._slate_size)
+    else:
+      slates = itertools.combinations(range(num_documents), self._slate_size)
+    for slate in slates:
+      yield slate, self._state_action_index(slate)
 
   def step(self, reward, observation):
     """Records the most recent transition and returns the agent's next action.
@@ -204,25 +346,35 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     Raises:
       ValueError: if reward is not in [0, 1].
     """
+    self._featurize(observation)
+    # Slates are enumerated once per step, so that the exploration functions
+    # consider the same slates (including the random one of a beam search).
+    state_actions = list(self._enumerate_state_action_indices(observation))
+    q_values = {
+        state_action_index: self._q_value_table.get(state_action_index, 0)
+        for _, state_action_index in state_actions
+    }
     # Find max-Q action given the current state and Q-table.
-    max_q_state_action = max(
-        self._enumerate_state_action_indices(observation),
-        key=lambda sa: self._q_value_table.get(sa[1], 0))
-    max_q_next = self._q_value_table.get(max_q_state_action[1], 0)
+    max_q_state_action = max(state_actions, key=lambda sa: q_values[sa[1]])
+    max_q_next = q_values[max_q_state_action[1]]
     # Update the Q-table.
     if self._previous_state_action_index is not None:
       old_q = self._q_value_table.get(self._previous_state_action_index, 0.)
-      self._q_value_table[self._previous_state_action_index] = (
+      new_q = (
           self._learning_rate * (reward + self._gamma * max_q_next) +
           (1. - self._learning_rate) * old_q)
+      self._q_value_table[self._previous_state_action_index] = new_q
+      if self._previous_state_action_index in q_values:
+        q_values[self._previous_state_action_index] = new_q
+      if self._max_enumerated_slates is not None:
+        self._update_position_values(self._previous_state_action_index, new_q)
       self._state_action_counts[
           self._previous_state_action_index] = self._state_action_counts.get(
               self._previous_state_action_index, 0) + 1
     # Pick next action.
     if not self._eval_mode:
       slate, state_action_index = self._exploration_functions[
-          self._exploration_policy](
-              observation)
+          self._exploration_policy](state_actions, q_values)
       self._previous_state_action_index = state_action_index
     else:
       slate, state_action_index = max_q_state_action
@@ -232,13 +384,13 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     self._exploration_temperature *= self._base_exploration_temperature
     self._exploration_functions = {
         'epsilon_greedy':
-            lambda observation: agent_utils.epsilon_greedy_exploration(  # pylint: disable=g-long-lambda
-                self._enumerate_state_action_indices(observation), self.
-                _q_value_table, self._exploration_temperature),
+            lambda state_actions, q_values: (  # pylint: disable=g-long-lambda
+                agent_utils.epsilon_greedy_exploration(
+                    state_actions, q_values, self._exploration_temperature)),
         'min_count':
-            lambda observation: agent_utils.min_count_exploration(  # pylint: disable=g-long-lambda
-                self._enumerate_state_action_indices(observation),
-                self._state_action_counts)
+            lambda state_actions, q_values: (  # pylint: disable=g-long-lambda
+                agent_utils.min_count_exploration(
+                    state_actions, self._state_action_counts))
     }
     self._previous_state_action_index = None
 
@@ -253,14 +405,26 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     Returns:
       A dictionary containing additional Python objects to be checkpointed by
         the experiment. Each key is a string for the object name and the value
-        is actual object. If the checkpoint directory does not exist, returns
-        empty dictionary.
+        is actual object. The tables are written to checkpoint_dir, and the
+        dictionary only lists their files. If the checkpoint directory does not
+        exist, the dictionary holds the tables themselves.
     """
-    del checkpoint_dir  # Unused.
-    del iteration_number  # Unused.
-    bundle_dict = {'q_value_table': self._q_value_table}
-    bundle_dict['sa_count'] = self._state_action_counts
-    return bundle_dict
+    if not checkpoint_dir or not os.path.isdir(checkpoint_dir):
+      return {
+          'q_value_table': dict(self._q_value_table.items()),
+          'sa_count': dict(self._state_action_counts.items())
+      }
+    return {
+        'q_value_segments':
+            self._q_value_table.save(checkpoint_dir,
+                                     'q_value_table.%d' % iteration_number),
+        'sa_count_segments':
+            self._state_action_counts.save(checkpoint_dir,
+                                           'sa_count.%d' % iteration_number),
+        'position_value_segments':
+            self._position_values.save(
+                checkpoint_dir, 'position_values.%d' % iteration_number)
+    }
 
   def unbundle(self, checkpoint_dir, iteration_number, bundle_dict):
     """Restores the agent from a checkpoint.
@@ -276,12 +440,29 @@ class TabularQAgent(agent.AbstractEpisodicRecommenderAgent):
     Returns:
       bool, True if unbundling was successful.
     """
-    del checkpoint_dir  # Unused.
     del iteration_number  # Unused.
-    if 'q_value_table' not in bundle_dict:
+    self._position_values = self._new_table(np.float32)
+    if 'q_value_segments' in bundle_dict:
+      self._q_value_table.restore(checkpoint_dir,
+                                  bundle_dict['q_value_segments'])
+      self._state_action_counts.restore(checkpoint_dir,
+                                        bundle_dict['sa_count_segments'])
+      if 'position_value_segments' in bundle_dict:
+        # Restoring the heuristic, rather than rebuilding it from the Q-values,
+        # keeps the restored tables memory-mapped.
+        self._position_values.restore(checkpoint_dir,
+                                      bundle_dict['position_value_segments'])
+        return True
+    elif 'q_value_table' in bundle_dict:
+      self._q_value_table = self._new_table(np.float32,
+                                            bundle_dict['q_value_table'])
+      self._state_action_counts = self._new_table(
+          np.uint32, bundle_dict.get('sa_count', {}))
+    else:
       logging.warning(
           'Could not unbundle from checkpoint files with exception.')
       return False
-    self._q_value_table = bundle_dict['q_value_table']
-    self._state_action_counts = bundle_dict.get('sa_count', {})
+    if self._max_enumerated_slates is not None:
+      for state_action_index, q_value in self._q_value_table.items():
+        self._update_position_values(state_action_index, q_value)
     return True
@@ -17,6 +17,7 @@
 
 from gym import spaces
 import numpy as np
+from recsim.agents import agent_utils
 from recsim.agents import tabular_q_agent
 from recsim.testing import test_environment as te
 import tensorflow.compat.v1 as tf
@@ -31,7 +32,8 @@ class TabularQAgentTest(tf.test.TestCase):
                          gamma=0.0,
                          policy='epsilon_greedy',
                          ordinal_slates=False,
-                         starting_probs=(1.0, 0.0, 0.0, 0.0, 0.0, 0.0)):
+                         starting_probs=(1.0, 0.0, 0.0, 0.0, 0.0, 0.0),
+                         **kwargs):
     env_config = {
         'num_candidates': num_candidates,
         'slate_size': slate_size,
@@ -46,7 +48,8 @@ class TabularQAgentTest(tf.test.TestCase):
         gamma=gamma,
         exploration_policy=policy,
         learning_rate=learning_rate,
-        ordinal_slates=ordinal_slates)
+        ordinal_slates=ordinal_slates,
+        **kwargs)
     return te_sim, agent
 
   def test_step(self):
@@ -166,6 +169,62 @@ class TabularQAgentTest(tf.test.TestCase):
     ]
     self.assertCountEqual(ordinal_slates, enumerated_slates)
 
+  def test_state_action_indices(self):
+    for ordinal_slates in (False, True):
+      te_sim, agent = self.init_agent_and_env(
+          slate_size=2, num_candidates=4, ordinal_slates=ordinal_slates)
+      observation = te_sim.reset()
+      featurizer = agent_utils.GymSpaceWalker(agent._state_action_space,
+                                              agent._discretize_gym_leaf)
+      agent._featurize(observation)
+      for slate, state_action_index in agent._enumerate_state_action_indices(
+          observation):
+        documents = list(observation['doc'].values())
+        expected_index = featurizer.apply_and_flatten([{
+            'user': observation['user'],
+            'action': tuple(documents[i] for i in slate)
+        }])
+        self.assertEqual(state_action_index, tuple(expected_index))
+
+  def test_beam_search(self):
+    te_sim, agent = self.init_agent_and_env(
+        slate_size=2, num_candidates=10, max_enumerated_slates=10,
+        beam_width=3)
+    observation = te_sim.reset()
+    agent._featurize(observation)
+    # Make slate (3, 7) the best known slate in the current state.
+    best_index = agent._state_action_index((3, 7))
+    agent.unbundle('', 0, {'q_value_table': {best_index: 1.0}})
+    slates = [
+        slate for slate, _ in agent._enumerate_state_action_indices(observation)
+    ]
+    self.assertLessEqual(len(slates), 4)
+    self.assertIn((3, 7), slates)
+    for slate in slates:
+      self.assertLen(slate, 2)
+      self.assertLess(slate[0], slate[1])
+    agent._eval_mode = True
+    self.assertEqual(agent.step(0, observation), (3, 7))
+
+  def test_beam_search_once_per_step(self):
+    te_sim, agent = self.init_agent_and_env(
+        slate_size=2, num_candidates=10, max_enumerated_slates=10,
+        beam_width=3, exploration_temperature=1.0)
+    beam_searches = []
+
+    def beam_search():
+      beam_searches.append(tabular_q_agent.TabularQAgent._beam_search(agent))
+      return beam_searches[-1]
+
+    agent._beam_search = beam_search
+    observation = te_sim.reset()
+    for _ in range(5):
+      slate = agent.step(0, observation)
+      # The explored slate is one of the slates enumerated for the max-Q.
+      self.assertIn(slate, beam_searches[-1])
+      observation, _, _, _ = te_sim.step(slate)
+    self.assertLen(beam_searches, 5)
+
   def test_bundle_and_unbundle(self):
     te_sim, agent = self.init_agent_and_env(
         slate_size=1, num_candidates=4, policy='min_count')
@@ -184,6 +243,48 @@ class TabularQAgentTest(tf.test.TestCase):
     self.assertEqual(bundle_dict['q_value_table'], new_agent._q_value_table)
     self.assertEqual(bundle_dict['sa_count'], new_agent._state_action_counts)
 
+  def test_checkpoint_to_directory(self):
+    te_sim, agent = self.init_agent_and_env(
+        slate_size=1, num_candidates=4, policy='min_count')
+    checkpoint_dir = self.get_temp_dir()
+    observation = te_sim.reset()
+    reward = 0
+    for iteration in range(2):
+      for _ in range(3):
+        slate = agent.step(reward, observation)
+        observation, reward, _, _ = te_sim.step(slate)
+      bundle_dict = agent.bundle_and_checkpoint(checkpoint_dir, iteration)
+    self.assertNotIn('q_value_table', bundle_dict)
+    self.assertLen(bundle_dict['q_value_segments']['segments'], 2)
+    _, new_agent = self.init_agent_and_env(slate_size=1, num_candidates=4)
+    self.assertTrue(new_agent.unbundle(checkpoint_dir, 1, bundle_dict))
+    self.assertEqual(new_agent._state_action_counts,
+                     agent._state_action_counts)
+    for key, q_value in agent._q_value_table.items():
+      self.assertAllClose(new_agent._q_value_table[key], q_value)
+
+  def test_checkpoint_position_values(self):
+    te_sim, agent = self.init_agent_and_env(
+        slate_size=2, num_candidates=10, max_enumerated_slates=10,
+        beam_width=3)
+    checkpoint_dir = self.get_temp_dir()
+    observation = te_sim.reset()
+    reward = 0
+    for _ in range(5):
+      slate = agent.step(reward, observation)
+      observation, reward, _, _ = te_sim.step(slate)
+    bundle_dict = agent.bundle_and_checkpoint(checkpoint_dir, 0)
+    _, new_agent = self.init_agent_and_env(
+        slate_size=2, num_candidates=10, max_enumerated_slates=10,
+        beam_width=3)
+    self.assertTrue(new_agent.unbundle(checkpoint_dir, 0, bundle_dict))
+    # The Q-values are not read to rebuild the beam search heuristic.
+    self.assertEmpty(new_agent._q_value_table._entries)
+    self.assertNotEmpty(agent._position_values)
+    self.assertCountEqual(agent._position_values, new_agent._position_values)
+    for key, value in agent._position_values.items():
+      self.assertAllClose(new_agent._position_values[key], value)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,281 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Timing of benchmark scenarios and comparison against a baseline.
+
+A Scenario names a piece of work, e.g. one step of an environment with given
+numbers of candidates and slate size, and knows how to set it up. Setting a
+scenario up returns a function doing the work once, which is called in a
+timed loop: calls are first calibrated so that a repeat takes at least
+min_time_secs, and the median over repeats is reported, as with timeit.
+
+Results are plain dictionaries, saved as JSON together with the versions of
+Python and NumPy, so that the results of a run can be kept as a baseline. A
+later run is compared against it scenario by scenario: a scenario regresses
+if its median time per call exceeds the baseline's by more than a threshold.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import fnmatch
+import gc
+import json
+import platform
+import re
+import time
+
+import numpy as np
+
+RESULTS_VERSION = 1
+
+
+class Scenario(
+    collections.namedtuple('Scenario', ['family', 'params', 'setup_fn'])):
+  """A parameterized benchmark.
+
+  Attributes:
+    family: str, the name of the benchmark, e.g.
+      'single_user_step/interest_evolution'.
+    params: An ordered dictionary of parameters, e.g. the number of
+      candidates and the slate size.
+    setup_fn: A function taking the params as keyword arguments and returning
+      a pair (run_once, items_per_call), where run_once is a function taking
+      no arguments which does the work being timed, and items_per_call is the
+      number of items (e.g. user steps) processed by one call.
+  """
+
+  @property
+  def name(self):
+    """The unique name of the scenario, e.g. 'family/num_candidates=10'."""
+    if not self.params:
+      return self.family
+    return '%s/%s' % (self.family, ','.join(
+        '%s=%s' % (key, value) for key, value in self.params.items()))
+
+
+def parameter_grid(**values):
+  """Returns all combinations of parameter values.
+
+  Args:
+    **values: A list of values for every parameter.
+
+  Returns:
+    A list of OrderedDicts mapping parameter names to values, in the order
+      of the sorted parameter names.
+  """
+  grid = [collections.OrderedDict()]
+  for key in sorted(values):
+    grid = [
+        collections.OrderedDict(list(params.items()) + [(key, value)])
+        for params in grid
+        for value in values[key]
+    ]
+  return grid
+
+
+def select_scenarios(scenarios, pattern=None):
+  """Returns the scenarios whose name matches a regular expression."""
+  if not pattern:
+    return list(scenarios)
+  regex = re.compile(pattern)
+  return [scenario for scenario in scenarios if regex.search(scenario.name)]
+
+
+def _time_calls(run_once, num_calls):
+  """Returns the seconds taken by num_calls calls of run_once."""
+  start = time.perf_counter()
+  for _ in range(num_calls):
+    run_once()
+  return time.perf_counter() - start
+
+
+def time_scenario(scenario, min_time_secs=0.2, repeats=5):
+  """Times a scenario.
+
+  Args:
+    scenario: The Scenario to time.
+    min_time_secs: float, the minimum duration of a repeat.
+    repeats: int, the number of timed repeats.
+
+  Returns:
+    A dictionary with the name, family and params of the scenario and its
+      timings: the median, minimum and standard deviation over repeats of the
+      time per call in microseconds, and the number of calls and items per
+      second at the median.
+  """
+  run_once, items_per_call = scenario.setup_fn(**scenario.params)
+  # Warms up, then finds the number of calls taking at least min_time_secs.
+  num_calls = 1
+  while True:
+    duration = _time_calls(run_once, num_calls)
+    if duration >= min_time_secs:
+      break
+    num_calls *= 2 if duration <= 0 else min(
+        10, max(2, int(np.ceil(min_time_secs / duration))))
+  gc_was_enabled = gc.isenabled()
+  gc.disable()
+  try:
+    per_call_secs = np.array([
+        _time_calls(run_once, num_calls) / num_calls for _ in range(repeats)
+    ])
+  finally:
+    if gc_was_enabled:
+      gc.enable()
+  median = float(np.median(per_call_secs))
+  return {
+      'name': scenario.name,
+      'family': scenario.family,
+      'params': dict(scenario.params),
+      'us_per_call': median * 1e6,
+      'min_us_per_call': float(np.min(per_call_secs)) * 1e6,
+      'stdev_us_per_call': float(np.std(per_call_secs)) * 1e6,
+      'calls_per_sec': 1. / median,
+      'items_per_sec': items_per_call / median,
+      'calls_per_repeat': num_calls,
+      'repeats': repeats,
+  }
+
+
+def run_scenarios(scenarios, min_time_secs=0.2, repeats=5, log_fn=None):
+  """Times scenarios one after the other.
+
+  Args:
+    scenarios: An iterable of Scenarios.
+    min_time_secs: float, the minimum duration of a repeat.
+    repeats: int, the number of timed repeats.
+    log_fn: An optional function called with the result of every scenario.
+
+  Returns:
+    A results dictionary, holding the list of scenario results under
+      'results' and a description of the platform under 'environment'.
+  """
+  results = []
+  for scenario in scenarios:
+    result = time_scenario(scenario, min_time_secs, repeats)
+    if log_fn is not None:
+      log_fn(result)
+    results.append(result)
+  return {
+      'version': RESULTS_VERSION,
+      'environment': {
+          'python': platform.python_version(),
+          'numpy': np.__version__,
+          'platform': platform.platform(),
+          'processor': platform.processor(),
+      },
+      'results': results,
+  }
+
+
+def save_results(results, path):
+  """Writes results as JSON."""
+  with open(path, 'w') as f:
+    json.dump(results, f, indent=1, sort_keys=True)
+
+
+def load_results(path):
+  """Reads results written by save_results.
+
+  Raises:
+    ValueError: if the file holds results of an unsupported version.
+  """
+  with open(path) as f:
+    results = json.load(f)
+  if results.get('version') != RESULTS_VERSION:
+    raise ValueError('Unsupported benchmark results version: %s.' %
+                     results.get('version'))
+  return results
+
+
+Comparison = collections.namedtuple(
+    'Comparison',
+    ['name', 'baseline_us', 'current_us', 'ratio', 'threshold', 'regressed'])
+
+
+def threshold_for(name, default_threshold, thresholds=None):
+  """Returns the regression threshold of a scenario.
+
+  Args:
+    name: str, the name of the scenario.
+    default_threshold: float, the threshold of scenarios matching no pattern.
+    thresholds: An optional list of (pattern, threshold) pairs, where pattern
+      is an fnmatch pattern of scenario names. The last matching pattern
+      wins.
+
+  Returns:
+    The maximum tolerated relative slowdown, e.g. 0.1 for 10%.
+  """
+  threshold = default_threshold
+  for pattern, pattern_threshold in thresholds or []:
+    if fnmatch.fnmatchcase(name, pattern):
+      threshold = pattern_threshold
+  return threshold
+
+
+def compare_results(results, baseline, default_threshold=0.1,
+                    thresholds=None):
+  """Compares results against a baseline.
+
+  Args:
+    results: The results dictionary of the current run.
+    baseline: The results dictionary of the baseline run.
+    default_threshold: float, the relative slowdown of the median time per
+      call beyond which a scenario regresses.
+    thresholds: An optional list of (pattern, threshold) pairs overriding the
+      threshold of the scenarios whose name matches pattern.
+
+  Returns:
+    A list of Comparisons for the scenarios present in both runs, in the
+      order of the current results.
+  """
+  baseline_us = {
+      result['name']: result['us_per_call'] for result in baseline['results']
+  }
+  comparisons = []
+  for result in results['results']:
+    name = result['name']
+    if name not in baseline_us:
+      continue
+    ratio = result['us_per_call'] / baseline_us[name]
+    threshold = threshold_for(name, default_threshold, thresholds)
+    comparisons.append(
+        Comparison(name, baseline_us[name], result['us_per_call'], ratio,
+                   threshold, ratio > 1. + threshold))
+  return comparisons
+
+
+def format_results(results):
+  """Returns a table of the results, one scenario per line."""
+  lines = ['%-72s %12s %14s' % ('scenario', 'us/call', 'items/sec')]
+  for result in results['results']:
+    lines.append('%-72s %12.1f %14.1f' % (result['name'],
+                                          result['us_per_call'],
+                                          result['items_per_sec']))
+  return '\n'.join(lines)
+
+
+def format_comparisons(comparisons):
+  """Returns a table of the comparisons, flagging regressions."""
+  lines = ['%-72s %12s %12s %8s' % ('scenario', 'baseline us', 'current us',
+                                    'ratio')]
+  for comparison in comparisons:
+    lines.append('%-72s %12.1f %12.1f %8.3f%s' %
+                 (comparison.name, comparison.baseline_us,
+                  comparison.current_us, comparison.ratio,
+                  '  REGRESSION' if comparison.regressed else ''))
+  return '\n'.join(lines)
@@ -0,0 +1,90 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.benchmarks.benchmark_lib."""
+
+import os
+
+from recsim.benchmarks import benchmark_lib
+from recsim.benchmarks import scenarios
+import tensorflow.compat.v1 as tf
+
+
+def _results(us_per_call):
+  return {
+      'version': benchmark_lib.RESULTS_VERSION,
+      'results': [{
+          'name': name,
+          'us_per_call': us
+      } for name, us in us_per_call.items()],
+  }
+
+
+class BenchmarkLibTest(tf.test.TestCase):
+
+  def test_parameter_grid(self):
+    grid = benchmark_lib.parameter_grid(slate_size=[2, 5], num_candidates=[10])
+    self.assertEqual([list(params.items()) for params in grid],
+                     [[('num_candidates', 10), ('slate_size', 2)],
+                      [('num_candidates', 10), ('slate_size', 5)]])
+    scenario = benchmark_lib.Scenario('family', grid[1], None)
+    self.assertEqual(scenario.name, 'family/num_candidates=10,slate_size=5')
+
+  def test_time_scenario(self):
+    calls = []
+
+    def setup(num_items):
+      return lambda: calls.append(1), num_items
+
+    scenario = benchmark_lib.Scenario('append', {'num_items': 3}, setup)
+    results = benchmark_lib.run_scenarios([scenario],
+                                          min_time_secs=0.001,
+                                          repeats=2)
+    result, = results['results']
+    self.assertEqual(result['name'], 'append/num_items=3')
+    self.assertEqual(result['params'], {'num_items': 3})
+    self.assertGreater(result['us_per_call'], 0.)
+    self.assertAllClose(result['items_per_sec'], 3 * result['calls_per_sec'])
+    self.assertGreaterEqual(len(calls), 2 * result['calls_per_repeat'])
+
+    path = os.path.join(self.get_temp_dir(), 'results.json')
+    benchmark_lib.save_results(results, path)
+    self.assertEqual(benchmark_lib.load_results(path), results)
+
+  def test_compare_results(self):
+    baseline = _results({'a/x=1': 10., 'a/x=2': 10., 'b': 10., 'removed': 1.})
+    results = _results({'a/x=1': 11.5, 'a/x=2': 10.5, 'b': 11.5, 'new': 1.})
+    comparisons = benchmark_lib.compare_results(
+        results, baseline, default_threshold=0.1, thresholds=[('a/*', 0.2)])
+    self.assertEqual([(c.name, c.regressed) for c in comparisons],
+                     [('a/x=1', False), ('a/x=2', False), ('b', True)])
+    self.assertAllClose(comparisons[0].ratio, 1.15)
+    self.assertEqual(comparisons[0].threshold, 0.2)
+
+  def test_select_scenarios(self):
+    all_scenarios = scenarios.all_scenarios()
+    names = [scenario.name for scenario in all_scenarios]
+    self.assertLen(set(names), len(names))
+    selected = benchmark_lib.select_scenarios(all_scenarios,
+                                              '^choice_model/.*=2$')
+    self.assertLen(selected, 4)
+    # Every choice model can be set up and run.
+    for scenario in selected:
+      run_once, _ = scenario.setup_fn(**scenario.params)
+      run_once()
+
+
+if __name__ == '__main__':
+  tf.test.main()
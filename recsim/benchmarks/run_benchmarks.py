@@ -0,0 +1,124 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Runs the RecSim microbenchmarks.
+
+To time the environment steps and save the results as a baseline:
+
+python -m recsim.benchmarks.run_benchmarks --filter=_step/ \
+  --output=/tmp/baseline.json
+
+To compare a later run against the baseline, failing (with exit status 1) if
+a scenario is more than 10% slower, or 25% for the agents:
+
+python -m recsim.benchmarks.run_benchmarks --filter=_step/ \
+  --baseline=/tmp/baseline.json --threshold=0.1 \
+  --thresholds='agent_step/*=0.25'
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+
+from absl import app
+from absl import flags
+from recsim.benchmarks import benchmark_lib
+from recsim.benchmarks import scenarios
+import tensorflow.compat.v1 as tf
+
+flags.DEFINE_string(
+    'filter', None,
+    'Regular expression selecting the scenarios to run by name.')
+flags.DEFINE_bool('list', False, 'Lists the scenarios instead of running them.')
+flags.DEFINE_float('min_time_secs', 0.2,
+                   'Minimum duration of every timed repeat, in seconds.')
+flags.DEFINE_integer('repeats', 5, 'Number of timed repeats per scenario.')
+flags.DEFINE_string('output', None, 'Path of a JSON file to save results to.')
+flags.DEFINE_string(
+    'baseline', None,
+    'Path of saved results to compare against. The run fails if a scenario '
+    'regresses.')
+flags.DEFINE_float(
+    'threshold', 0.1,
+    'Relative slowdown of the median time per call beyond which a scenario '
+    'regresses.')
+flags.DEFINE_multi_string(
+    'thresholds', [],
+    'Per-scenario thresholds as pattern=threshold, where pattern is an '
+    'fnmatch pattern of scenario names, e.g. "agent_step/*=0.25".')
+
+FLAGS = flags.FLAGS
+
+
+def _parse_thresholds(specs):
+  thresholds = []
+  for spec in specs:
+    pattern, sep, threshold = spec.rpartition('=')
+    if not sep:
+      raise app.UsageError('Invalid threshold %r, expected pattern=value.' %
+                           spec)
+    thresholds.append((pattern, float(threshold)))
+  return thresholds
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  # The agents are built on TensorFlow 1 graphs and sessions.
+  tf.disable_v2_behavior()
+  thresholds = _parse_thresholds(FLAGS.thresholds)
+  baseline = None
+  if FLAGS.baseline:
+    baseline = benchmark_lib.load_results(FLAGS.baseline)
+
+  selected = benchmark_lib.select_scenarios(scenarios.all_scenarios(),
+                                            FLAGS.filter)
+  if FLAGS.list:
+    for scenario in selected:
+      print(scenario.name)
+    return
+
+  def log_result(result):
+    print('%-72s %12.1f us/call' % (result['name'], result['us_per_call']))
+    sys.stdout.flush()
+
+  results = benchmark_lib.run_scenarios(
+      selected,
+      min_time_secs=FLAGS.min_time_secs,
+      repeats=FLAGS.repeats,
+      log_fn=log_result)
+  if FLAGS.output:
+    benchmark_lib.save_results(results, FLAGS.output)
+  print(benchmark_lib.format_results(results))
+
+  if baseline is not None:
+    comparisons = benchmark_lib.compare_results(results, baseline,
+                                                FLAGS.threshold, thresholds)
+    print(benchmark_lib.format_comparisons(comparisons))
+    regressions = [c.name for c in comparisons if c.regressed]
+    if regressions:
+      print('%d scenario(s) regressed.' % len(regressions))
+      sys.exit(1)
+
+
+def run():
+  """Entry point of the recsim_benchmarks console script."""
+  app.run(main)
+
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,406 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark scenarios of the simulator and agent hot paths.
+
+Scenarios cover the steps of the three shipped environments (single-user,
+multi-user and batched), candidate set observations, choice models, the
+observation encoding of the DQN agents, the scores of the bandit algorithms,
+and the step of every agent. Each family of scenarios is parameterized by a
+grid over the relevant numbers of candidates, slate sizes, users or arms.
+
+Agents are stepped through a fixed, pre-recorded trajectory of observations,
+so that only the agent's step is timed. The DQN agents train every step once
+their replay memory holds min_replay_history transitions, which happens
+during calibration.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import functools
+
+import numpy as np
+from recsim import choice_model
+from recsim.agents import cluster_bandit_agent
+from recsim.agents import full_slate_q_agent
+from recsim.agents import greedy_pctr_agent
+from recsim.agents import random_agent
+from recsim.agents import slate_decomp_q_agent
+from recsim.agents import tabular_q_agent
+from recsim.agents.bandits import algorithms
+from recsim.agents.bandits import glm_algorithms
+from recsim.agents.dopamine import dqn_agent
+from recsim.agents.layers import cluster_click_statistics
+from recsim.benchmarks import benchmark_lib
+from recsim.environments import interest_evolution
+from recsim.environments import interest_exploration
+from recsim.environments import long_term_satisfaction
+from recsim.simulator import environment
+from recsim.testing import test_environment
+import tensorflow.compat.v1 as tf
+
+ENVIRONMENTS = {
+    'interest_evolution': interest_evolution,
+    'interest_exploration': interest_exploration,
+    'long_term_satisfaction': long_term_satisfaction,
+}
+
+_SEED = 0
+# Length of the trajectories agents are stepped through.
+_TRAJECTORY_LENGTH = 64
+
+
+def _env_config(num_candidates, slate_size, seed=_SEED, **kwargs):
+  return dict(
+      num_candidates=num_candidates,
+      slate_size=slate_size,
+      resample_documents=True,
+      seed=seed,
+      **kwargs)
+
+
+def _create_environment(env_name, num_candidates, slate_size):
+  np.random.seed(_SEED)
+  return ENVIRONMENTS[env_name].create_environment(
+      _env_config(num_candidates, slate_size))
+
+
+def _setup_single_user_step(env_name, num_candidates, slate_size):
+  """Steps a SingleUserEnvironment, resetting it at the end of sessions."""
+  env = _create_environment(env_name, num_candidates, slate_size).environment
+  env.reset()
+  slate = list(range(slate_size))
+
+  def run_once():
+    if env.step(slate)[3]:
+      env.reset()
+
+  return run_once, 1
+
+
+def _setup_gym_step(env_name, num_candidates, slate_size):
+  """Steps a RecSimGymEnv, including building its observation and reward."""
+  env = _create_environment(env_name, num_candidates, slate_size)
+  env.reset()
+  slate = list(range(slate_size))
+
+  def run_once():
+    if env.step(slate)[2]:
+      env.reset()
+
+  return run_once, 1
+
+
+def _setup_multi_user_step(env_name, num_candidates, slate_size, num_users):
+  """Steps a MultiUserEnvironment serving the same slate to every user."""
+  module = ENVIRONMENTS[env_name]
+  np.random.seed(_SEED)
+  single_user_envs = [
+      module.create_environment(
+          _env_config(num_candidates, slate_size, seed=_SEED + i)).environment
+      for i in range(num_users)
+  ]
+  env = environment.MultiUserEnvironment(
+      [single_user_env.user_model for single_user_env in single_user_envs],
+      single_user_envs[0]._document_sampler,  # pylint: disable=protected-access
+      num_candidates,
+      slate_size)
+  env.reset()
+  slates = [list(range(slate_size))] * num_users
+
+  def run_once():
+    if env.step(slates)[3]:
+      env.reset()
+
+  return run_once, num_users
+
+
+def _setup_batched_step(env_name, num_candidates, slate_size, num_users):
+  """Steps a BatchedEnvironment, which resets terminated sessions itself."""
+  np.random.seed(_SEED)
+  env = ENVIRONMENTS[env_name].create_batched_environment(
+      _env_config(num_candidates, slate_size, num_users=num_users))
+  env.reset()
+  slates = np.tile(np.arange(slate_size), (num_users, 1))
+
+  def run_once():
+    env.step(slates)
+
+  return run_once, num_users
+
+
+def _setup_candidate_set_observation(env_name, num_candidates):
+  """Creates the observation of a candidate set."""
+  env = _create_environment(env_name, num_candidates, 1).environment
+  env.reset()
+  return env.candidate_set.create_observation, num_candidates
+
+
+def _setup_observation_adapter_encode(env_name, num_candidates):
+  """Encodes an observation as the image of the DQN agents."""
+  env = _create_environment(env_name, num_candidates, 1)
+  adapter = dqn_agent.ObservationAdapter(env.observation_space)
+  observation = env.reset()
+  return functools.partial(adapter.encode, observation), 1
+
+
+_CHOICE_MODELS = {
+    'MultinomialLogitChoiceModel':
+        functools.partial(choice_model.MultinomialLogitChoiceModel,
+                          {'no_click_mass': 1.}),
+    'MultinomialProportionalChoiceModel':
+        functools.partial(choice_model.MultinomialProportionalChoiceModel, {
+            'min_normalizer': -1.,
+            'no_click_mass': 1.
+        }),
+    'ExponentialCascadeChoiceModel':
+        functools.partial(choice_model.ExponentialCascadeChoiceModel, {
+            'attention_prob': 0.9,
+            'score_scaling': 0.3
+        }),
+    'ProportionalCascadeChoiceModel':
+        functools.partial(choice_model.ProportionalCascadeChoiceModel, {
+            'attention_prob': 0.9,
+            'min_normalizer': -1.,
+            'score_scaling': 0.4
+        }),
+}
+
+
+def _setup_choice_model(model_name, slate_size, num_topics=20):
+  """Scores a slate and chooses an item from it."""
+  rng = np.random.RandomState(_SEED)
+  model = _CHOICE_MODELS[model_name]()
+  # Scores are within [0, 1], as the cascade models require.
+  user_state = interest_evolution.IEvUserState(
+      rng.uniform(size=num_topics) / num_topics)
+  doc_obs = rng.uniform(size=(slate_size, num_topics))
+
+  def run_once():
+    model.score_documents(user_state, doc_obs)
+    model.choose_item(rng)
+
+  return run_once, 1
+
+
+_BANDITS = {
+    'UCB1': algorithms.UCB1,
+    'KLUCB': algorithms.KLUCB,
+    'ThompsonSampling': algorithms.ThompsonSampling,
+}
+
+
+def _setup_bandit_score(algorithm_name, num_arms):
+  """Computes the scores of all arms of a multi-armed bandit."""
+  rng = np.random.RandomState(_SEED)
+  algorithm = _BANDITS[algorithm_name](num_arms, {}, seed=_SEED)
+  pulls = rng.randint(1, 100, size=num_arms)
+  algorithm.set_state(pulls, pulls * rng.uniform(size=num_arms))
+  t = int(np.sum(pulls))
+  return functools.partial(algorithm.get_score, t), num_arms
+
+
+_GLM_BANDITS = {
+    'UCB_GLM': functools.partial(glm_algorithms.UCB_GLM, horizon=1000),
+    'GLM_TS': glm_algorithms.GLM_TS,
+}
+
+
+def _setup_glm_bandit_arm(algorithm_name, dim, num_arms, num_pulls=200):
+  """Chooses an arm of a generalized linear bandit."""
+  np.random.seed(_SEED)
+  algorithm = _GLM_BANDITS[algorithm_name](dim)
+  for _ in range(num_pulls):
+    algorithm.update(np.random.binomial(1, 0.5), np.random.uniform(size=dim))
+  arms = list(np.random.uniform(size=(num_arms, dim)))
+  return functools.partial(algorithm.get_arm, arms), num_arms
+
+
+def _create_random_agent(env):
+  return random_agent.RandomAgent(env.action_space, random_seed=_SEED)
+
+
+def _create_greedy_pctr_agent(env):
+  return greedy_pctr_agent.GreedyPCTRAgent(
+      env.action_space, env.environment.user_model.avg_user_state)
+
+
+def _create_cluster_bandit_agent(env):
+  return cluster_click_statistics.ClusterClickStatsLayer(
+      cluster_bandit_agent.ClusterBanditAgent, env.observation_space,
+      env.action_space)
+
+
+def _create_tabular_q_agent(env):
+  return tabular_q_agent.TabularQAgent(env.observation_space, env.action_space)
+
+
+def _create_full_slate_q_agent(env, sess):
+  return full_slate_q_agent.FullSlateQAgent(
+      sess,
+      env.observation_space,
+      env.action_space,
+      min_replay_history=_TRAJECTORY_LENGTH)
+
+
+def _create_slate_decomp_q_agent(env, sess):
+  return slate_decomp_q_agent.create_agent(
+      'slate_topk_sarsa',
+      sess,
+      observation_space=env.observation_space,
+      action_space=env.action_space,
+      min_replay_history=_TRAJECTORY_LENGTH)
+
+
+def _create_test_environment(num_candidates, slate_size):
+  return test_environment.create_environment(
+      _env_config(num_candidates, slate_size,
+                  starting_probs=(1., 0., 0., 0., 0., 0.)))
+
+
+# Agent name: (environment constructor, agent constructor, uses TensorFlow).
+_AGENTS = {
+    'random':
+        (functools.partial(_create_environment, 'interest_evolution'),
+         _create_random_agent, False),
+    'greedy_pctr':
+        (functools.partial(_create_environment, 'interest_exploration'),
+         _create_greedy_pctr_agent, False),
+    'cluster_bandit':
+        (functools.partial(_create_environment, 'interest_exploration'),
+         _create_cluster_bandit_agent, False),
+    'tabular_q': (_create_test_environment, _create_tabular_q_agent, False),
+    'full_slate_q':
+        (functools.partial(_create_environment, 'interest_evolution'),
+         _create_full_slate_q_agent, True),
+    'slate_decomp_q':
+        (functools.partial(_create_environment, 'interest_evolution'),
+         _create_slate_decomp_q_agent, True),
+}
+
+
+def _record_trajectory(env, slate_size):
+  """Returns the first observation and the steps of random slates in env.
+
+  Steps are (reward, observation) pairs. Sessions ending early are followed
+  by new sessions, whose first observations, which hold no responses, are
+  left out.
+  """
+  rng = np.random.RandomState(_SEED)
+  first_observation = env.reset()
+  steps = []
+  while len(steps) < _TRAJECTORY_LENGTH:
+    slate = rng.choice(env.environment.num_candidates, slate_size,
+                       replace=False)
+    observation, reward, done, _ = env.step(slate)
+    steps.append((reward, observation))
+    if done:
+      env.reset()
+  return first_observation, steps
+
+
+def _setup_agent_step(agent_name, num_candidates, slate_size):
+  """Steps an agent through a pre-recorded trajectory."""
+  create_env_fn, create_agent_fn, uses_tensorflow = _AGENTS[agent_name]
+  env = create_env_fn(num_candidates, slate_size)
+  first_observation, trajectory = _record_trajectory(env, slate_size)
+  if uses_tensorflow:
+    graph = tf.Graph()
+    with graph.as_default():
+      sess = tf.Session(graph=graph)
+      agent = create_agent_fn(env, sess)
+      sess.run(tf.global_variables_initializer())
+  else:
+    agent = create_agent_fn(env)
+  agent.begin_episode(first_observation)
+  steps = iter([])
+
+  def run_once():
+    nonlocal steps
+    step = next(steps, None)
+    if step is None:
+      steps = iter(trajectory)
+      step = next(steps)
+    agent.step(*step)
+
+  return run_once, 1
+
+
+def _scenarios(family, setup_fn, **grid):
+  return [
+      benchmark_lib.Scenario(family, params, setup_fn)
+      for params in benchmark_lib.parameter_grid(**grid)
+  ]
+
+
+def all_scenarios():
+  """Returns the list of all benchmark scenarios."""
+  scenarios = []
+  for env_name in sorted(ENVIRONMENTS):
+    scenarios += _scenarios(
+        'single_user_step/' + env_name,
+        functools.partial(_setup_single_user_step, env_name),
+        num_candidates=[10, 100],
+        slate_size=[2, 5])
+    scenarios += _scenarios(
+        'gym_step/' + env_name,
+        functools.partial(_setup_gym_step, env_name),
+        num_candidates=[10, 100],
+        slate_size=[2, 5])
+    scenarios += _scenarios(
+        'multi_user_step/' + env_name,
+        functools.partial(_setup_multi_user_step, env_name),
+        num_candidates=[10],
+        slate_size=[2],
+        num_users=[10, 100])
+    scenarios += _scenarios(
+        'batched_step/' + env_name,
+        functools.partial(_setup_batched_step, env_name),
+        num_candidates=[10, 100],
+        slate_size=[2],
+        num_users=[100, 1000])
+    scenarios += _scenarios(
+        'candidate_set_observation/' + env_name,
+        functools.partial(_setup_candidate_set_observation, env_name),
+        num_candidates=[10, 100, 1000])
+    scenarios += _scenarios(
+        'observation_adapter_encode/' + env_name,
+        functools.partial(_setup_observation_adapter_encode, env_name),
+        num_candidates=[10, 100])
+  for model_name in sorted(_CHOICE_MODELS):
+    scenarios += _scenarios(
+        'choice_model/' + model_name,
+        functools.partial(_setup_choice_model, model_name),
+        slate_size=[2, 5, 10])
+  for algorithm_name in sorted(_BANDITS):
+    scenarios += _scenarios(
+        'bandit_score/' + algorithm_name,
+        functools.partial(_setup_bandit_score, algorithm_name),
+        num_arms=[10, 100, 1000])
+  for algorithm_name in sorted(_GLM_BANDITS):
+    scenarios += _scenarios(
+        'glm_bandit_arm/' + algorithm_name,
+        functools.partial(_setup_glm_bandit_arm, algorithm_name),
+        dim=[5, 20],
+        num_arms=[10, 100])
+  for agent_name in sorted(_AGENTS):
+    scenarios += _scenarios(
+        'agent_step/' + agent_name,
+        functools.partial(_setup_agent_step, agent_name),
+        num_candidates=[5, 10],
+        slate_size=[2])
+  return scenarios
@@ -63,9 +63,13 @@ class AbstractChoiceModel(object):
     return self._score_no_click
 
   @abc.abstractmethod
-  def choose_item(self):
+  def choose_item(self, rng=None):
     """Returns selected index of document in the slate.
 
+    Args:
+      rng: An optional np.random.Generator to sample the choice from. The
+        global numpy random state is used if not given.
+
     Returns:
       selected_index: a integer indicating which item was chosen, or None if
         none were selected.
@@ -73,19 +77,30 @@ class AbstractChoiceModel(object):
 
 
 class NormalizableChoiceModel(AbstractChoiceModel):
-  """A normalizable choice model."""
+  """A normalizable choice model.
+
+  User states are scored with score_documents_batch(doc_obs) if they provide
+  it, which is expected to return an array of the scores of all documents at
+  once (e.g. with a single matrix product). Otherwise, documents are scored
+  one at a time with score_document(doc).
+  """
 
   @staticmethod
   def _score_documents_helper(user_state, doc_obs):
-    scores = np.array([])
-    for doc in doc_obs:
-      scores = np.append(scores, user_state.score_document(doc))
-    return scores
-
-  def choose_item(self):
+    if not len(doc_obs):  # pylint: disable=g-explicit-length-test
+      return np.array([])
+    score_documents_batch = getattr(user_state, 'score_documents_batch', None)
+    if score_documents_batch is not None:
+      return np.asarray(score_documents_batch(doc_obs), dtype=np.float64)
+    return np.array([user_state.score_document(doc) for doc in doc_obs],
+                    dtype=np.float64)
+
+  def choose_item(self, rng=None):
     all_scores = np.append(self._scores, self._score_no_click)
     all_probs = all_scores / np.sum(all_scores)
-    selected_index = np.random.choice(len(all_probs), p=all_probs)
+    if rng is None:
+      rng = np.random
+    selected_index = rng.choice(len(all_probs), p=all_probs)
     if selected_index == len(all_probs) - 1:
       selected_index = None
     return selected_index
@@ -177,14 +192,16 @@ class CascadeChoiceModel(NormalizableChoiceModel):
     Args:
       scores: normalizable scores.
     """
-    self._score_no_click = 1.0
-    for i in range(len(scores)):
-      s = self._score_scaling * scores[i]
-      assert s <= 1.0, ('score_scaling cannot convert score %f into a '
-                        'probability') % scores[i]
-      scores[i] = self._score_no_click * self._attention_prob * s
-      self._score_no_click *= (1.0 - self._attention_prob * s)
-    self._scores = scores
+    scaled_scores = self._score_scaling * scores
+    assert np.all(scaled_scores <= 1.0), (
+        'score_scaling cannot convert score %f into a probability') % (
+            scores[np.argmax(scaled_scores)])
+    click_probs = self._attention_prob * scaled_scores
+    # Probability of reaching each position without having clicked before.
+    skip_probs = np.cumprod(1.0 - click_probs)
+    reach_probs = np.concatenate([[1.0], skip_probs[:-1]])
+    self._score_no_click = skip_probs[-1] if len(skip_probs) else 1.0
+    self._scores = reach_probs * click_probs
 
 
 class ExponentialCascadeChoiceModel(CascadeChoiceModel):
@@ -218,6 +235,6 @@ class ProportionalCascadeChoiceModel(CascadeChoiceModel):
   def score_documents(self, user_state, doc_obs):
     scores = self._score_documents_helper(user_state, doc_obs)
     scores = scores - self._min_normalizer
-    assert not scores[
-        scores < 0.0], 'Normalized scores have non-positive elements.'
+    assert not np.any(
+        scores < 0.0), 'Normalized scores have non-positive elements.'
     self._positional_normalization(scores)
@@ -96,6 +96,17 @@ class MultinomialChoiceModelTest(tf.test.TestCase):
     self.assertAlmostEqual(mnp_model._scores[1], 0.46, delta=0.001)
     self.assertAlmostEqual(mnp_model._score_no_click, 0, delta=0.001)
 
+  def test_batch_scoring_matches_per_document_scoring(self):
+    doc_obs = np.random.uniform(-1.0, 1.0, size=(50, 2))
+    expected = [self._user_state.score_document(doc) for doc in doc_obs]
+    self.assertAllClose(
+        choice_model.NormalizableChoiceModel._score_documents_helper(
+            self._user_state, doc_obs), expected)
+
+  def test_batch_scoring_dimension_mismatch(self):
+    with self.assertRaises(ValueError):
+      self._user_state.score_documents_batch(np.ones((3, 4)))
+
 
 class CascadeChoiceModelTest(tf.test.TestCase):
 
@@ -126,6 +137,19 @@ class CascadeChoiceModelTest(tf.test.TestCase):
     model.score_documents(self._user_state, np.array([[3.0], [2.0], [1.0]]))
     self.assertEqual(model.choose_item(), None)
 
+  def test_exponential_cascade_scores(self):
+    choice_features = {'attention_prob': 0.5, 'score_scaling': 0.1}
+    model = choice_model.ExponentialCascadeChoiceModel(choice_features)
+    model.score_documents(self._user_state, np.array([[0.0], [1.0], [2.0]]))
+    # Click probabilities at each position are 0.5 * 0.1 * exp(score), and a
+    # position is only examined if no earlier position was clicked.
+    click_probs = 0.05 * np.exp([0.0, 1.0, 2.0])
+    self.assertAllClose(model.scores, [
+        click_probs[0], (1 - click_probs[0]) * click_probs[1],
+        (1 - click_probs[0]) * (1 - click_probs[1]) * click_probs[2]
+    ])
+    self.assertAlmostEqual(model.score_no_click, np.prod(1 - click_probs))
+
   def test_proportional_cascade_invalid_attenion_prob(self):
     with self.assertRaises(ValueError):
       choice_features = {
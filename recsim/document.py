@@ -20,8 +20,11 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import collections
+
 from gym import spaces
 import numpy as np
+from recsim import random_streams
 import six
 
 # Some notes:
@@ -35,21 +38,35 @@ import six
 class CandidateSet(object):
   """Class to represent a collection of AbstractDocuments.
 
-     The candidate set is represented as a hashmap (dictionary), with documents
-     indexed by their document ID.
+     Documents are kept in insertion order. Alongside the documents, the
+     candidate set maintains an int64 array of document IDs, preallocated to
+     the expected number of candidates. The position of a document in this
+     array is its index in the observation, so mapping a slate of indices back
+     to documents is a constant-time lookup per item.
   """
 
-  def __init__(self):
-    """Initializes a document candidate set with 0 documents."""
+  def __init__(self, capacity=0):
+    """Initializes a document candidate set with 0 documents.
+
+    Args:
+      capacity: An integer, the number of document IDs to preallocate storage
+        for. Storage grows automatically beyond this number.
+    """
     self._documents = {}
+    self._document_list = []
+    self._positions = {}
+    self._observation_keys = []
+    self._document_types = collections.Counter()
+    self._doc_ids = np.zeros(capacity, dtype=np.int64)
+    self._size = 0
 
   def size(self):
     """Returns an integer, the number of documents in this candidate set."""
-    return len(self._documents)
+    return self._size
 
   def get_all_documents(self):
     """Returns all documents."""
-    return self.get_documents(self._documents.keys())
+    return list(self._document_list)
 
   def get_documents(self, document_ids):
     """Gets the documents associated with the specified document IDs.
@@ -64,26 +81,151 @@ class CandidateSet(object):
     """
     return [self._documents[int(k)] for k in document_ids]
 
+  def get_documents_by_index(self, indices):
+    """Gets the documents at the specified positions of the candidate set.
+
+    Args:
+      indices: an array of integers, each being the position of a document in
+        the observation of this candidate set (e.g. a slate).
+
+    Returns:
+      (documents) an ordered list of AbstractDocuments at these positions.
+    """
+    return [self._document_list[i] for i in indices]
+
+  @property
+  def doc_ids(self):
+    """Returns an int64 array of the document IDs, in observation order."""
+    return self._doc_ids[:self._size]
+
+  def _reserve(self):
+    """Makes room in the document ID storage for one more document."""
+    capacity = len(self._doc_ids)
+    if self._size < capacity:
+      return
+    self._doc_ids = np.resize(self._doc_ids, max(1, 2 * capacity))
+
   def add_document(self, document):
     """Adds a document to the candidate set."""
-    self._documents[document.doc_id()] = document
+    doc_id = document.doc_id()
+    if doc_id in self._documents:
+      # Replace the document with the same ID in place.
+      position = self._positions[doc_id]
+      self._remove_document_type(self._documents[doc_id])
+      self._document_types[type(document)] += 1
+      self._documents[doc_id] = document
+      self._document_list[position] = document
+      return
+    self._reserve()
+    self._doc_ids[self._size] = doc_id
+    self._documents[doc_id] = document
+    self._positions[doc_id] = self._size
+    self._document_list.append(document)
+    self._observation_keys.append(str(doc_id))
+    self._document_types[type(document)] += 1
+    self._size += 1
+
+  def _remove_document_type(self, document):
+    document_type = type(document)
+    self._document_types[document_type] -= 1
+    if not self._document_types[document_type]:
+      del self._document_types[document_type]
 
   def remove_document(self, document):
     """Removes a document from the set (to simulate a changing corpus)."""
-    del self._documents[document.doc_id()]
+    doc_id = document.doc_id()
+    position = self._positions.pop(doc_id)
+    self._remove_document_type(self._documents[doc_id])
+    del self._documents[doc_id]
+    del self._document_list[position]
+    del self._observation_keys[position]
+    # Shift the IDs to keep the storage contiguous and ordered.
+    self._doc_ids[position:self._size - 1] = self._doc_ids[position +
+                                                           1:self._size]
+    self._size -= 1
+    for i in range(position, self._size):
+      self._positions[int(self._doc_ids[i])] = i
 
   def create_observation(self):
-    """Returns a dictionary of observable features of documents."""
-    return {
-        str(k): self._documents[k].create_observation()
-        for k in self._documents.keys()
-    }
+    """Returns an ordered dictionary of observable features of documents."""
+    return collections.OrderedDict(
+        (key, doc.create_observation())
+        for key, doc in zip(self._observation_keys, self._document_list))
 
   def observation_space(self):
-    return spaces.Dict({
-        str(k): self._documents[k].observation_space()
-        for k in self._documents.keys()
-    })
+    """Returns a Dict space of document spaces keyed as in observations."""
+    return spaces.Dict(
+        collections.OrderedDict(
+            (key, doc.observation_space())
+            for key, doc in zip(self._observation_keys, self._document_list)))
+
+  def schema(self):
+    """Returns a hashable summary of the structure of the observation space.
+
+    Document spaces are defined per document class, so two candidate sets with
+    equal schemas have observation spaces that only differ in their keys, i.e.
+    the document IDs, and, if they mix document classes, in the order of the
+    document spaces. Computing the schema does not walk the documents.
+    """
+    return (self._size, frozenset(self._document_types))
+
+
+class DocumentBlock(object):
+  """Class to represent a block of sampled documents in columnar form.
+
+  A block stores, for each constructor argument of the sampled documents, an
+  array whose leading dimension indexes the documents. Document objects are
+  only materialized on demand. A block can also wrap already constructed
+  documents, in which case columns are extracted from their attributes on
+  demand.
+  """
+
+  def __init__(self, doc_ctor, columns=None, documents=None):
+    """Initializes a document block.
+
+    Args:
+      doc_ctor: A class/constructor for the type of documents in the block.
+      columns: A dictionary mapping the keyword arguments of doc_ctor to arrays
+        with a leading dimension of the number of documents.
+      documents: A list of AbstractDocuments, used if columns is None.
+    """
+    if (columns is None) == (documents is None):
+      raise ValueError('Exactly one of columns and documents must be given.')
+    self._doc_ctor = doc_ctor
+    self._columns = dict(columns) if columns is not None else {}
+    self._documents = documents
+    if documents is not None:
+      self._size = len(documents)
+    else:
+      self._size = len(self._columns['doc_id'])
+
+  def __len__(self):
+    return self._size
+
+  def __getitem__(self, key):
+    """Returns the column of the given document attribute."""
+    if key not in self._columns:
+      if self._documents is None:
+        raise KeyError(key)
+      if key == 'doc_id':
+        column = [doc.doc_id() for doc in self._documents]
+      else:
+        column = [getattr(doc, key) for doc in self._documents]
+      self._columns[key] = np.array(column)
+    return self._columns[key]
+
+  def documents(self):
+    """Returns the list of AbstractDocuments in the block."""
+    if self._documents is None:
+      # Lists of Python scalars are faster to index than arrays and keep the
+      # attribute types of documents created one at a time.
+      columns = [(key, column.tolist() if column.ndim == 1 else column)
+                 for key, column in self._columns.items()]
+      self._documents = [
+          self._doc_ctor(**{key: column[i] for key, column in columns})
+          for i in range(self._size)
+      ]
+    return self._documents
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -95,13 +237,45 @@ class AbstractDocumentSampler(object):
     self._seed = seed
     self.reset_sampler()
 
-  def reset_sampler(self):
-    self._rng = np.random.RandomState(self._seed)
+  @property
+  def seed(self):
+    return self._seed
+
+  def reset_sampler(self, key=()):
+    """Resets the random stream of the sampler.
+
+    The stream, self._rng, is a random_streams.RandomStream. It is a
+    np.random.Generator that also accepts the common np.random.RandomState
+    methods, but it draws different numbers for the same seed.
+
+    Args:
+      key: A tuple of non-negative integers identifying the stream, e.g. the
+        episode for which documents are sampled.
+    """
+    self._rng = random_streams.make_stream(self._seed, key)
 
   @abc.abstractmethod
   def sample_document(self):
     """Samples and return an instantiation of AbstractDocument."""
 
+  def sample_documents(self, num_documents):
+    """Samples a block of documents.
+
+    Subclasses may override this with a vectorized implementation, drawing each
+    document property for the whole block in a single call to the random
+    number generator. The default implementation calls sample_document
+    num_documents times.
+
+    Args:
+      num_documents: An integer, the number of documents to sample.
+
+    Returns:
+      A DocumentBlock of num_documents documents.
+    """
+    return DocumentBlock(
+        self._doc_ctor,
+        documents=[self.sample_document() for _ in range(num_documents)])
+
   def get_doc_ctor(self):
     """Returns the constructor/class of the documents that will be sampled."""
     return self._doc_ctor
@@ -118,7 +292,14 @@ class AbstractDocumentSampler(object):
 
 @six.add_metaclass(abc.ABCMeta)
 class AbstractDocument(object):
-  """Abstract class to represent a document and its properties."""
+  """Abstract class to represent a document and its properties.
+
+  Documents are allocated for every candidate set, so they declare __slots__
+  rather than carrying a per-instance __dict__. Subclasses should list their
+  attributes in __slots__ too.
+  """
+
+  __slots__ = ('_doc_id',)
 
   # Number of features to represent the document.
   NUM_FEATURES = None
@@ -0,0 +1,104 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.document."""
+
+import pickle
+
+import numpy as np
+from recsim import document
+from recsim.environments import interest_evolution
+import tensorflow.compat.v1 as tf
+
+
+class CandidateSetTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(CandidateSetTest, self).setUp()
+    self._sampler = interest_evolution.UtilityModelVideoSampler()
+    self._candidate_set = document.CandidateSet(capacity=2)
+    self._documents = [self._sampler.sample_document() for _ in range(5)]
+    for doc in self._documents:
+      self._candidate_set.add_document(doc)
+
+  def test_columnar_storage(self):
+    self.assertEqual(5, self._candidate_set.size())
+    self.assertAllEqual([0, 1, 2, 3, 4], self._candidate_set.doc_ids)
+    self.assertEqual(np.int64, self._candidate_set.doc_ids.dtype)
+    self.assertEqual(['0', '1', '2', '3', '4'],
+                     list(self._candidate_set.create_observation()))
+
+  def test_get_documents_by_index(self):
+    self.assertEqual([self._documents[3], self._documents[0]],
+                     self._candidate_set.get_documents_by_index([3, 0]))
+    self.assertEqual([self._documents[3], self._documents[0]],
+                     self._candidate_set.get_documents(['3', '0']))
+
+  def test_remove_document(self):
+    self._candidate_set.remove_document(self._documents[1])
+    self.assertEqual(4, self._candidate_set.size())
+    self.assertAllEqual([0, 2, 3, 4], self._candidate_set.doc_ids)
+    self.assertEqual([self._documents[2]],
+                     self._candidate_set.get_documents_by_index([1]))
+    self._candidate_set.remove_document(self._documents[3])
+    self.assertEqual([self._documents[4]],
+                     self._candidate_set.get_documents_by_index([2]))
+
+  def test_schema(self):
+    schema = self._candidate_set.schema()
+    self.assertEqual(['0', '1', '2', '3', '4'],
+                     list(self._candidate_set.observation_space().spaces))
+    other_set = document.CandidateSet()
+    for _ in range(5):
+      other_set.add_document(self._sampler.sample_document())
+    self.assertEqual(schema, other_set.schema())
+    self._candidate_set.remove_document(self._documents[0])
+    self.assertNotEqual(schema, self._candidate_set.schema())
+
+  def test_slotted_documents(self):
+    doc = self._documents[0]
+    self.assertFalse(hasattr(doc, '__dict__'))
+    copied = pickle.loads(pickle.dumps(doc))
+    self.assertEqual(doc.doc_id(), copied.doc_id())
+    self.assertAllEqual(doc.features, copied.features)
+
+
+class DocumentBlockTest(tf.test.TestCase):
+
+  def test_block_from_documents(self):
+    sampler = interest_evolution.IEvVideoSampler()
+    documents = [sampler.sample_document() for _ in range(3)]
+    block = document.DocumentBlock(
+        interest_evolution.IEvVideo, documents=documents)
+    self.assertLen(block, 3)
+    self.assertIs(documents, block.documents())
+    self.assertAllEqual([0, 1, 2], block['doc_id'])
+    self.assertAllEqual([doc.video_length for doc in documents],
+                        block['video_length'])
+
+  def test_block_from_columns(self):
+    sampler = interest_evolution.UtilityModelVideoSampler(seed=1)
+    block = sampler.sample_documents(4)
+    self.assertEqual((4, interest_evolution.IEvVideo.NUM_FEATURES),
+                     block['features'].shape)
+    documents = block.documents()
+    self.assertEqual([0, 1, 2, 3], [doc.doc_id() for doc in documents])
+    for i, doc in enumerate(documents):
+      self.assertEqual(1.0, doc.features[doc.cluster_id])
+      self.assertEqual(block['quality'][i], doc.quality)
+
+
+if __name__ == '__main__':
+  tf.test.main()
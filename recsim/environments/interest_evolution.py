@@ -45,11 +45,17 @@ class IEvResponse(user.AbstractResponse):
     cluster_id: A integer representing the cluster ID of the video.
   """
 
+  __slots__ = ('clicked', 'watch_time', 'liked', 'quality', 'cluster_id')
+
   # The min quality score.
   MIN_QUALITY_SCORE = -100
   # The max quality score.
   MAX_QUALITY_SCORE = 100
 
+  RESPONSE_DTYPE = np.dtype([('click', np.int64), ('cluster_id', np.int64),
+                             ('liked', np.int64), ('quality', np.float32),
+                             ('watch_time', np.float32)])
+
   def __init__(self,
                clicked=False,
                watch_time=0.0,
@@ -80,6 +86,10 @@ class IEvResponse(user.AbstractResponse):
         'cluster_id': int(self.cluster_id)
     }
 
+  def to_record(self):
+    return (int(self.clicked), int(self.cluster_id), int(self.liked),
+            self.quality, self.watch_time)
+
   @classmethod
   def response_space(cls):
     # `clicked` feature range is [0, 1]
@@ -121,6 +131,8 @@ class IEvVideo(document.AbstractDocument):
     quality: a float the represents document quality.
   """
 
+  __slots__ = ('features', 'cluster_id', 'video_length', 'quality')
+
   # The maximum length of videos.
   MAX_VIDEO_LENGTH = 100.0
 
@@ -204,6 +216,21 @@ class IEvVideoSampler(document.AbstractDocumentSampler):
     self._doc_count += 1
     return self._doc_ctor(**doc_features)
 
+  def sample_documents(self, num_documents):
+    columns = {}
+    columns['doc_id'] = np.arange(self._doc_count,
+                                  self._doc_count + num_documents)
+    columns['features'] = self._rng.uniform(
+        self._min_feature_value, self._max_feature_value,
+        (num_documents, self.get_doc_ctor().NUM_FEATURES))
+    columns['video_length'] = np.minimum(
+        self._rng.normal(self._video_length_mean, self._video_length_std,
+                         num_documents),
+        self.get_doc_ctor().MAX_VIDEO_LENGTH)
+    columns['quality'] = np.ones(num_documents)
+    self._doc_count += num_documents
+    return document.DocumentBlock(self._doc_ctor, columns)
+
 
 class UtilityModelVideoSampler(document.AbstractDocumentSampler):
   """Class that samples videos for utility model experiment."""
@@ -245,7 +272,7 @@ class UtilityModelVideoSampler(document.AbstractDocumentSampler):
     doc_features['doc_id'] = self._doc_count
 
     # Sample a cluster_id. Assumes there are NUM_FEATURE clusters.
-    cluster_id = self._rng.randint(0, self._num_clusters)
+    cluster_id = self._rng.integers(0, self._num_clusters)
     doc_features['cluster_id'] = cluster_id
 
     # Features are a 1-hot encoding of cluster id
@@ -266,10 +293,41 @@ class UtilityModelVideoSampler(document.AbstractDocumentSampler):
     self._doc_count += 1
     return self._doc_ctor(**doc_features)
 
+  def sample_documents(self, num_documents):
+    columns = {}
+    columns['doc_id'] = np.arange(self._doc_count,
+                                  self._doc_count + num_documents)
+    cluster_id = self._rng.integers(0, self._num_clusters, num_documents)
+    columns['cluster_id'] = cluster_id
+    # Features are a 1-hot encoding of cluster id
+    columns['features'] = np.eye(self._num_clusters)[cluster_id]
+    columns['video_length'] = np.full(num_documents, self._video_length)
+    # Quality with fixed variance around the cluster mean.
+    quality_variance = 0.1
+    columns['quality'] = self._rng.normal(self.cluster_means[cluster_id],
+                                          quality_variance)
+    self._doc_count += num_documents
+    return document.DocumentBlock(self._doc_ctor, columns)
+
 
 class IEvUserState(user.AbstractUserState):
   """Class to represent interest evolution users."""
 
+  __slots__ = (
+      'user_interests',
+      'time_budget',
+      'keep_interact_prob',
+      'min_doc_utility',
+      'choice_features',
+      'user_update_alpha',
+      'step_penalty',
+      'user_quality_factor',
+      'document_quality_factor',
+      'watched_videos',
+      'impressed_videos',
+      'liked_videos',
+  )
+
   # Number of features in the user state representation.
   NUM_FEATURES = 20
 
@@ -361,6 +419,13 @@ class IEvUserState(user.AbstractUserState):
       raise ValueError('User and document feature dimension mismatch!')
     return np.dot(self.user_interests, doc_obs)
 
+  def score_documents_batch(self, doc_obs):
+    """Scores a [num_docs, num_features] matrix of documents at once."""
+    doc_obs = np.asarray(doc_obs)
+    if doc_obs.ndim != 2 or doc_obs.shape[1:] != self.user_interests.shape:
+      raise ValueError('User and document feature dimension mismatch!')
+    return np.dot(doc_obs, self.user_interests)
+
   def create_observation(self):
     """Return an observation of this user's observable state."""
     return self.user_interests
@@ -538,7 +603,7 @@ class IEvUserModel(user.AbstractUserModel):
         update = alpha * mask * target
         positive_update_prob = np.dot((user_state.user_interests + 1.0) / 2,
                                       mask)
-        flip = np.random.rand(1)
+        flip = self._rng.random()
         if flip < positive_update_prob:
           user_state.user_interests += update
         else:
@@ -574,7 +639,7 @@ class IEvUserModel(user.AbstractUserModel):
     # responses.
     doc_obs = [doc.create_observation() for doc in documents]
     self.choice_model.score_documents(self._user_state, doc_obs)
-    selected_index = self.choice_model.choose_item()
+    selected_index = self.choice_model.choose_item(self._rng)
 
     for i, response in enumerate(responses):
       response.quality = documents[i].quality
@@ -605,6 +670,167 @@ class IEvUserModel(user.AbstractUserModel):
     response.watch_time = min(user_state.time_budget, doc.video_length)
 
 
+class IEvBatchedUserModel(user.AbstractBatchedUserModel):
+  """Class to model a batch of interest evolution users with array state.
+
+  Implements the dynamics of IEvUserModel with users sampled as in
+  UtilityModelUserSampler, vectorized across users. The hidden state consists
+  of a [num_users, num_features] array of user interests and a [num_users]
+  array of time budgets.
+
+  Args:
+    num_users: An integer representing the number of users.
+    slate_size: An integer representing the size of the slate.
+    num_features: An integer for the dimension of the user interests.
+    no_click_mass: A float indicating the mass given to a no click option.
+    min_normalizer: A float (<= 0) used to offset the scores to be positive
+      when using the multinomial proportional choice model.
+    document_quality_factor: A float for how much to weigh the document quality
+      when updating budget.
+    is_mnl: Whether to use a multinomial logit choice model instead of a
+      multinomial proportional one.
+    time_budget: A float for the initial time budget of each user.
+    step_penalty: A float for the budget penalty applied when nothing is
+      clicked.
+    seed: An integer used as the seed in random sampling.
+    alpha_x_intercept: A float for the x intercept of the line used to compute
+      interests update factor.
+    alpha_y_intercept: A float for the y intercept of the line used to compute
+      interests update factor.
+  """
+
+  DOC_ATTRIBUTES = ('features', 'video_length', 'quality', 'cluster_id')
+
+  def __init__(self,
+               num_users,
+               slate_size,
+               num_features=IEvUserState.NUM_FEATURES,
+               no_click_mass=1.0,
+               min_normalizer=-1.0,
+               document_quality_factor=1.0,
+               is_mnl=False,
+               time_budget=200.0,
+               step_penalty=0.5,
+               seed=0,
+               alpha_x_intercept=1.0,
+               alpha_y_intercept=0.3):
+    self._num_features = num_features
+    self._no_click_mass = no_click_mass
+    self._min_normalizer = min_normalizer
+    self._document_quality_factor = document_quality_factor
+    self._is_mnl = is_mnl
+    self._time_budget = time_budget
+    self._step_penalty = step_penalty
+    self._alpha_x_intercept = alpha_x_intercept
+    self._alpha_y_intercept = alpha_y_intercept
+    # In UtilityModelUserSampler the user quality is ignored and the budget
+    # update factor is the fraction of video length we can extend (or cut)
+    # budget by, normalized by the range of document qualities.
+    self._user_quality_factor = 0.0
+    self._user_update_alpha = 0.9 / 3.4
+    super(IEvBatchedUserModel, self).__init__(num_users, slate_size, seed=seed)
+
+  def _sample_users(self, num_users):
+    return {
+        'user_interests':
+            self._rng.uniform(-1.0, 1.0, (num_users, self._num_features)),
+        'time_budget':
+            np.full(num_users, self._time_budget),
+    }
+
+  def is_terminal(self):
+    """Returns a boolean array indicating which sessions are over."""
+    return self._state['time_budget'] <= 0
+
+  def _score_documents(self, doc_features):
+    """Computes normalizable scores of [num_users, k, num_features] docs."""
+    logits = np.einsum('uf,ukf->uk', self._state['user_interests'],
+                       doc_features)
+    no_click = np.full(logits.shape[:1] + (1,), float(self._no_click_mass))
+    all_scores = np.concatenate([logits, no_click], axis=1)
+    if self._is_mnl:
+      all_scores = np.exp(all_scores -
+                          np.max(all_scores, axis=1, keepdims=True))
+      all_scores /= np.sum(all_scores, axis=1, keepdims=True)
+    else:
+      all_scores = all_scores - self._min_normalizer
+      assert not np.any(
+          all_scores < 0.0), 'Normalized scores have non-positive elements.'
+    return all_scores[:, :-1], all_scores[:, -1]
+
+  def simulate_response(self, slate_documents):
+    """Simulates the users' responses to a batch of slates.
+
+    Args:
+      slate_documents: A dictionary mapping DOC_ATTRIBUTES to arrays of shape
+        [num_users, slate_size, ...].
+
+    Returns:
+      A dictionary of [num_users, slate_size] arrays for `click`,
+        `watch_time`, `liked`, `quality` and `cluster_id`.
+    """
+    scores, score_no_click = self._score_documents(
+        slate_documents['features'])
+    clicked = self._choose_items(scores, score_no_click)
+    watch_time = np.minimum(self._state['time_budget'][:, np.newaxis],
+                            slate_documents['video_length'])
+    return {
+        'click': clicked.astype(np.int64),
+        'watch_time': np.where(clicked, watch_time, 0.0),
+        'liked': np.zeros_like(clicked, dtype=np.int64),
+        'quality': slate_documents['quality'].astype(np.float64),
+        'cluster_id': slate_documents['cluster_id'].astype(np.int64),
+    }
+
+  def update_state(self, slate_documents, responses):
+    """Updates the users' states based on responses to the slates.
+
+    Args:
+      slate_documents: A dictionary mapping DOC_ATTRIBUTES to arrays of shape
+        [num_users, slate_size, ...].
+      responses: A dictionary of response arrays as returned by
+        simulate_response.
+    """
+    clicked = responses['click'].astype(bool)
+    has_click = np.any(clicked, axis=1)
+    clicked_index = np.argmax(clicked, axis=1)
+    rows = np.arange(clicked.shape[0])
+
+    # Features, quality and watch time of the clicked document in each slate.
+    features = slate_documents['features'][rows, clicked_index]
+    quality = slate_documents['quality'][rows, clicked_index]
+    watch_time = responses['watch_time'][rows, clicked_index]
+
+    interests = self._state['user_interests']
+    scores, _ = self._score_documents(features[:, np.newaxis, :])
+    expected_utility = scores[:, 0]
+
+    ## Update interests
+    alpha = ((-self._alpha_y_intercept / self._alpha_x_intercept) *
+             np.absolute(interests) + self._alpha_y_intercept)
+    update = alpha * features * (features - interests)
+    positive_update_prob = np.sum((interests + 1.0) / 2 * features, axis=1)
+    flip = self._rng.random(interests.shape[0])
+    sign = np.where(flip < positive_update_prob, 1.0, -1.0)
+    updated_interests = np.clip(interests + sign[:, np.newaxis] * update, -1.0,
+                                1.0)
+    self._state['user_interests'] = np.where(has_click[:, np.newaxis],
+                                             updated_interests, interests)
+
+    ## Update budget
+    received_utility = (
+        self._user_quality_factor * expected_utility +
+        self._document_quality_factor * quality)
+    budget_delta = -watch_time + (
+        self._user_update_alpha * watch_time * received_utility)
+    self._state['time_budget'] = self._state['time_budget'] + np.where(
+        has_click, budget_delta, -self._step_penalty)
+
+  def create_observation(self):
+    """Returns the [num_users, num_features] array of user interests."""
+    return self._state['user_interests'].copy()
+
+
 def clicked_watchtime_reward(responses):
   """Calculates the total clicked watchtime from a list of responses.
 
@@ -656,6 +882,29 @@ def create_environment(env_config):
       env_config['slate_size'],
       resample_documents=env_config['resample_documents'])
 
-  return recsim_gym.RecSimGymEnv(ievenv, clicked_watchtime_reward,
-                                 utils.aggregate_video_cluster_metrics,
-                                 utils.write_video_cluster_metrics)
+  return recsim_gym.RecSimGymEnv(
+      ievenv,
+      clicked_watchtime_reward,
+      utils.aggregate_video_cluster_metrics,
+      utils.write_video_cluster_metrics,
+      structured_responses=env_config.get('structured_responses', False))
+
+
+def create_batched_environment(env_config):
+  """Creates an interest evolution environment simulating a batch of users."""
+
+  user_model = IEvBatchedUserModel(
+      env_config['num_users'],
+      env_config['slate_size'],
+      seed=env_config['seed'])
+
+  document_sampler = UtilityModelVideoSampler(
+      doc_ctor=IEvVideo, seed=env_config['seed'])
+
+  return environment.BatchedEnvironment(
+      user_model,
+      document_sampler,
+      env_config['num_candidates'],
+      env_config['slate_size'],
+      resample_documents=env_config['resample_documents'],
+      reset_terminated_users=env_config.get('reset_terminated_users', True))
@@ -20,6 +20,7 @@ from __future__ import division
 from __future__ import print_function
 import numpy as np
 from recsim import choice_model
+from recsim import random_streams
 from recsim.environments import interest_evolution
 import tensorflow.compat.v1 as tf
 
@@ -36,7 +37,8 @@ class FakeChoiceModel(choice_model.AbstractChoiceModel):
     """Skip set user and docs features."""
     pass
 
-  def choose_item(self):
+  def choose_item(self, rng=None):
+    del rng  # Unused.
     return self._select_index
 
 
@@ -108,5 +110,80 @@ class InterestEvolutionTest(tf.test.TestCase):
     self.assertTrue(self._user_model.is_terminal())
 
 
+class IEvBatchedUserModelTest(tf.test.TestCase):
+
+  def test_update_state(self):
+    user_model = interest_evolution.IEvBatchedUserModel(
+        num_users=2, slate_size=1, document_quality_factor=0.0)
+    features = np.ones((2, 1, 20))
+    slate_documents = {
+        'features': features,
+        'video_length': np.full((2, 1), 4.0),
+        'quality': np.zeros((2, 1)),
+        'cluster_id': np.zeros((2, 1), dtype=np.int64),
+    }
+    responses = {'click': np.array([[1], [0]]),
+                 'watch_time': np.array([[3.0], [0.0]])}
+    user_model.update_state(slate_documents, responses)
+    # The first user watched for 3 minutes, the second pays the step penalty.
+    self.assertAllClose([197.0, 199.5], user_model._state['time_budget'])
+
+  def test_matches_serial_model(self):
+    num_users, slate_size = 3, 2
+    serial_models = [
+        interest_evolution.IEvUserModel(
+            slate_size,
+            choice_model_ctor=choice_model.MultinomialProportionalChoiceModel,
+            seed=i) for i in range(num_users)
+    ]
+    batched_model = interest_evolution.IEvBatchedUserModel(
+        num_users, slate_size)
+    batched_model._state['user_interests'] = np.array(
+        [model._user_state.user_interests for model in serial_models])
+    sampler = interest_evolution.UtilityModelVideoSampler(seed=0)
+    for step in range(4):
+      slates = [[sampler.sample_document() for _ in range(slate_size)]
+                for _ in range(num_users)]
+      # User i clicks document (i + step) % 3 of its slate, i.e. none if 2.
+      clicked_index = [(i + step) % (slate_size + 1) for i in range(num_users)]
+      click = np.zeros((num_users, slate_size), dtype=np.int64)
+      watch_time = np.zeros((num_users, slate_size))
+      for i, (model, slate) in enumerate(zip(serial_models, slates)):
+        responses = [interest_evolution.IEvResponse() for _ in slate]
+        if clicked_index[i] < slate_size:
+          response = responses[clicked_index[i]]
+          response.clicked = True
+          response.watch_time = min(model._user_state.time_budget,
+                                    slate[clicked_index[i]].video_length)
+          click[i, clicked_index[i]] = 1
+          watch_time[i, clicked_index[i]] = response.watch_time
+        # Serial user i draws the i-th interest update flip of the batch.
+        model._rng = random_streams.make_stream(step)
+        model._rng.random(i)
+        model.update_state(slate, responses)
+      slate_documents = {
+          key: np.array([[getattr(doc, key) for doc in slate]
+                         for slate in slates])
+          for key in interest_evolution.IEvBatchedUserModel.DOC_ATTRIBUTES
+      }
+      batched_model._rng = random_streams.make_stream(step)
+      batched_model.update_state(slate_documents, {
+          'click': click,
+          'watch_time': watch_time
+      })
+      self.assertAllClose(
+          [model._user_state.user_interests for model in serial_models],
+          batched_model._state['user_interests'])
+      self.assertAllClose(
+          [model._user_state.time_budget for model in serial_models],
+          batched_model._state['time_budget'])
+
+  def test_is_terminal(self):
+    user_model = interest_evolution.IEvBatchedUserModel(
+        num_users=3, slate_size=2)
+    user_model._state['time_budget'] = np.array([0.5, 0.0, -1.0])
+    self.assertAllEqual([False, True, True], user_model.is_terminal())
+
+
 if __name__ == '__main__':
   tf.test.main()
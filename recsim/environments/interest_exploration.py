@@ -127,7 +127,7 @@ class IEUserModel(user.AbstractUserModel):
 
     self.choice_model.score_documents(
         self._user_state, [doc.create_observation() for doc in documents])
-    selected_index = self.choice_model.choose_item()
+    selected_index = self.choice_model.choose_item(self._rng)
     for i, response in enumerate(responses):
       response.quality = documents[i].quality
       response.cluster_id = documents[i].cluster_id
@@ -156,6 +156,8 @@ class IEUserState(user.AbstractUserState):
       are not temporal dynamics and hidden.
   """
 
+  __slots__ = ('topic_affinity',)
+
   def __init__(self, topic_affinity):
     """Initializes a new user."""
     self.topic_affinity = topic_affinity
@@ -164,6 +166,12 @@ class IEUserState(user.AbstractUserState):
     """Returns user document affinity plus document quality."""
     return self.topic_affinity[doc_obs['cluster_id']] + doc_obs['quality']
 
+  def score_documents_batch(self, doc_obs):
+    """Returns user document affinities plus qualities of all documents."""
+    cluster_ids = np.array([obs['cluster_id'] for obs in doc_obs])
+    qualities = np.array([obs['quality'] for obs in doc_obs])
+    return self.topic_affinity[cluster_ids] + qualities
+
   def create_observation(self):
     """User's topic_affinity is not observable."""
     return np.array([])
@@ -232,6 +240,101 @@ class IEClusterUserSampler(user.AbstractUserSampler):
     return np.matmul(self._user_type_dist, self._user_doc_means)
 
 
+class IEBatchedUserModel(user.AbstractBatchedUserModel):
+  """Class to model a batch of interest exploration users with array state.
+
+  Implements the dynamics of IEUserModel with users sampled as in
+  IEClusterUserSampler, vectorized across users. The hidden state is a
+  [num_users, num_topics] array of topic affinities, which is static and not
+  observable.
+
+  Args:
+    num_users: An integer representing the number of users.
+    slate_size: An integer representing the size of the slate.
+    no_click_mass: A float indicating the mass given to a no-click option.
+    user_type_distribution: a non-negative array of dimension equal to the
+      number of user types, whose entries sum to one.
+    user_document_mean_affinity_matrix: a non-negative two-dimensional array
+      with dimensions number of user types by number of document topics.
+    user_document_stddev_affinity_matrix: a non-negative two-dimensional array
+      with dimensions number of user types by number of document topics.
+    seed: an integer used as the seed in random sampling.
+  """
+
+  DOC_ATTRIBUTES = ('quality', 'cluster_id')
+
+  def __init__(self,
+               num_users,
+               slate_size,
+               no_click_mass=5,
+               user_type_distribution=(0.3, 0.7),
+               user_document_mean_affinity_matrix=((.1, .7), (.7, .1)),
+               user_document_stddev_affinity_matrix=((.1, .1), (.1, .1)),
+               seed=0):
+    if len(user_document_mean_affinity_matrix) != len(user_type_distribution):
+      raise ValueError('The dimensions of user_type_distribution and '
+                       'user_document_mean_affinity_matrix do not match.')
+    if len(user_document_stddev_affinity_matrix) != len(user_type_distribution):
+      raise ValueError('The dimensions of user_type_distribution and '
+                       'user_document_stddev_affinity_matrix do not match.')
+    self._no_click_mass = no_click_mass
+    self._user_type_dist = np.asarray(user_type_distribution)
+    self._user_doc_means = np.asarray(user_document_mean_affinity_matrix)
+    self._user_doc_stddev = np.asarray(user_document_stddev_affinity_matrix)
+    super(IEBatchedUserModel, self).__init__(num_users, slate_size, seed=seed)
+
+  def _sample_users(self, num_users):
+    # 1. Pick user types.
+    user_types = self._rng.choice(
+        len(self._user_type_dist), size=num_users, p=self._user_type_dist)
+    # 2. Sample user-document affinities given types.
+    topic_affinity = self._rng.lognormal(
+        mean=self._user_doc_means[user_types],
+        sigma=self._user_doc_stddev[user_types])
+    return {'topic_affinity': topic_affinity}
+
+  def is_terminal(self):
+    """Sessions never terminate."""
+    return np.zeros(self._num_users, dtype=bool)
+
+  def simulate_response(self, slate_documents):
+    """Simulates the users' responses to a batch of slates.
+
+    Args:
+      slate_documents: A dictionary mapping DOC_ATTRIBUTES to arrays of shape
+        [num_users, slate_size].
+
+    Returns:
+      A dictionary of [num_users, slate_size] arrays for `click`, `quality`
+        and `cluster_id`.
+    """
+    cluster_id = slate_documents['cluster_id'].astype(np.int64)
+    quality = slate_documents['quality'].astype(np.float64)
+    # Multinomial logit choice over affinity plus quality.
+    logits = np.take_along_axis(self._state['topic_affinity'], cluster_id,
+                                axis=1) + quality
+    no_click = np.full(logits.shape[:1], float(self._no_click_mass))
+    max_logits = np.maximum(np.max(logits, axis=1), no_click)
+    scores = np.exp(logits - max_logits[:, np.newaxis])
+    score_no_click = np.exp(no_click - max_logits)
+    clicked = self._choose_items(scores, score_no_click)
+    return {
+        'click': clicked.astype(np.int64),
+        'quality': quality,
+        'cluster_id': cluster_id,
+    }
+
+  # No state transitions.
+  def update_state(self, slate_documents, responses):
+    del slate_documents  # Unused
+    del responses  # Unused
+    return
+
+  def create_observation(self):
+    """User's topic_affinity is not observable."""
+    return np.zeros((self._num_users, 0))
+
+
 class IEResponse(user.AbstractResponse):
   """Class to represent a user's response to a document.
 
@@ -241,8 +344,13 @@ class IEResponse(user.AbstractResponse):
     cluster_id: an integer representing the topic ID of the document.
   """
 
+  __slots__ = ('clicked', 'quality', 'cluster_id')
+
   NUM_CLUSTERS = 0
 
+  RESPONSE_DTYPE = np.dtype([('click', np.int64), ('cluster_id', np.int64),
+                             ('quality', np.float32)])
+
   def __init__(self,
                clicked=False,
                quality=0.0,
@@ -264,6 +372,9 @@ class IEResponse(user.AbstractResponse):
         'cluster_id': self.cluster_id
     }
 
+  def to_record(self):
+    return (int(self.clicked), self.cluster_id, self.quality)
+
   @classmethod
   def response_space(cls):
     return spaces.Dict({
@@ -285,6 +396,8 @@ class IEDocument(document.AbstractDocument):
     quality: non-negative real number representing the quality of the document.
   """
 
+  __slots__ = ('cluster_id', 'quality')
+
   NUM_CLUSTERS = 0
 
   def __init__(self, doc_id, cluster_id, quality):
@@ -362,6 +475,20 @@ class IETopicDocumentSampler(document.AbstractDocumentSampler):
     doc_features['quality'] = doc_quality
     return self._doc_ctor(**doc_features)
 
+  def sample_documents(self, num_documents):
+    """Samples the topics and then the document features given the topics."""
+    columns = {}
+    columns['doc_id'] = np.arange(self._doc_count,
+                                  self._doc_count + num_documents)
+    self._doc_count += num_documents
+    topic_id = self._rng.choice(
+        self._number_of_topics, size=num_documents, p=self._topic_dist)
+    columns['cluster_id'] = topic_id
+    columns['quality'] = self._rng.lognormal(
+        mean=np.asarray(self._topic_quality_mean)[topic_id],
+        sigma=np.asarray(self._topic_quality_stddev)[topic_id])
+    return document.DocumentBlock(self._doc_ctor, columns)
+
 
 def total_clicks_reward(responses):
   """Calculates the total number of clicks from a list of responses.
@@ -398,6 +525,30 @@ def create_environment(env_config):
       env_config['slate_size'],
       resample_documents=env_config['resample_documents'])
 
-  return recsim_gym.RecSimGymEnv(ieenv, total_clicks_reward,
-                                 utils.aggregate_video_cluster_metrics,
-                                 utils.write_video_cluster_metrics)
+  return recsim_gym.RecSimGymEnv(
+      ieenv,
+      total_clicks_reward,
+      utils.aggregate_video_cluster_metrics,
+      utils.write_video_cluster_metrics,
+      structured_responses=env_config.get('structured_responses', False))
+
+
+def create_batched_environment(env_config):
+  """Creates an interest exploration environment simulating a batch of users."""
+
+  document_sampler = IETopicDocumentSampler(seed=env_config['seed'])
+  IEDocument.NUM_CLUSTERS = document_sampler.num_clusters
+  IEResponse.NUM_CLUSTERS = document_sampler.num_clusters
+
+  user_model = IEBatchedUserModel(
+      env_config['num_users'],
+      env_config['slate_size'],
+      seed=env_config['seed'])
+
+  return environment.BatchedEnvironment(
+      user_model,
+      document_sampler,
+      env_config['num_candidates'],
+      env_config['slate_size'],
+      resample_documents=env_config['resample_documents'],
+      reset_terminated_users=env_config.get('reset_terminated_users', True))
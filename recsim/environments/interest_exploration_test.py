@@ -19,6 +19,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import numpy as np
+from recsim import random_streams
 from recsim.environments import interest_exploration
 import tensorflow.compat.v1 as tf
 
@@ -52,5 +53,65 @@ class InterestExplorationTest(tf.test.TestCase):
     self.assertFalse(done)
 
 
+  def test_sample_documents(self):
+    sampler = interest_exploration.IETopicDocumentSampler(seed=3)
+    block = sampler.sample_documents(50)
+    self.assertAllEqual(np.arange(50), block['doc_id'])
+    documents = block.documents()
+    self.assertLen(documents, 50)
+    self.assertAllEqual(block['cluster_id'],
+                        [doc.cluster_id for doc in documents])
+    self.assertAllEqual(block['quality'], [doc.quality for doc in documents])
+    # Sampling is reproducible for a given seed.
+    sampler.reset_sampler()
+    self.assertAllEqual(block['quality'],
+                        sampler.sample_documents(50)['quality'])
+
+
+class IEBatchedUserModelTest(tf.test.TestCase):
+
+  def test_matches_serial_model(self):
+    num_users, slate_size = 4, 3
+    serial_models = [
+        interest_exploration.IEUserModel(
+            slate_size,
+            user_state_ctor=interest_exploration.IEUserState,
+            response_model_ctor=interest_exploration.IEResponse,
+            seed=i) for i in range(num_users)
+    ]
+    batched_model = interest_exploration.IEBatchedUserModel(
+        num_users, slate_size)
+    topic_affinity = np.array(
+        [model._user_state.topic_affinity for model in serial_models])
+    batched_model._state['topic_affinity'] = topic_affinity.copy()
+    sampler = interest_exploration.IETopicDocumentSampler(seed=0)
+    for step in range(10):
+      slates = [[sampler.sample_document() for _ in range(slate_size)]
+                for _ in range(num_users)]
+      serial_clicks = []
+      for i, (model, slate) in enumerate(zip(serial_models, slates)):
+        # Serial user i draws the i-th choice of the batch.
+        model._rng = random_streams.make_stream(step)
+        model._rng.random(i)
+        responses = model.simulate_response(slate)
+        model.update_state(slate, responses)
+        serial_clicks.append([response.clicked for response in responses])
+      slate_documents = {
+          key: np.array([[getattr(doc, key) for doc in slate]
+                         for slate in slates])
+          for key in interest_exploration.IEBatchedUserModel.DOC_ATTRIBUTES
+      }
+      batched_model._rng = random_streams.make_stream(step)
+      responses = batched_model.simulate_response(slate_documents)
+      batched_model.update_state(slate_documents, responses)
+      self.assertAllEqual(serial_clicks, responses['click'])
+    # Topic affinities are static.
+    self.assertAllEqual(topic_affinity,
+                        batched_model._state['topic_affinity'])
+    self.assertAllEqual(
+        topic_affinity,
+        [model._user_state.topic_affinity for model in serial_models])
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -109,7 +109,7 @@ class LTSUserModel(user.AbstractUserModel):
 
     for doc, response in zip(slate_documents, responses):
       if response.clicked:
-        innovation = np.random.normal(scale=self._user_state.innovation_stddev)
+        innovation = self._rng.normal(scale=self._user_state.innovation_stddev)
         net_positive_exposure = (self._user_state.memory_discount
                                  * self._user_state.net_positive_exposure
                                  - 2.0 * (doc.clickbait_score - 0.5)
@@ -156,8 +156,8 @@ class LTSUserModel(user.AbstractUserModel):
     engagement_scale = (doc.clickbait_score * self._user_state.choc_stddev
                         + ((1 - doc.clickbait_score)
                            * self._user_state.kale_stddev))
-    log_engagement = np.random.normal(loc=engagement_loc,
-                                      scale=engagement_scale)
+    log_engagement = self._rng.normal(loc=engagement_loc,
+                                     scale=engagement_scale)
     response.engagement = np.exp(log_engagement)
 
 
@@ -179,6 +179,19 @@ class LTSUserState(user.AbstractUserState):
     time_budget: length of a user session.
   """
 
+  __slots__ = (
+      'memory_discount',
+      'sensitivity',
+      'innovation_stddev',
+      'choc_mean',
+      'choc_stddev',
+      'kale_mean',
+      'kale_stddev',
+      'net_positive_exposure',
+      'satisfaction',
+      'time_budget',
+  )
+
   def __init__(self, memory_discount, sensitivity, innovation_stddev,
                choc_mean, choc_stddev, kale_mean, kale_stddev,
                net_positive_exposure, time_budget
@@ -245,12 +258,134 @@ class LTSStaticUserSampler(user.AbstractUserSampler):
     super(LTSStaticUserSampler, self).__init__(user_ctor, **kwargs)
 
   def sample_user(self):
-    starting_npe = ((self._rng.random_sample() - .5) *
+    starting_npe = ((self._rng.random() - .5) *
                     (1 / (1.0 - self._state_parameters['memory_discount'])))
     self._state_parameters['net_positive_exposure'] = starting_npe
     return self._user_ctor(**self._state_parameters)
 
 
+class LTSBatchedUserModel(user.AbstractBatchedUserModel):
+  """Class to model a batch of long-term satisfaction users with array state.
+
+  Implements the dynamics of LTSUserModel with users sampled as in
+  LTSStaticUserSampler, vectorized across users. The hidden state consists of
+  [num_users] arrays of net positive exposures, satisfactions and time budgets;
+  all other parameters are shared by the users of the batch. See the
+  LTSUserModel class documentation for the meaning of the parameters.
+
+  Args:
+    num_users: An integer representing the number of users.
+    slate_size: An integer representing the size of the slate.
+    memory_discount: rate of forgetting of latent state.
+    sensitivity: magnitude of the dependence between latent state and
+      engagement.
+    innovation_stddev: noise standard deviation in latent state transitions.
+    choc_mean: mean of engagement with clickbaity content.
+    choc_stddev: standard deviation of engagement with clickbaity content.
+    kale_mean: mean of engagement with non-clickbaity content.
+    kale_stddev: standard deviation of engagement with non-clickbaity content.
+    time_budget: length of a user session.
+    seed: an integer as the seed in random sampling.
+  """
+
+  DOC_ATTRIBUTES = ('clickbait_score',)
+
+  def __init__(self,
+               num_users,
+               slate_size,
+               memory_discount=0.7,
+               sensitivity=0.01,
+               innovation_stddev=0.05,
+               choc_mean=5.0,
+               choc_stddev=1.0,
+               kale_mean=4.0,
+               kale_stddev=1.0,
+               time_budget=60,
+               seed=0):
+    self._memory_discount = memory_discount
+    self._sensitivity = sensitivity
+    self._innovation_stddev = innovation_stddev
+    self._choc_mean = choc_mean
+    self._choc_stddev = choc_stddev
+    self._kale_mean = kale_mean
+    self._kale_stddev = kale_stddev
+    self._time_budget = time_budget
+    super(LTSBatchedUserModel, self).__init__(num_users, slate_size, seed=seed)
+
+  def _sample_users(self, num_users):
+    net_positive_exposure = ((self._rng.random(num_users) - .5) *
+                             (1 / (1.0 - self._memory_discount)))
+    return {
+        'net_positive_exposure': net_positive_exposure,
+        'satisfaction': self._satisfaction(net_positive_exposure),
+        'time_budget': np.full(num_users, self._time_budget),
+    }
+
+  def _satisfaction(self, net_positive_exposure):
+    return 1 / (1.0 + np.exp(-self._sensitivity * net_positive_exposure))
+
+  def is_terminal(self):
+    """Returns a boolean array indicating which sessions are over."""
+    return self._state['time_budget'] <= 0
+
+  def simulate_response(self, slate_documents):
+    """Simulates the users' responses to a batch of slates.
+
+    Args:
+      slate_documents: A dictionary mapping DOC_ATTRIBUTES to arrays of shape
+        [num_users, slate_size].
+
+    Returns:
+      A dictionary of [num_users, slate_size] arrays for `click` and
+        `engagement`.
+    """
+    clickbait_score = slate_documents['clickbait_score']
+    # Users always click the first item.
+    clicked = np.zeros(clickbait_score.shape, dtype=np.int64)
+    clicked[:, 0] = 1
+    first_score = clickbait_score[:, 0]
+    # linear interpolation between choc and kale.
+    engagement_loc = (first_score * self._choc_mean +
+                      (1 - first_score) * self._kale_mean)
+    engagement_loc *= self._state['satisfaction']
+    engagement_scale = (first_score * self._choc_stddev +
+                        (1 - first_score) * self._kale_stddev)
+    log_engagement = self._rng.normal(loc=engagement_loc,
+                                      scale=engagement_scale)
+    engagement = np.zeros(clickbait_score.shape)
+    engagement[:, 0] = np.exp(log_engagement)
+    return {'click': clicked, 'engagement': engagement}
+
+  def update_state(self, slate_documents, responses):
+    """Updates the users' latent states based on responses to the slates.
+
+    Args:
+      slate_documents: A dictionary mapping DOC_ATTRIBUTES to arrays of shape
+        [num_users, slate_size].
+      responses: A dictionary of response arrays as returned by
+        simulate_response.
+    """
+    clicked = responses['click'].astype(bool)
+    has_click = np.any(clicked, axis=1)
+    rows = np.arange(clicked.shape[0])
+    clickbait_score = slate_documents['clickbait_score'][
+        rows, np.argmax(clicked, axis=1)]
+    innovation = self._rng.normal(
+        scale=self._innovation_stddev, size=clicked.shape[0])
+    net_positive_exposure = (
+        self._memory_discount * self._state['net_positive_exposure'] - 2.0 *
+        (clickbait_score - 0.5) + innovation)
+    self._state['net_positive_exposure'] = np.where(
+        has_click, net_positive_exposure, self._state['net_positive_exposure'])
+    self._state['satisfaction'] = self._satisfaction(
+        self._state['net_positive_exposure'])
+    self._state['time_budget'] = self._state['time_budget'] - has_click
+
+  def create_observation(self):
+    """User's state is not observable."""
+    return np.zeros((self._num_users, 0))
+
+
 class LTSResponse(user.AbstractResponse):
   """Class to represent a user's response to a document.
 
@@ -260,9 +395,13 @@ class LTSResponse(user.AbstractResponse):
     clicked: boolean indicating whether the item was clicked or not.
   """
 
+  __slots__ = ('clicked', 'engagement')
+
   # The maximum degree of engagement.
   MAX_ENGAGEMENT_MAGNITUDE = 100.0
 
+  RESPONSE_DTYPE = np.dtype([('click', np.int64), ('engagement', np.float32)])
+
   def __init__(self, clicked=False, engagement=0.0):
     """Creates a new user response for a document.
 
@@ -288,6 +427,10 @@ class LTSResponse(user.AbstractResponse):
             np.clip(self.engagement, 0, LTSResponse.MAX_ENGAGEMENT_MAGNITUDE)
     }
 
+  def to_record(self):
+    return (int(self.clicked),
+            min(max(self.engagement, 0.), LTSResponse.MAX_ENGAGEMENT_MAGNITUDE))
+
   @classmethod
   def response_space(cls):
     # `engagement` feature range is [0, MAX_ENGAGEMENT_MAGNITUDE]
@@ -311,6 +454,8 @@ class LTSDocument(document.AbstractDocument):
       document.
   """
 
+  __slots__ = ('clickbait_score',)
+
   def __init__(self, doc_id, clickbait_score):
     self.clickbait_score = clickbait_score
     # doc_id is an integer representing the unique ID of this document
@@ -339,10 +484,18 @@ class LTSDocumentSampler(document.AbstractDocumentSampler):
   def sample_document(self):
     doc_features = {}
     doc_features['doc_id'] = self._doc_count
-    doc_features['clickbait_score'] = self._rng.random_sample()
+    doc_features['clickbait_score'] = self._rng.random()
     self._doc_count += 1
     return self._doc_ctor(**doc_features)
 
+  def sample_documents(self, num_documents):
+    columns = {}
+    columns['doc_id'] = np.arange(self._doc_count,
+                                  self._doc_count + num_documents)
+    columns['clickbait_score'] = self._rng.random(num_documents)
+    self._doc_count += num_documents
+    return document.DocumentBlock(self._doc_ctor, columns)
+
 
 def clicked_engagement_reward(responses):
   """Calculates the total clicked watchtime from a list of responses.
@@ -366,9 +519,10 @@ def create_environment(env_config):
   user_model = LTSUserModel(
       env_config['slate_size'],
       user_state_ctor=LTSUserState,
-      response_model_ctor=LTSResponse)
+      response_model_ctor=LTSResponse,
+      seed=env_config.get('seed', 0))
 
-  document_sampler = LTSDocumentSampler()
+  document_sampler = LTSDocumentSampler(seed=env_config.get('seed', 0))
 
   ltsenv = environment.Environment(
       user_model,
@@ -377,4 +531,26 @@ def create_environment(env_config):
       env_config['slate_size'],
       resample_documents=env_config['resample_documents'])
 
-  return recsim_gym.RecSimGymEnv(ltsenv, clicked_engagement_reward)
+  return recsim_gym.RecSimGymEnv(
+      ltsenv,
+      clicked_engagement_reward,
+      structured_responses=env_config.get('structured_responses', False))
+
+
+def create_batched_environment(env_config):
+  """Creates a batched long-term satisfaction environment."""
+
+  user_model = LTSBatchedUserModel(
+      env_config['num_users'],
+      env_config['slate_size'],
+      seed=env_config.get('seed', 0))
+
+  document_sampler = LTSDocumentSampler(seed=env_config.get('seed', 0))
+
+  return environment.BatchedEnvironment(
+      user_model,
+      document_sampler,
+      env_config['num_candidates'],
+      env_config['slate_size'],
+      resample_documents=env_config['resample_documents'],
+      reset_terminated_users=env_config.get('reset_terminated_users', True))
@@ -38,7 +38,7 @@ from recsim.simulator import runner_lib
 FLAGS = flags.FLAGS
 
 
-def create_agent(sess, environment, eval_mode, summary_writer=None):
+def create_agent(sess, environment, eval_mode, summary_writer=None, **kwargs):
   """Creates an instance of FullSlateQAgent.
 
   Args:
@@ -47,16 +47,18 @@ def create_agent(sess, environment, eval_mode, summary_writer=None):
     eval_mode: A bool for whether the agent is in training or evaluation mode.
     summary_writer: A Tensorflow summary writer to pass to the agent for
       in-agent training statistics in Tensorboard.
+    **kwargs: Additional keyword arguments to the agent, e.g. the replay
+      settings of the actor/learner mode.
 
   Returns:
     An instance of FullSlateQAgent.
   """
-  kwargs = {
+  kwargs.update({
       'observation_space': environment.observation_space,
       'action_space': environment.action_space,
       'summary_writer': summary_writer,
       'eval_mode': eval_mode,
-  }
+  })
   return full_slate_q_agent.FullSlateQAgent(sess, **kwargs)
 
 
@@ -80,6 +82,7 @@ def main(argv):
       create_agent_fn=create_agent,
       env=interest_evolution.create_environment(env_config),
       episode_log_file=FLAGS.episode_log_file,
+      episode_log_format=FLAGS.episode_log_format,
       max_training_steps=50,
       num_iterations=10)
   runner.run_experiment()
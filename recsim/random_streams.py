@@ -0,0 +1,157 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Splittable random number streams for RecSim simulations.
+
+Every source of randomness in the simulator (document and user samplers, user
+dynamics and choice models) draws from its own numpy.random.Generator. The
+streams are identified by a root seed and a key, i.e. a tuple of non-negative
+integers such as (episode, user). Two streams with the same seed and key
+produce the same numbers no matter in which order or process they are created.
+Environments key the streams of their samplers by episode, so that sharded and
+serial runs of the same episodes are identical. Batched user models draw the
+whole batch from one stream and do not reproduce serial simulations.
+
+Streams replace the np.random.RandomState that samplers and user models used
+to hold in their `_rng` attribute. Streams also accept the common RandomState
+methods (randint, rand, randn, random_sample), so subclasses calling them keep
+working, but the numbers drawn for a given seed differ from RandomState's.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# Bit generators that can back a stream. PCG64 is the numpy default; Philox is
+# counter-based and cheap to split into many streams.
+BIT_GENERATORS = {
+    'pcg64': np.random.PCG64,
+    'philox': np.random.Philox,
+}
+
+
+class RandomStream(np.random.Generator):
+  """A np.random.Generator also accepting the legacy RandomState methods."""
+
+  def randint(self, low, high=None, size=None, dtype=int):
+    """Draws integers as RandomState.randint, from the stream."""
+    return self.integers(low, high, size=size, dtype=dtype)
+
+  def rand(self, *shape):
+    """Draws uniform floats as RandomState.rand, from the stream."""
+    return self.random(shape or None)
+
+  def randn(self, *shape):
+    """Draws standard normals as RandomState.randn, from the stream."""
+    return self.standard_normal(shape or None)
+
+  def random_sample(self, size=None):
+    """Draws uniform floats as RandomState.random_sample, from the stream."""
+    return self.random(size)
+
+  def __reduce__(self):
+    # np.random.Generator pickles as a Generator, losing the subclass.
+    return self.__class__, (self.bit_generator,)
+
+
+def seed_sequence(seed=0, key=()):
+  """Returns the numpy SeedSequence of the stream (seed, key).
+
+  Args:
+    seed: An integer, or a np.random.SeedSequence in which case key is appended
+      to its spawn key.
+    key: A tuple of non-negative integers identifying the stream.
+
+  Returns:
+    A np.random.SeedSequence.
+  """
+  key = tuple(int(k) for k in key)
+  if isinstance(seed, np.random.SeedSequence):
+    return np.random.SeedSequence(
+        seed.entropy,
+        spawn_key=tuple(seed.spawn_key) + key,
+        pool_size=seed.pool_size)
+  return np.random.SeedSequence(seed, spawn_key=key)
+
+
+def make_stream(seed=0, key=(), bit_generator='pcg64'):
+  """Creates the random number stream (seed, key).
+
+  Args:
+    seed: An integer or a np.random.SeedSequence.
+    key: A tuple of non-negative integers identifying the stream.
+    bit_generator: The name of the bit generator, one of BIT_GENERATORS.
+
+  Returns:
+    A RandomStream, i.e. a np.random.Generator.
+
+  Raises:
+    ValueError: if bit_generator is unknown.
+  """
+  if bit_generator not in BIT_GENERATORS:
+    raise ValueError('Unknown bit generator %s, must be one of %s.' %
+                     (bit_generator, sorted(BIT_GENERATORS)))
+  return RandomStream(BIT_GENERATORS[bit_generator](seed_sequence(seed, key)))
+
+
+class RandomStreams(object):
+  """A factory of independent random number streams rooted at a seed.
+
+  Streams are addressed by keys and can be split hierarchically, e.g.
+
+    streams = RandomStreams(seed)
+    worker_streams = streams.split(worker_id)
+    rng = worker_streams.stream(episode, user)
+
+  produces the same generator as streams.stream(worker_id, episode, user).
+  """
+
+  def __init__(self, seed=0, bit_generator='pcg64'):
+    """Creates a new stream factory.
+
+    Args:
+      seed: An integer or a np.random.SeedSequence.
+      bit_generator: The name of the bit generator, one of BIT_GENERATORS.
+
+    Raises:
+      ValueError: if bit_generator is unknown.
+    """
+    if bit_generator not in BIT_GENERATORS:
+      raise ValueError('Unknown bit generator %s, must be one of %s.' %
+                       (bit_generator, sorted(BIT_GENERATORS)))
+    self._seed_sequence = seed_sequence(seed)
+    self._bit_generator = bit_generator
+
+  def seed_sequence(self, *key):
+    """Returns the SeedSequence of the stream with the given key."""
+    return seed_sequence(self._seed_sequence, key)
+
+  def stream(self, *key):
+    """Returns a new RandomStream for the stream with the given key."""
+    return make_stream(self._seed_sequence, key, self._bit_generator)
+
+  def split(self, *key):
+    """Returns a RandomStreams rooted at the given key."""
+    return RandomStreams(self.seed_sequence(*key), self._bit_generator)
+
+  def integer_seed(self, *key):
+    """Returns a 32-bit integer seed derived from the stream with the key.
+
+    This is useful to pass seeds through configuration that must be plain
+    Python objects, e.g. environment configs sent to worker processes.
+    """
+    return int(self.seed_sequence(*key).generate_state(1)[0])
@@ -0,0 +1,101 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.random_streams."""
+
+import pickle
+
+import numpy as np
+from recsim import random_streams
+from recsim.environments import long_term_satisfaction as lts
+import tensorflow.compat.v1 as tf
+
+
+class RandomStreamsTest(tf.test.TestCase):
+
+  def test_streams_are_reproducible(self):
+    for bit_generator in random_streams.BIT_GENERATORS:
+      streams = random_streams.RandomStreams(7, bit_generator=bit_generator)
+      self.assertAllEqual(
+          streams.stream(1, 2).random(10),
+          random_streams.RandomStreams(
+              7, bit_generator=bit_generator).stream(1, 2).random(10))
+
+  def test_split(self):
+    streams = random_streams.RandomStreams(7)
+    self.assertAllEqual(
+        streams.split(1).stream(2).random(10),
+        streams.stream(1, 2).random(10))
+    self.assertEqual(streams.split(1).integer_seed(2),
+                     streams.integer_seed(1, 2))
+
+  def test_keys_give_independent_streams(self):
+    streams = random_streams.RandomStreams(7)
+    self.assertNotAllClose(
+        streams.stream(0).random(10),
+        streams.stream(1).random(10))
+    self.assertNotAllClose(
+        streams.stream().random(10),
+        streams.stream(0).random(10))
+
+  def test_make_stream(self):
+    self.assertAllEqual(
+        random_streams.make_stream(7, (3,)).random(10),
+        random_streams.RandomStreams(7).stream(3).random(10))
+
+  def test_legacy_random_state_methods(self):
+    stream = random_streams.make_stream(7)
+    self.assertIsInstance(stream, np.random.Generator)
+    self.assertEqual((2, 3), stream.rand(2, 3).shape)
+    self.assertEqual((4,), stream.randn(4).shape)
+    self.assertEqual((5,), stream.random_sample(5).shape)
+    self.assertTrue(np.all(stream.randint(3, size=10) < 3))
+    # The legacy methods draw from the stream.
+    self.assertAllEqual(
+        random_streams.make_stream(7).randint(100, size=10),
+        random_streams.make_stream(7).integers(100, size=10))
+    copied = pickle.loads(pickle.dumps(stream))
+    self.assertIsInstance(copied, random_streams.RandomStream)
+    self.assertAllEqual(stream.rand(10), copied.rand(10))
+
+  def test_unknown_bit_generator(self):
+    with self.assertRaises(ValueError):
+      random_streams.RandomStreams(0, bit_generator='mt19937')
+
+  def test_user_model_ignores_global_random_state(self):
+    documents = [lts.LTSDocument(i, clickbait_score=0.5) for i in range(3)]
+
+    def rollout():
+      user_model = lts.LTSUserModel(
+          slate_size=3,
+          user_state_ctor=lts.LTSUserState,
+          response_model_ctor=lts.LTSResponse,
+          seed=5)
+      engagements = []
+      for _ in range(5):
+        np.random.seed(np.random.randint(1000))
+        responses = user_model.simulate_response(documents)
+        user_model.update_state(documents, responses)
+        engagements.extend(response.engagement for response in responses)
+      return engagements
+
+    np.random.seed(0)
+    first = rollout()
+    np.random.seed(1)
+    self.assertAllEqual(first, rollout())
+
+
+if __name__ == '__main__':
+  tf.test.main()
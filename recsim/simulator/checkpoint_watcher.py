@@ -0,0 +1,170 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Discovery of new training checkpoints.
+
+A checkpoint is complete once the Dopamine checkpointer has written its
+sentinel file, sentinel_checkpoint_complete.<version>. The CheckpointWatcher
+reports every new version in the checkpoint directory. On Linux, it waits for
+changes of the directory with inotify (called through ctypes), so that new
+checkpoints are seen as soon as they are written. Elsewhere, or for
+directories inotify cannot watch, it falls back to polling the directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+import tensorflow.compat.v1 as tf
+
+_SENTINEL_PREFIX = 'sentinel_checkpoint_complete.'
+
+# inotify events signaling that a file may have been added to the directory.
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+
+def _load_libc_with_inotify():
+  """Returns the C library if it provides inotify, else None."""
+  if not sys.platform.startswith('linux'):
+    return None
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno=True)
+  except OSError:
+    return None
+  if not hasattr(libc, 'inotify_init1'):
+    return None
+  return libc
+
+
+class CheckpointWatcher(object):
+  """Reports new checkpoint versions in a checkpoint directory.
+
+  Attributes:
+    using_inotify: bool, whether the directory is currently watched with
+      inotify rather than polled.
+  """
+
+  def __init__(self, checkpoint_dir, poll_interval_secs, use_inotify=True):
+    """Initializes a CheckpointWatcher.
+
+    Args:
+      checkpoint_dir: str, the directory holding the checkpoints. It need not
+        exist yet.
+      poll_interval_secs: float, the number of seconds between scans of the
+        directory when polling. With inotify, the directory is still scanned
+        at this interval, in case a change went unnoticed.
+      use_inotify: bool, whether to use inotify when it is available.
+    """
+    self._checkpoint_dir = checkpoint_dir
+    self._poll_interval_secs = poll_interval_secs
+    self._libc = _load_libc_with_inotify() if use_inotify else None
+    self._fd = None
+    self._seen_versions = set()
+
+  @property
+  def using_inotify(self):
+    return self._fd is not None
+
+  def _watch(self):
+    """Starts watching the directory with inotify if possible."""
+    if self._fd is not None or self._libc is None:
+      return
+    if not os.path.isdir(self._checkpoint_dir):
+      # Not created yet, or not on a local file system.
+      return
+    fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+      tf.logging.warning('inotify is unavailable (errno %d), polling %s.',
+                         ctypes.get_errno(), self._checkpoint_dir)
+      self._libc = None
+      return
+    if self._libc.inotify_add_watch(
+        fd, os.fsencode(self._checkpoint_dir), _WATCH_MASK) < 0:
+      tf.logging.warning('Cannot watch %s with inotify (errno %d), polling.',
+                         self._checkpoint_dir, ctypes.get_errno())
+      os.close(fd)
+      self._libc = None
+      return
+    self._fd = fd
+
+  def _drain_events(self):
+    """Discards the pending inotify events; the directory is rescanned."""
+    try:
+      while os.read(self._fd, 65536):
+        pass
+    except BlockingIOError:
+      pass
+
+  def _versions(self):
+    """Returns the versions of the complete checkpoints in the directory."""
+    if not tf.io.gfile.isdir(self._checkpoint_dir):
+      return []
+    versions = []
+    for filename in tf.io.gfile.listdir(self._checkpoint_dir):
+      if filename.startswith(_SENTINEL_PREFIX):
+        version = filename[len(_SENTINEL_PREFIX):]
+        if version.isdigit():
+          versions.append(int(version))
+    return versions
+
+  def wait_for_new_versions(self, timeout=None):
+    """Waits for checkpoints that have not been reported yet.
+
+    Args:
+      timeout: float, the number of seconds to wait for a new checkpoint. If
+        None, waits until there is one.
+
+    Returns:
+      The list of new checkpoint versions in increasing order, empty if the
+        timeout elapsed.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+      # Watching starts before scanning, so that no checkpoint written in
+      # between is missed.
+      self._watch()
+      new_versions = sorted(
+          set(self._versions()).difference(self._seen_versions))
+      if new_versions:
+        self._seen_versions.update(new_versions)
+        return new_versions
+      wait_secs = self._poll_interval_secs
+      if deadline is not None:
+        wait_secs = min(wait_secs, deadline - time.time())
+        if wait_secs <= 0:
+          return []
+      if self._fd is not None:
+        ready, _, _ = select.select([self._fd], [], [], wait_secs)
+        if ready:
+          self._drain_events()
+      else:
+        time.sleep(wait_secs)
+
+  def close(self):
+    """Stops watching the directory."""
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
@@ -0,0 +1,82 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.checkpoint_watcher."""
+
+import os
+import sys
+import threading
+import time
+
+from recsim.simulator import checkpoint_watcher
+import tensorflow.compat.v1 as tf
+
+
+def _write_sentinel(checkpoint_dir, version):
+  with open(
+      os.path.join(checkpoint_dir,
+                   'sentinel_checkpoint_complete.%d' % version), 'w') as f:
+    f.write('done')
+
+
+class CheckpointWatcherTest(tf.test.TestCase):
+
+  def _check_watcher(self, use_inotify):
+    checkpoint_dir = os.path.join(self.get_temp_dir(), str(use_inotify))
+    os.makedirs(checkpoint_dir)
+    _write_sentinel(checkpoint_dir, 0)
+    _write_sentinel(checkpoint_dir, 1)
+    with open(os.path.join(checkpoint_dir, 'ckpt.2'), 'w') as f:
+      f.write('not complete')
+    # A long poll interval: only inotify sees new checkpoints quickly.
+    watcher = checkpoint_watcher.CheckpointWatcher(
+        checkpoint_dir, 0.5 if not use_inotify else 60,
+        use_inotify=use_inotify)
+    self.assertEqual(watcher.wait_for_new_versions(), [0, 1])
+    self.assertEqual(watcher.wait_for_new_versions(timeout=0.1), [])
+    self.assertEqual(watcher.using_inotify, use_inotify)
+
+    writer = threading.Timer(
+        0.2, lambda: [_write_sentinel(checkpoint_dir, v) for v in [2, 3]])
+    writer.start()
+    start_time = time.time()
+    versions = watcher.wait_for_new_versions()
+    while versions[-1] != 3:
+      versions += watcher.wait_for_new_versions()
+    self.assertEqual(versions, [2, 3])
+    self.assertLess(time.time() - start_time, 10)
+    writer.join()
+    watcher.close()
+
+  def test_inotify(self):
+    if not sys.platform.startswith('linux'):
+      self.skipTest('inotify is only available on Linux.')
+    self._check_watcher(use_inotify=True)
+
+  def test_polling(self):
+    self._check_watcher(use_inotify=False)
+
+  def test_directory_created_later(self):
+    checkpoint_dir = os.path.join(self.get_temp_dir(), 'later')
+    watcher = checkpoint_watcher.CheckpointWatcher(checkpoint_dir, 0.1)
+    self.assertEqual(watcher.wait_for_new_versions(timeout=0.2), [])
+    os.makedirs(checkpoint_dir)
+    _write_sentinel(checkpoint_dir, 5)
+    self.assertEqual(watcher.wait_for_new_versions(timeout=5), [5])
+    watcher.close()
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -35,10 +35,11 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
-import collections
 import itertools
 
 from recsim import document
+from recsim.simulator import profiler
+import numpy as np
 import six
 
 
@@ -78,6 +79,8 @@ class AbstractEnvironment(object):
     self._slate_size = slate_size
     self._num_candidates = num_candidates
     self._resample_documents = resample_documents
+    # Index of the next episode, which keys its random streams.
+    self._episode = 0
 
     # Create a candidate set.
     self._do_resample_documents()
@@ -87,9 +90,11 @@ class AbstractEnvironment(object):
 
   def _do_resample_documents(self):
     # TODO(sanmit): eventually model this creation with content creators.
-    self._candidate_set = document.CandidateSet()
-    for _ in range(self._num_candidates):
-      self._candidate_set.add_document(self._document_sampler.sample_document())
+    self._candidate_set = document.CandidateSet(self._num_candidates)
+    self._document_block = self._document_sampler.sample_documents(
+        self._num_candidates)
+    for doc in self._document_block.documents():
+      self._candidate_set.add_document(doc)
 
   @abc.abstractmethod
   def reset(self):
@@ -102,8 +107,27 @@ class AbstractEnvironment(object):
     """
 
   @abc.abstractmethod
-  def reset_sampler(self):
-    """Resets the relevant samplers of documents and user/users."""
+  def reset_sampler(self, episode=0):
+    """Resets the relevant samplers of documents and user/users.
+
+    Args:
+      episode: An integer, the index of the next episode. Running episodes
+        [k, n) after reset_sampler(k) simulates them as they are simulated
+        after reset_sampler(), so that a sequence of episodes can be sharded.
+    """
+
+  def _key_episode_streams(self, user_models):
+    """Keys the random streams of the samplers by the episode that starts.
+
+    Args:
+      user_models: A list of AbstractUserModels. The document sampler stream
+        is keyed by (episode,) and the streams of user_models[i] by
+        (episode, i).
+    """
+    self._document_sampler.reset_sampler((self._episode,))
+    for i, user_model in enumerate(user_models):
+      user_model.reset_sampler((self._episode, i))
+    self._episode += 1
 
   @property
   def num_candidates(self):
@@ -157,18 +181,19 @@ class SingleUserEnvironment(AbstractEnvironment):
         current state
       doc_obs: An OrderedDict of document observations keyed by document ids
     """
+    self._key_episode_streams([self._user_model])
     self._user_model.reset()
     user_obs = self._user_model.create_observation()
     if self._resample_documents:
       self._do_resample_documents()
-    self._current_documents = collections.OrderedDict(
-        self._candidate_set.create_observation())
+    self._current_documents = self._candidate_set.create_observation()
     return (user_obs, self._current_documents)
 
-  def reset_sampler(self):
+  def reset_sampler(self, episode=0):
     """Resets the relevant samplers of documents and user/users."""
     self._document_sampler.reset_sampler()
     self._user_model.reset_sampler()
+    self._episode = episode
 
   def step(self, slate):
     """Executes the action, returns next state observation and reward.
@@ -189,17 +214,18 @@ class SingleUserEnvironment(AbstractEnvironment):
                self._slate_size, len(slate))
 
     # Get the documents associated with the slate
-    doc_ids = list(self._current_documents)  # pytype: disable=attribute-error
-    mapped_slate = [doc_ids[x] for x in slate]
-    documents = self._candidate_set.get_documents(mapped_slate)
+    documents = self._candidate_set.get_documents_by_index(slate)
     # Simulate the user's response
-    responses = self._user_model.simulate_response(documents)
+    with profiler.span('environment/simulate_response'):
+      responses = self._user_model.simulate_response(documents)
 
     # Update the user's state.
-    self._user_model.update_state(documents, responses)
+    with profiler.span('environment/update_state'):
+      self._user_model.update_state(documents, responses)
 
     # Update the documents' state.
-    self._document_sampler.update_state(documents, responses)
+    with profiler.span('environment/update_documents'):
+      self._document_sampler.update_state(documents, responses)
 
     # Obtain next user state observation.
     user_obs = self._user_model.create_observation()
@@ -210,11 +236,12 @@ class SingleUserEnvironment(AbstractEnvironment):
     # Optionally, recreate the candidate set to simulate candidate
     # generators for the next query.
     if self._resample_documents:
-      self._do_resample_documents()
+      with profiler.span('environment/resample_documents'):
+        self._do_resample_documents()
 
     # Create observation of candidate set.
-    self._current_documents = collections.OrderedDict(
-        self._candidate_set.create_observation())
+    with profiler.span('environment/observe_documents'):
+      self._current_documents = self._candidate_set.create_observation()
 
     return (user_obs, self._current_documents, responses, done)
 
@@ -225,6 +252,11 @@ Environment = SingleUserEnvironment  # for backwards compatability
 class MultiUserEnvironment(AbstractEnvironment):
   """Class to represent environment with multiple users.
 
+  Users are simulated one after the other. For user models with a batched
+  implementation, BatchedEnvironment with reset_terminated_users=False
+  simulates all users in a handful of vectorized operations per step, with the
+  same episodic semantics.
+
   Attributes:
     user_model: A list of AbstractUserModel instances that represent users.
     num_users: An integer representing the number of users.
@@ -243,6 +275,7 @@ class MultiUserEnvironment(AbstractEnvironment):
         current state
       doc_obs: An OrderedDict of document observations keyed by document ids
     """
+    self._key_episode_streams(self.user_model)
     for user_model in self.user_model:
       user_model.reset()
     user_obs = [
@@ -250,14 +283,14 @@ class MultiUserEnvironment(AbstractEnvironment):
     ]
     if self._resample_documents:
       self._do_resample_documents()
-    self._current_documents = collections.OrderedDict(
-        self._candidate_set.create_observation())
+    self._current_documents = self._candidate_set.create_observation()
     return (user_obs, self._current_documents)
 
-  def reset_sampler(self):
+  def reset_sampler(self, episode=0):
     self._document_sampler.reset_sampler()
     for user_model in self.user_model:
       user_model.reset_sampler()
+    self._episode = episode
 
   @property
   def num_users(self):
@@ -291,17 +324,17 @@ class MultiUserEnvironment(AbstractEnvironment):
     all_responses = []  # Accumulate each user's responses to served documents.
     for user_model, slate in zip(self.user_model, slates):
       # Get the documents associated with the slate
-      doc_ids = list(self._current_documents)  # pytype: disable=attribute-error
-      mapped_slate = [doc_ids[x] for x in slate]
-      documents = self._candidate_set.get_documents(mapped_slate)
+      documents = self._candidate_set.get_documents_by_index(slate)
       if user_model.is_terminal():
         responses = []
       else:
         # Simulate the user's response
-        responses = user_model.simulate_response(documents)
+        with profiler.span('environment/simulate_response'):
+          responses = user_model.simulate_response(documents)
 
         # Update the user's state.
-        user_model.update_state(documents, responses)
+        with profiler.span('environment/update_state'):
+          user_model.update_state(documents, responses)
 
       # Obtain next user state observation.
       all_user_obs.append(user_model.create_observation())
@@ -312,8 +345,9 @@ class MultiUserEnvironment(AbstractEnvironment):
       return list(itertools.chain(*list_))
 
     # Update the documents' state.
-    self._document_sampler.update_state(
-        flatten(all_documents), flatten(all_responses))
+    with profiler.span('environment/update_documents'):
+      self._document_sampler.update_state(
+          flatten(all_documents), flatten(all_responses))
 
     # Check if reaches a terminal state and return.
     done = all([user_model.is_terminal() for user_model in self.user_model])
@@ -321,10 +355,189 @@ class MultiUserEnvironment(AbstractEnvironment):
     # Optionally, recreate the candidate set to simulate candidate
     # generators for the next query.
     if self._resample_documents:
-      self._do_resample_documents()
+      with profiler.span('environment/resample_documents'):
+        self._do_resample_documents()
 
     # Create observation of candidate set.
-    self._current_documents = collections.OrderedDict(
-        self._candidate_set.create_observation())
+    with profiler.span('environment/observe_documents'):
+      self._current_documents = self._candidate_set.create_observation()
 
     return (all_user_obs, self._current_documents, all_responses, done)
+
+
+def _stack_document_observations(documents):
+  """Stacks document observations into arrays with a leading document axis."""
+  observations = [doc.create_observation() for doc in documents]
+  if observations and isinstance(observations[0], dict):
+    return {
+        key: np.array([obs[key] for obs in observations])
+        for key in observations[0]
+    }
+  return np.array(observations)
+
+
+class BatchedEnvironment(AbstractEnvironment):
+  """Class to represent an environment simulating a batch of users at once.
+
+  All users share the same candidate set. The users' hidden states are held by
+  an AbstractBatchedUserModel as struct-of-arrays, so that simulating a step
+  for the whole batch costs a handful of NumPy calls rather than a Python loop
+  over user and response objects. By default, sessions that terminate are
+  automatically reset: the done mask returned by step indicates which users
+  finished, and the corresponding rows of the returned user observation already
+  belong to freshly sampled users.
+
+  With reset_terminated_users=False, the environment instead follows the
+  episodic semantics of MultiUserEnvironment: all users start together on
+  reset, and users whose session is over are frozen by a terminal mask until
+  the next reset, i.e. their states are no longer updated and their responses
+  are all zero. The episode is over once the done mask returned by step is all
+  True. Document states are not updated, i.e. the document sampler is assumed
+  to be stateless.
+
+  Attributes:
+    user_model: An instantiation of AbstractBatchedUserModel.
+    num_users: An integer representing the number of users.
+    document_sampler: An instantiation of AbstractDocumentSampler.
+    num_candidates: An integer representing the size of the candidate_set.
+    slate_size: An integer representing the slate size.
+    candidate_set: An instantiation of CandidateSet.
+  """
+
+  def __init__(self,
+               user_model,
+               document_sampler,
+               num_candidates,
+               slate_size,
+               resample_documents=True,
+               reset_terminated_users=True):
+    """Initializes a new batched simulation environment.
+
+    Args:
+      user_model: An instantiation of AbstractBatchedUserModel
+      document_sampler: An instantiation of AbstractDocumentSampler
+      num_candidates: An integer representing the size of the candidate_set
+      slate_size: An integer representing the slate size
+      resample_documents: A boolean indicating whether to resample the candidate
+        set every step
+      reset_terminated_users: A boolean indicating whether to reset the users
+        whose session terminates, rather than freezing them until the next
+        reset
+    """
+    self._reset_terminated_users = reset_terminated_users
+    super(BatchedEnvironment, self).__init__(
+        user_model,
+        document_sampler,
+        num_candidates,
+        slate_size,
+        resample_documents=resample_documents)
+
+  def _do_resample_documents(self):
+    super(BatchedEnvironment, self)._do_resample_documents()
+    # Columnar view of the document attributes consumed by the user dynamics,
+    # indexed by the position of the document in the candidate set.
+    self._document_features = {
+        attribute: self._document_block[attribute]
+        for attribute in self._user_model.DOC_ATTRIBUTES
+    }
+    self._current_documents = _stack_document_observations(
+        self._candidate_set.get_all_documents())
+
+  def reset(self):
+    """Resets the environment and return the first observation.
+
+    Returns:
+      user_obs: An array of shape [num_users, ...] representing observations of
+        the users' current states
+      doc_obs: An array (or dictionary of arrays) of shape
+        [num_candidates, ...] of document observations
+    """
+    self._user_model.reset()
+    user_obs = self._user_model.create_observation()
+    if self._resample_documents:
+      self._do_resample_documents()
+    return (user_obs, self._current_documents)
+
+  def reset_sampler(self, episode=0):
+    """Resets the relevant samplers of documents and users.
+
+    The batch draws from a single stream per sampler, so the streams are keyed
+    by the first episode only: sharded runs draw independent batches, but do
+    not reproduce the batches of a run that is not sharded.
+
+    Args:
+      episode: An integer, the index of the next episode.
+    """
+    key = (episode,) if episode else ()
+    self._document_sampler.reset_sampler(key)
+    self._user_model.reset_sampler(key)
+
+  @property
+  def num_users(self):
+    return self._user_model.num_users
+
+  def step(self, slates):
+    """Executes the actions, returns next state observations and responses.
+
+    Args:
+      slates: An integer array of shape [num_users, slate_size], where each
+        element is an index into the set of current_documents presented.
+
+    Returns:
+      user_obs: An array of shape [num_users, ...] representing the users' next
+        states
+      doc_obs: An array (or dictionary of arrays) of shape
+        [num_candidates, ...] of document observations
+      responses: A dictionary mapping response names to arrays of shape
+        [num_users, slate_size]
+      done: A boolean array of shape [num_users] indicating which users'
+        sessions terminated at this step (and were reset) or, without
+        reset_terminated_users, which users' sessions are over
+    """
+    slates = np.asarray(slates, dtype=np.int64)
+    assert (slates.ndim == 2 and slates.shape[0] == self.num_users
+           ), 'Received unexpected slates shape: expecting [%s, %s], got %s' % (
+               self.num_users, self._slate_size, slates.shape)
+    assert (slates.shape[1] <= self._slate_size
+           ), 'Received unexpectedly large slate size: expecting %s, got %s' % (
+               self._slate_size, slates.shape[1])
+
+    # Get the features of the documents in each slate.
+    slate_documents = {
+        attribute: features[slates]
+        for attribute, features in self._document_features.items()
+    }
+    # Simulate the users' responses and update their states.
+    if self._reset_terminated_users:
+      with profiler.span('environment/simulate_response'):
+        responses = self._user_model.simulate_response(slate_documents)
+      with profiler.span('environment/update_state'):
+        self._user_model.update_state(slate_documents, responses)
+      # Check which users reached a terminal state and start new sessions.
+      done = self._user_model.is_terminal()
+      self._user_model.reset(done)
+    else:
+      # Users whose session is over respond with zeros and keep their state.
+      terminal = self._user_model.is_terminal()
+      with profiler.span('environment/simulate_response'):
+        responses = self._user_model.simulate_response(slate_documents)
+        if np.any(terminal):
+          responses = {
+              key: np.where(terminal[:, np.newaxis], np.zeros_like(value),
+                            value) for key, value in responses.items()
+          }
+      with profiler.span('environment/update_state'):
+        self._user_model.masked_update_state(slate_documents, responses,
+                                             ~terminal)
+      done = self._user_model.is_terminal()
+
+    # Obtain next user state observations.
+    user_obs = self._user_model.create_observation()
+
+    # Optionally, recreate the candidate set to simulate candidate
+    # generators for the next query.
+    if self._resample_documents:
+      with profiler.span('environment/resample_documents'):
+        self._do_resample_documents()
+
+    return (user_obs, self._current_documents, responses, done)
@@ -16,7 +16,9 @@
 """Tests for recsim.environment."""
 
 import numpy as np
+from recsim import random_streams
 from recsim.environments import interest_exploration as ie
+from recsim.environments import long_term_satisfaction as lts
 from recsim.simulator import environment
 import tensorflow.compat.v1 as tf
 
@@ -59,6 +61,24 @@ class EnvironmentTest(tf.test.TestCase):
     ], sorted(documents.keys()))
     self.assertFalse(done)
 
+  def _run_episode(self, env):
+    _, documents = env.reset()
+    trajectory = [[doc['quality'] for doc in documents.values()]]
+    for _ in range(3):
+      _, documents, responses, _ = env.step([0, 1])
+      trajectory.append([doc['quality'] for doc in documents.values()])
+      trajectory.append([response.to_record() for response in responses])
+    return trajectory
+
+  def test_sharded_episodes(self):
+    self._environment.reset_sampler()
+    trajectories = [self._run_episode(self._environment) for _ in range(3)]
+    self.setUp()
+    # Episodes are simulated the same way when they do not run first.
+    self._environment.reset_sampler(episode=2)
+    self.assertEqual(trajectories[2], self._run_episode(self._environment))
+    self.assertNotEqual(trajectories[1], trajectories[2])
+
 
 class MultiUserEnvironmentTest(tf.test.TestCase):
 
@@ -103,6 +123,122 @@ class MultiUserEnvironmentTest(tf.test.TestCase):
     self.assertFalse(done)
 
 
+class BatchedEnvironmentTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BatchedEnvironmentTest, self).setUp()
+    self._slate_size = 2
+    self._num_candidates = 20
+    self._num_users = 100
+    user_model = ie.IEBatchedUserModel(self._num_users, self._slate_size)
+    document_sampler = ie.IETopicDocumentSampler()
+    self._environment = environment.BatchedEnvironment(
+        user_model, document_sampler, self._num_candidates, self._slate_size)
+
+  def test_batched_environment(self):
+    user_obs, documents = self._environment.reset()
+    self.assertAllEqual((self._num_users, 0), user_obs.shape)
+    self.assertAllEqual((self._num_candidates,),
+                        documents['cluster_id'].shape)
+    slates = np.tile(np.arange(self._slate_size), (self._num_users, 1))
+    user_obs, documents, responses, done = self._environment.step(slates)
+    self.assertAllEqual((self._num_users, 0), user_obs.shape)
+    self.assertAllEqual((self._num_candidates,), documents['quality'].shape)
+    for response in responses.values():
+      self.assertAllEqual((self._num_users, self._slate_size), response.shape)
+    self.assertLessEqual(np.max(np.sum(responses['click'], axis=1)), 1)
+    self.assertAllEqual(np.zeros(self._num_users, dtype=bool), done)
+
+  def test_auto_reset(self):
+    user_model = lts.LTSBatchedUserModel(
+        self._num_users, self._slate_size, time_budget=2)
+    batched_env = environment.BatchedEnvironment(
+        user_model, lts.LTSDocumentSampler(), self._num_candidates,
+        self._slate_size)
+    batched_env.reset()
+    slates = np.tile(np.arange(self._slate_size), (self._num_users, 1))
+    _, _, responses, done = batched_env.step(slates)
+    self.assertAllEqual(np.ones(self._num_users), responses['click'][:, 0])
+    self.assertFalse(np.any(done))
+    _, _, _, done = batched_env.step(slates)
+    self.assertTrue(np.all(done))
+    # Finished users have been replaced by fresh sessions.
+    self.assertFalse(np.any(user_model.is_terminal()))
+
+  def test_lts_matches_serial_model(self):
+    num_users = 3
+    serial_models = [
+        lts.LTSUserModel(
+            self._slate_size,
+            user_state_ctor=lts.LTSUserState,
+            response_model_ctor=lts.LTSResponse,
+            seed=i) for i in range(num_users)
+    ]
+    batched_model = lts.LTSBatchedUserModel(num_users, self._slate_size)
+    state_keys = ['net_positive_exposure', 'satisfaction', 'time_budget']
+
+    def serial_state(key):
+      return np.array(
+          [getattr(model._user_state, key) for model in serial_models])
+
+    for key in state_keys:
+      batched_model._state[key] = serial_state(key)
+    sampler = lts.LTSDocumentSampler(seed=0)
+    for step in range(5):
+      slates = [[sampler.sample_document() for _ in range(self._slate_size)]
+                for _ in range(num_users)]
+      engagement = []
+      for i, (model, slate) in enumerate(zip(serial_models, slates)):
+        # Serial user i draws the i-th engagement and innovation of the batch.
+        model._rng = random_streams.make_stream(step, (0,))
+        model._rng.standard_normal(i)
+        responses = model.simulate_response(slate)
+        model._rng = random_streams.make_stream(step, (1,))
+        model._rng.standard_normal(i)
+        model.update_state(slate, responses)
+        engagement.append([response.engagement for response in responses])
+      slate_documents = {
+          'clickbait_score':
+              np.array([[doc.clickbait_score for doc in slate]
+                        for slate in slates])
+      }
+      batched_model._rng = random_streams.make_stream(step, (0,))
+      responses = batched_model.simulate_response(slate_documents)
+      batched_model._rng = random_streams.make_stream(step, (1,))
+      batched_model.update_state(slate_documents, responses)
+      self.assertAllClose(engagement, responses['engagement'])
+      for key in state_keys:
+        self.assertAllClose(serial_state(key), batched_model._state[key])
+
+  def test_terminal_mask(self):
+    user_model = lts.LTSBatchedUserModel(
+        self._num_users, self._slate_size, time_budget=2)
+    batched_env = environment.BatchedEnvironment(
+        user_model,
+        lts.LTSDocumentSampler(),
+        self._num_candidates,
+        self._slate_size,
+        reset_terminated_users=False)
+    batched_env.reset()
+    # Half of the users have a shorter session.
+    short = np.arange(self._num_users) < self._num_users // 2
+    user_model._state['time_budget'][short] = 1
+    slates = np.tile(np.arange(self._slate_size), (self._num_users, 1))
+    _, _, _, done = batched_env.step(slates)
+    self.assertAllEqual(short, done)
+    satisfaction = user_model._state['satisfaction'].copy()
+    _, _, responses, done = batched_env.step(slates)
+    self.assertTrue(np.all(done))
+    # Finished users are frozen rather than reset.
+    self.assertAllEqual(np.where(short, 0, 1), responses['click'][:, 0])
+    self.assertAllEqual(np.zeros(self._num_users // 2),
+                        responses['engagement'][short, 0])
+    self.assertAllEqual(satisfaction[short],
+                        user_model._state['satisfaction'][short])
+    self.assertAllEqual(np.zeros(self._num_users),
+                        user_model._state['time_budget'])
+
+
 if __name__ == '__main__':
   tf.test.main()
 
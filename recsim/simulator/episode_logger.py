@@ -0,0 +1,383 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Writers that log simulated episodes to disk.
+
+Two backends are provided:
+
+  * SequenceExampleEpisodeWriter writes one tf.SequenceExample per episode to
+    a TFRecord file.
+  * ColumnarEpisodeWriter buffers steps into preallocated NumPy column arrays
+    and flushes whole episodes in bulk as .npz, Parquet or Arrow IPC shards.
+    Parquet and Arrow require pyarrow.
+
+Both derive the layout of the logged features once, from the observation space
+of the RecSimGymEnv, in an EpisodeLogSchema.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import abc
+import collections
+import io
+
+import numpy as np
+from recsim import space_layout
+import six
+import tensorflow.compat.v1 as tf
+
+TFRECORD = 'tfrecord'
+NPZ = 'npz'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+FORMATS = (TFRECORD, NPZ, PARQUET, ARROW)
+
+
+class EpisodeLogSchema(object):
+  """The layout of the features logged at every step of an episode.
+
+  Attributes:
+    multi_user: Whether the environment simulates multiple users.
+    user_layouts: A list of the SpaceLayouts of the observations of each user.
+    doc_layouts: A list of the SpaceLayouts of the observations of each
+      candidate document.
+    response_layouts: A list of the SpaceLayouts of a single response for each
+      user.
+    slate_size: The number of documents recommended to each user.
+    columns: An OrderedDict mapping column names to (shape, dtype) of a single
+      step of the column.
+  """
+
+  def __init__(self, observation_space, multi_user=False):
+    """Computes the schema of a RecSimGymEnv observation space.
+
+    Args:
+      observation_space: The observation space of a RecSimGymEnv, a Dict space
+        with keys 'user', 'doc' and 'response'.
+      multi_user: Whether the environment simulates multiple users.
+
+    Raises:
+      ValueError: if the documents or users have observations of different
+        sizes.
+    """
+    self.multi_user = multi_user
+    if multi_user:
+      user_spaces = list(observation_space.spaces['user'].spaces)
+      response_spaces = [
+          response_space[0]
+          for response_space in observation_space.spaces['response']
+      ]
+      self.slate_size = len(observation_space.spaces['response'][0])
+    else:
+      user_spaces = [observation_space.spaces['user']]
+      response_spaces = [observation_space.spaces['response'][0]]
+      self.slate_size = len(observation_space.spaces['response'])
+    self.user_layouts = space_layout.compile_layouts(user_spaces)
+    self.doc_layouts = space_layout.compile_layouts(
+        observation_space.spaces['doc'].spaces.values())
+    self.response_layouts = space_layout.compile_layouts(response_spaces)
+
+    user_dim = _common_size(self.user_layouts, 'users')
+    doc_dim = _common_size(self.doc_layouts, 'documents')
+    response_dim = _common_size(self.response_layouts, 'responses')
+    # Per-user columns have a leading users axis in multi-user environments.
+    users = (len(self.user_layouts),) if multi_user else ()
+    self.columns = collections.OrderedDict([
+        ('episode', ((), np.int64)),
+        ('step', ((), np.int64)),
+        ('user', (users + (user_dim,), np.float32)),
+        ('doc', ((len(self.doc_layouts), doc_dim), np.float32)),
+        ('slate', (users + (self.slate_size,), np.int64)),
+        ('response', (users + (self.slate_size, response_dim), np.float32)),
+        ('reward', (users, np.float32)),
+        ('is_terminal', ((), np.bool_)),
+    ])
+
+
+def _common_size(layouts, name):
+  dims = set(layout.size for layout in layouts)
+  if len(dims) > 1:
+    raise ValueError('Columnar logging requires all %s to have observations '
+                     'of the same size, got %s.' % (name, sorted(dims)))
+  return dims.pop() if dims else 0
+
+
+@six.add_metaclass(abc.ABCMeta)
+class AbstractEpisodeWriter(object):
+  """Abstract class for episode logging backends."""
+
+  def __init__(self, path, schema):
+    """Initializes an episode writer.
+
+    Args:
+      path: str, the path of the log file.
+      schema: An EpisodeLogSchema describing the logged features.
+    """
+    self._path = path
+    self._schema = schema
+
+  @abc.abstractmethod
+  def log_step(self, user_obs, doc_obs, slate, responses, reward, is_terminal):
+    """Adds one step of agent-environment interaction to the current episode.
+
+    Args:
+      user_obs: An array of floats representing user state observations.
+      doc_obs: An OrderedDict of observations of the documents.
+      slate: An array of indices to doc_obs.
+      responses: A list of observations of responses for items in the slate.
+      reward: A float for the reward returned after this step.
+      is_terminal: A boolean for whether a terminal state has been reached.
+    """
+
+  @abc.abstractmethod
+  def end_episode(self):
+    """Marks the end of the current episode."""
+
+  @abc.abstractmethod
+  def flush(self):
+    """Writes all completed episodes to disk."""
+
+  def close(self):
+    """Flushes and releases the writer."""
+    self.flush()
+
+
+class SequenceExampleEpisodeWriter(AbstractEpisodeWriter):
+  """Writes one tf.SequenceExample per episode to a TFRecord file."""
+
+  def __init__(self, path, schema):
+    super(SequenceExampleEpisodeWriter, self).__init__(path, schema)
+    self._writer = tf.io.TFRecordWriter(path)
+    self._sequence_example = tf.train.SequenceExample()
+
+  def log_step(self, user_obs, doc_obs, slate, responses, reward, is_terminal):
+
+    def _add_float_feature(feature, values):
+      feature.feature.add(float_list=tf.train.FloatList(value=values))
+
+    def _add_int64_feature(feature, values):
+      feature.feature.add(int64_list=tf.train.Int64List(value=values))
+
+    schema = self._schema
+    fl = self._sequence_example.feature_lists.feature_list
+
+    if schema.multi_user:
+      for i, (single_user,
+              single_slate,
+              single_user_responses,
+              single_reward) in enumerate(zip(user_obs,
+                                              slate,
+                                              responses,
+                                              reward)):
+        _add_float_feature(fl['user_%d' % i],
+                           schema.user_layouts[i].flatten(single_user))
+        _add_int64_feature(fl['slate_%d' % i], single_slate)
+        _add_float_feature(fl['reward_%d' % i], [single_reward])
+        resp_layout = schema.response_layouts[i]
+        # Keys come from the response space, since responses may be records.
+        for j, response in enumerate(single_user_responses):
+          for k in resp_layout.space.spaces:
+            _add_float_feature(fl['response_%d_%d_%s' % (i, j, k)],
+                               resp_layout.flatten(response))
+    else:  # single-user environment
+      _add_float_feature(fl['user'], schema.user_layouts[0].flatten(user_obs))
+      _add_int64_feature(fl['slate'], slate)
+      resp_layout = schema.response_layouts[0]
+      for i, response in enumerate(responses):
+        for k in resp_layout.space.spaces:
+          _add_float_feature(fl['response_%d_%s' % (i, k)],
+                             resp_layout.flatten(response))
+      _add_float_feature(fl['reward'], [reward])
+
+    for i, (doc_layout, doc) in enumerate(zip(schema.doc_layouts,
+                                              doc_obs.values())):
+      _add_float_feature(fl['doc_%d' % i], doc_layout.flatten(doc))
+
+    _add_int64_feature(fl['is_terminal'], [is_terminal])
+
+  def end_episode(self):
+    self._writer.write(self._sequence_example.SerializeToString())
+    self._sequence_example = tf.train.SequenceExample()
+
+  def flush(self):
+    self._writer.flush()
+
+  def close(self):
+    self._writer.close()
+
+
+class ColumnarEpisodeWriter(AbstractEpisodeWriter):
+  """Buffers episodes in NumPy columns and writes them in bulk.
+
+  Each step is one row of the columns listed in EpisodeLogSchema.columns, with
+  'episode' and 'step' identifying the episode and the position of the step in
+  it. Every flush writes the buffered episodes to a new shard
+  <path>-<shard number>.<format>, so shards can be read independently, even
+  while logging continues.
+  """
+
+  def __init__(self, path, schema, file_format=NPZ, flush_every_steps=100000):
+    """Initializes a columnar episode writer.
+
+    Args:
+      path: str, the path prefix of the shards.
+      schema: An EpisodeLogSchema describing the logged features.
+      file_format: str, one of 'npz', 'parquet' or 'arrow'.
+      flush_every_steps: int, the number of buffered steps after which
+        completed episodes are flushed to a new shard.
+
+    Raises:
+      ValueError: if file_format is not a columnar format.
+    """
+    super(ColumnarEpisodeWriter, self).__init__(path, schema)
+    if file_format not in (NPZ, PARQUET, ARROW):
+      raise ValueError('Unsupported columnar format %s.' % file_format)
+    if file_format != NPZ:
+      _import_pyarrow()
+    self._file_format = file_format
+    self._flush_every_steps = flush_every_steps
+    self._num_shards = 0
+    self._num_episodes = 0
+    self._episode_start = 0
+    self._size = 0
+    self._columns = self._allocate(flush_every_steps)
+
+  def _allocate(self, capacity):
+    return collections.OrderedDict(
+        (name, np.zeros((capacity,) + shape, dtype=dtype))
+        for name, (shape, dtype) in self._schema.columns.items())
+
+  def _reserve(self, size):
+    capacity = len(self._columns['step'])
+    if size <= capacity:
+      return
+    columns = self._allocate(max(size, 2 * capacity))
+    for name, column in columns.items():
+      column[:self._size] = self._columns[name][:self._size]
+    self._columns = columns
+
+  def log_step(self, user_obs, doc_obs, slate, responses, reward, is_terminal):
+    schema = self._schema
+    self._reserve(self._size + 1)
+    row = self._size
+    columns = self._columns
+    columns['episode'][row] = self._num_episodes
+    columns['step'][row] = row - self._episode_start
+    if schema.multi_user:
+      for i, (single_user, single_user_responses) in enumerate(
+          zip(user_obs, responses)):
+        schema.user_layouts[i].encode_into(single_user, columns['user'][row, i])
+        self._write_responses(columns['response'][row, i],
+                              schema.response_layouts[i], single_user_responses)
+    else:
+      schema.user_layouts[0].encode_into(user_obs, columns['user'][row])
+      self._write_responses(columns['response'][row],
+                            schema.response_layouts[0], responses)
+    for i, (doc_layout, doc) in enumerate(zip(schema.doc_layouts,
+                                              doc_obs.values())):
+      doc_layout.encode_into(doc, columns['doc'][row, i])
+    columns['slate'][row] = slate
+    columns['reward'][row] = reward
+    columns['is_terminal'][row] = is_terminal
+    self._size += 1
+
+  @staticmethod
+  def _write_responses(out, response_layout, responses):
+    for j, response in enumerate(responses):
+      response_layout.encode_into(response, out[j])
+
+  def end_episode(self):
+    self._num_episodes += 1
+    self._episode_start = self._size
+    if self._size >= self._flush_every_steps:
+      self.flush()
+
+  def flush(self):
+    """Writes the completed episodes to a new shard."""
+    num_rows = self._episode_start
+    if not num_rows:
+      return
+    columns = collections.OrderedDict(
+        (name, column[:num_rows]) for name, column in self._columns.items())
+    path = '%s-%05d.%s' % (self._path, self._num_shards, self._file_format)
+    # Serialize in memory first, as the writers need seekable files.
+    buf = io.BytesIO()
+    if self._file_format == NPZ:
+      np.savez(buf, **columns)
+    else:
+      _write_arrow_table(buf, columns, self._file_format)
+    with tf.io.gfile.GFile(path, 'wb') as f:
+      f.write(buf.getvalue())
+    self._num_shards += 1
+    # Move the steps of an unfinished episode to the front of the buffer.
+    num_pending = self._size - num_rows
+    for column in self._columns.values():
+      column[:num_pending] = column[num_rows:self._size]
+    self._size = num_pending
+    self._episode_start = 0
+
+
+def _import_pyarrow():
+  try:
+    import pyarrow  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    raise ImportError('Logging episodes to Parquet or Arrow requires pyarrow.')
+  return pyarrow
+
+
+def _write_arrow_table(f, columns, file_format):
+  """Writes columns as an Arrow table, nesting trailing axes in lists."""
+  pa = _import_pyarrow()
+  arrays = []
+  for column in columns.values():
+    array = pa.array(column.reshape(-1))
+    for dim in reversed(column.shape[1:]):
+      array = pa.FixedSizeListArray.from_arrays(array, dim)
+    arrays.append(array)
+  table = pa.Table.from_arrays(arrays, names=list(columns))
+  if file_format == PARQUET:
+    import pyarrow.parquet as pq  # pylint: disable=g-import-not-at-top
+    pq.write_table(table, f)
+  else:
+    with pa.ipc.new_file(f, table.schema) as writer:
+      writer.write_table(table)
+
+
+def create_episode_writer(path, observation_space, multi_user=False,
+                          file_format=TFRECORD):
+  """Creates an episode writer.
+
+  Args:
+    path: str, the path of the log file, or the path prefix of the shards for
+      columnar formats.
+    observation_space: The observation space of the RecSimGymEnv.
+    multi_user: Whether the environment simulates multiple users.
+    file_format: str, one of FORMATS.
+
+  Returns:
+    An AbstractEpisodeWriter.
+
+  Raises:
+    ValueError: if file_format is unknown.
+  """
+  if file_format not in FORMATS:
+    raise ValueError('Unknown episode log format %s, must be one of %s.' %
+                     (file_format, FORMATS))
+  schema = EpisodeLogSchema(observation_space, multi_user=multi_user)
+  if file_format == TFRECORD:
+    return SequenceExampleEpisodeWriter(path, schema)
+  return ColumnarEpisodeWriter(path, schema, file_format=file_format)
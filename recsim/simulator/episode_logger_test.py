@@ -0,0 +1,144 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.episode_logger."""
+
+import os
+
+import numpy as np
+from recsim.environments import interest_evolution
+from recsim.simulator import episode_logger
+import tensorflow.compat.v1 as tf
+
+
+class EpisodeLoggerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(EpisodeLoggerTest, self).setUp()
+    self._env = interest_evolution.create_environment({
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    })
+    self._log_dir = self.get_temp_dir()
+
+  def _log_episodes(self, writer, num_episodes, steps_per_episode):
+    steps = []
+    for _ in range(num_episodes):
+      observation = self._env.reset()
+      for step in range(steps_per_episode):
+        slate = [0, 1]
+        next_observation, reward, _, _ = self._env.step(slate)
+        is_terminal = step == steps_per_episode - 1
+        writer.log_step(observation['user'], observation['doc'], slate,
+                        next_observation['response'], reward, is_terminal)
+        # User observations are updated in place by the environment.
+        steps.append((np.copy(observation['user']),
+                      list(observation['doc'].values()),
+                      next_observation['response'], reward))
+        observation = next_observation
+      writer.end_episode()
+    return steps
+
+  def test_npz_writer(self):
+    path = os.path.join(self._log_dir, 'episodes')
+    writer = episode_logger.create_episode_writer(
+        path, self._env.observation_space, file_format='npz')
+    steps = self._log_episodes(writer, num_episodes=3, steps_per_episode=4)
+    writer.close()
+
+    log = np.load(path + '-00000.npz')
+    self.assertAllEqual(log['episode'], np.repeat(np.arange(3), 4))
+    self.assertAllEqual(log['step'], np.tile(np.arange(4), 3))
+    self.assertAllEqual(log['slate'], np.tile([0, 1], (12, 1)))
+    self.assertAllEqual(log['is_terminal'], np.tile([0, 0, 0, 1], 3))
+    self.assertEqual(log['doc'].shape[:2], (12, 5))
+    self.assertEqual(log['response'].shape[:2], (12, 2))
+    for row, (user_obs, doc_obs, responses, reward) in enumerate(steps):
+      self.assertAllClose(log['user'][row], user_obs)
+      self.assertAllClose(log['doc'][row], doc_obs)
+      # Clicks are one-hot encoded in the first two response features.
+      self.assertEqual(log['response'][row, 0, 1], responses[0]['click'])
+      self.assertAllClose(log['reward'][row], reward)
+
+  def test_flush_keeps_unfinished_episode(self):
+    path = os.path.join(self._log_dir, 'partial')
+    schema = episode_logger.EpisodeLogSchema(self._env.observation_space)
+    writer = episode_logger.ColumnarEpisodeWriter(
+        path, schema, flush_every_steps=3)
+    self._log_episodes(writer, num_episodes=2, steps_per_episode=2)
+    # The first flush happens after the second episode, at 4 buffered steps.
+    self.assertTrue(tf.io.gfile.exists(path + '-00000.npz'))
+    self.assertFalse(tf.io.gfile.exists(path + '-00001.npz'))
+    self._log_episodes(writer, num_episodes=1, steps_per_episode=1)
+    writer.flush()
+    self.assertAllEqual(np.load(path + '-00000.npz')['episode'], [0, 0, 1, 1])
+    self.assertAllEqual(np.load(path + '-00001.npz')['episode'], [2])
+
+  def test_tfrecord_writer(self):
+    path = os.path.join(self._log_dir, 'episodes.tfrecord')
+    writer = episode_logger.create_episode_writer(
+        path, self._env.observation_space)
+    self._log_episodes(writer, num_episodes=2, steps_per_episode=3)
+    writer.close()
+
+    records = list(tf.io.tf_record_iterator(path))
+    self.assertLen(records, 2)
+    sequence_example = tf.train.SequenceExample.FromString(records[0])
+    feature_list = sequence_example.feature_lists.feature_list
+    self.assertLen(feature_list['user'].feature, 3)
+    self.assertLen(feature_list['doc_4'].feature, 3)
+    self.assertEqual(
+        [feature.int64_list.value[0]
+         for feature in feature_list['is_terminal'].feature], [0, 0, 1])
+
+  def test_structured_responses(self):
+    self._env = interest_evolution.create_environment({
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+        'structured_responses': True,
+    })
+    path = os.path.join(self._log_dir, 'structured.tfrecord')
+    writer = episode_logger.create_episode_writer(
+        path, self._env.observation_space)
+    steps = self._log_episodes(writer, num_episodes=1, steps_per_episode=2)
+    writer.close()
+
+    records = list(tf.io.tf_record_iterator(path))
+    sequence_example = tf.train.SequenceExample.FromString(records[0])
+    feature_list = sequence_example.feature_lists.feature_list
+    response_keys = sorted(
+        key for key in feature_list if key.startswith('response_0_'))
+    self.assertEqual(['response_0_click', 'response_0_cluster_id',
+                      'response_0_liked', 'response_0_quality',
+                      'response_0_watch_time'], response_keys)
+    self.assertLen(feature_list['response_1_click'].feature, 2)
+    # Clicks are one-hot encoded in the first two response features.
+    self.assertEqual(
+        feature_list['response_0_click'].feature[0].float_list.value[1],
+        steps[0][2][0]['click'])
+
+  def test_unknown_format(self):
+    with self.assertRaises(ValueError):
+      episode_logger.create_episode_writer(
+          os.path.join(self._log_dir, 'episodes'),
+          self._env.observation_space, file_format='csv')
+
+
+if __name__ == '__main__':
+  tf.test.main()
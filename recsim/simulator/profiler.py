@@ -0,0 +1,297 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-phase profiling of the simulation loop.
+
+The phases of a simulation step (the environment dynamics, building the gym
+observation, the agent's step, logging...) are wrapped in spans:
+
+  with profiler.span('environment/simulate_response'):
+    responses = self._user_model.simulate_response(documents)
+
+Spans are timed with time.perf_counter_ns by the active Profiler, if any, and
+aggregated into a histogram per phase. The Runner installs a Profiler when
+profiling is enabled and exports the histograms to TensorBoard and, optionally,
+the recorded spans to a Chrome trace file (chrome://tracing or Perfetto).
+
+Only a fraction of the steps, given by the sampling rate, are profiled. Steps
+are sampled deterministically, so that profiling does not consume random
+numbers of the simulation. When no Profiler is active, or the current step is
+not sampled, span returns a shared no-op context manager.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+import tensorflow.compat.v1 as tf
+
+# Durations are bucketed by powers of two of nanoseconds.
+_NUM_BUCKETS = 64
+
+_NULL_SPAN = contextlib.nullcontext()
+
+_active_profiler = None
+
+
+def set_profiler(profiler):
+  """Makes profiler the active Profiler, or disables profiling if None."""
+  global _active_profiler
+  _active_profiler = profiler
+
+
+def get_profiler():
+  """Returns the active Profiler, or None."""
+  return _active_profiler
+
+
+def span(name):
+  """Returns a context manager timing a phase of the current step.
+
+  Args:
+    name: str, the name of the phase, e.g. 'environment/update_state'.
+
+  Returns:
+    A context manager recording the span with the active Profiler if the
+      current step is sampled, and doing nothing otherwise.
+  """
+  profiler = _active_profiler
+  if profiler is None or not profiler.sampled:
+    return _NULL_SPAN
+  return _Span(profiler, name)
+
+
+class _Span(object):
+  """A context manager recording its duration with a Profiler."""
+
+  __slots__ = ('_profiler', '_name', '_start_ns')
+
+  def __init__(self, profiler, name):
+    self._profiler = profiler
+    self._name = name
+
+  def __enter__(self):
+    self._start_ns = time.perf_counter_ns()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._profiler.record(self._name, self._start_ns, time.perf_counter_ns())
+
+
+class Histogram(object):
+  """A histogram of durations in power-of-two buckets of nanoseconds.
+
+  Attributes:
+    count: int, the number of durations.
+    total_ns: int, the sum of the durations.
+    min_ns: int, the shortest duration.
+    max_ns: int, the longest duration.
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.total_ns = 0
+    self.sum_squares = 0.
+    self.min_ns = None
+    self.max_ns = None
+    # Bucket i counts durations d with 2**(i-1) <= d < 2**i.
+    self._buckets = [0] * _NUM_BUCKETS
+
+  def add(self, duration_ns):
+    self.count += 1
+    self.total_ns += duration_ns
+    self.sum_squares += float(duration_ns)**2
+    if self.min_ns is None or duration_ns < self.min_ns:
+      self.min_ns = duration_ns
+    if self.max_ns is None or duration_ns > self.max_ns:
+      self.max_ns = duration_ns
+    self._buckets[min(duration_ns.bit_length(), _NUM_BUCKETS - 1)] += 1
+
+  @property
+  def mean_ns(self):
+    return self.total_ns / self.count if self.count else 0.
+
+  def percentile(self, q):
+    """Returns an estimate of the q-th percentile duration in nanoseconds.
+
+    The estimate is the geometric middle of the bucket holding the percentile,
+    within a factor of sqrt(2) of the exact value.
+
+    Args:
+      q: float, the percentile, between 0 and 100.
+    """
+    if not self.count:
+      return 0.
+    rank = q / 100. * self.count
+    cumulative = 0
+    for i, bucket in enumerate(self._buckets):
+      cumulative += bucket
+      if bucket and cumulative >= rank:
+        estimate = 2**(i - 0.5) if i else 0.
+        return min(max(estimate, self.min_ns), self.max_ns)
+    return float(self.max_ns)
+
+  def to_proto(self):
+    """Returns the histogram, in microseconds, as a tf.HistogramProto."""
+    limits, counts = [], []
+    for i, bucket in enumerate(self._buckets):
+      if bucket:
+        limits.append(2**i / 1e3)
+        counts.append(bucket)
+    return tf.HistogramProto(
+        min=(self.min_ns or 0) / 1e3,
+        max=(self.max_ns or 0) / 1e3,
+        num=self.count,
+        sum=self.total_ns / 1e3,
+        sum_squares=self.sum_squares / 1e6,
+        bucket_limit=limits,
+        bucket=counts)
+
+  def to_dict(self):
+    """Returns summary statistics, in microseconds, as a dictionary."""
+    return {
+        'count': self.count,
+        'mean_us': self.mean_ns / 1e3,
+        'min_us': (self.min_ns or 0) / 1e3,
+        'p50_us': self.percentile(50) / 1e3,
+        'p99_us': self.percentile(99) / 1e3,
+        'max_us': (self.max_ns or 0) / 1e3,
+        'total_us': self.total_ns / 1e3,
+    }
+
+
+class Profiler(object):
+  """Aggregates the spans of sampled simulation steps.
+
+  The simulation loop calls begin_step before each step. Whether the spans of
+  the step are recorded is decided then, so that all phases of a sampled step
+  are recorded together.
+
+  Attributes:
+    sampled: bool, whether the spans of the current step are recorded.
+  """
+
+  def __init__(self, sampling_rate=1., max_trace_events=0):
+    """Initializes a Profiler.
+
+    Args:
+      sampling_rate: float in (0, 1], the fraction of steps to profile. With
+        0.01, one step in 100 is profiled.
+      max_trace_events: int, the maximum number of spans kept between resets
+        for the Chrome trace. With 0, no spans are kept.
+    """
+    if not 0. < sampling_rate <= 1.:
+      raise ValueError('sampling_rate must be in (0, 1], got %s.' %
+                       sampling_rate)
+    self._sampling_rate = sampling_rate
+    self._max_trace_events = max_trace_events
+    self._num_steps = 0
+    self.sampled = False
+    self.reset()
+
+  @property
+  def max_trace_events(self):
+    return self._max_trace_events
+
+  def reset(self):
+    """Clears the histograms and trace events."""
+    self._histograms = {}
+    self._trace_events = []
+
+  def begin_step(self):
+    """Starts a step, deciding whether its spans are recorded."""
+    previous = math.floor(self._num_steps * self._sampling_rate)
+    self._num_steps += 1
+    self.sampled = math.floor(self._num_steps * self._sampling_rate) > previous
+
+  def record(self, name, start_ns, end_ns):
+    """Records a span of a phase.
+
+    Args:
+      name: str, the name of the phase.
+      start_ns: int, the start of the span, from time.perf_counter_ns.
+      end_ns: int, the end of the span, from time.perf_counter_ns.
+    """
+    histogram = self._histograms.get(name)
+    if histogram is None:
+      histogram = self._histograms[name] = Histogram()
+    histogram.add(end_ns - start_ns)
+    if len(self._trace_events) < self._max_trace_events:
+      self._trace_events.append((name, start_ns, end_ns,
+                                 threading.get_ident()))
+
+  @property
+  def histograms(self):
+    """A dictionary of the Histogram of every phase recorded since reset."""
+    return dict(self._histograms)
+
+  def write_summaries(self, summary_writer, step, suffix):
+    """Writes the histograms and their statistics to TensorBoard.
+
+    Args:
+      summary_writer: A tf.summary.FileWriter.
+      step: int, the global step of the summaries.
+      suffix: str, the suffix of the summary tags, e.g. 'train'.
+    """
+    values = []
+    for name, histogram in sorted(self._histograms.items()):
+      tag = 'Profile/%s/' % name
+      statistics = histogram.to_dict()
+      values.append(
+          tf.Summary.Value(
+              tag=tag + 'Micros/' + suffix, histo=histogram.to_proto()))
+      for statistic in ['mean_us', 'p50_us', 'p99_us']:
+        values.append(
+            tf.Summary.Value(
+                tag=tag + statistic + '/' + suffix,
+                simple_value=statistics[statistic]))
+    if values:
+      summary_writer.add_summary(tf.Summary(value=values), step)
+
+  def write_trace(self, path):
+    """Writes the recorded spans and phase statistics as a Chrome trace.
+
+    The file is in the JSON trace event format, with the statistics of every
+    phase under the additional top-level key 'phases'.
+
+    Args:
+      path: str, the path of the trace file.
+    """
+    pid = os.getpid()
+    events = [{
+        'name': name,
+        'ph': 'X',
+        'ts': start_ns / 1e3,
+        'dur': (end_ns - start_ns) / 1e3,
+        'pid': pid,
+        'tid': tid,
+    } for name, start_ns, end_ns, tid in self._trace_events]
+    trace = {
+        'traceEvents': events,
+        'displayTimeUnit': 'ns',
+        'phases': {
+            name: histogram.to_dict()
+            for name, histogram in sorted(self._histograms.items())
+        },
+    }
+    with tf.io.gfile.GFile(path, 'w') as f:
+      json.dump(trace, f)
@@ -0,0 +1,129 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.profiler."""
+
+import json
+import os
+
+from recsim.environments import interest_exploration
+from recsim.simulator import profiler
+import tensorflow.compat.v1 as tf
+
+
+class _SummaryWriter(object):
+
+  def __init__(self):
+    self.summaries = []
+
+  def add_summary(self, summary, step):
+    self.summaries.append((summary, step))
+
+
+class ProfilerTest(tf.test.TestCase):
+
+  def tearDown(self):
+    profiler.set_profiler(None)
+    super(ProfilerTest, self).tearDown()
+
+  def test_disabled(self):
+    self.assertIs(profiler.span('phase'), profiler.span('other_phase'))
+    prof = profiler.Profiler()
+    profiler.set_profiler(prof)
+    # No step has begun.
+    with profiler.span('phase'):
+      pass
+    self.assertEmpty(prof.histograms)
+
+  def test_sampling(self):
+    prof = profiler.Profiler(sampling_rate=0.25)
+    profiler.set_profiler(prof)
+    sampled = []
+    for _ in range(12):
+      prof.begin_step()
+      sampled.append(prof.sampled)
+      with profiler.span('phase'):
+        pass
+    self.assertEqual([i for i, s in enumerate(sampled) if s], [3, 7, 11])
+    self.assertEqual(prof.histograms['phase'].count, 3)
+    with self.assertRaises(ValueError):
+      profiler.Profiler(sampling_rate=0.)
+
+  def test_histogram(self):
+    histogram = profiler.Histogram()
+    for duration_ns in [1000] * 98 + [100000] * 2:
+      histogram.add(duration_ns)
+    self.assertEqual(histogram.count, 100)
+    self.assertEqual(histogram.min_ns, 1000)
+    self.assertEqual(histogram.max_ns, 100000)
+    self.assertAllClose(histogram.mean_ns, 2980.)
+    # Estimates are within a factor of sqrt(2).
+    self.assertBetween(histogram.percentile(50), 1000, 1000 * 2**0.5)
+    self.assertBetween(histogram.percentile(99), 100000 / 2**0.5, 100000)
+    proto = histogram.to_proto()
+    self.assertEqual(sum(proto.bucket), 100)
+    self.assertAllClose(proto.sum, 298.)
+
+  def test_write_summaries_and_trace(self):
+    prof = profiler.Profiler(max_trace_events=3)
+    profiler.set_profiler(prof)
+    for _ in range(2):
+      prof.begin_step()
+      with profiler.span('outer'):
+        with profiler.span('inner'):
+          pass
+    writer = _SummaryWriter()
+    prof.write_summaries(writer, 7, 'train')
+    (summary, step), = writer.summaries
+    self.assertEqual(step, 7)
+    tags = [value.tag for value in summary.value]
+    self.assertIn('Profile/inner/Micros/train', tags)
+    self.assertIn('Profile/outer/p99_us/train', tags)
+
+    path = os.path.join(self.get_temp_dir(), 'trace.json')
+    prof.write_trace(path)
+    with open(path) as f:
+      trace = json.load(f)
+    self.assertEqual([event['name'] for event in trace['traceEvents']],
+                     ['inner', 'outer', 'inner'])
+    outer, inner = trace['traceEvents'][1], trace['traceEvents'][0]
+    self.assertLessEqual(outer['ts'], inner['ts'])
+    self.assertGreaterEqual(outer['dur'], inner['dur'])
+    self.assertEqual(trace['phases']['outer']['count'], 2)
+
+    prof.reset()
+    self.assertEmpty(prof.histograms)
+
+  def test_environment_phases(self):
+    env = interest_exploration.create_environment({
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    })
+    prof = profiler.Profiler()
+    profiler.set_profiler(prof)
+    env.reset()
+    prof.begin_step()
+    env.step([0, 1])
+    self.assertContainsSubset([
+        'environment/step', 'environment/simulate_response',
+        'environment/update_state', 'environment/resample_documents',
+        'environment/observe_documents', 'gym/observation', 'gym/reward'
+    ], prof.histograms.keys())
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -22,7 +22,9 @@ import collections
 import gym
 from gym import spaces
 import numpy as np
+from recsim import user
 from recsim.simulator import environment
+from recsim.simulator import profiler
 
 
 def _dummy_metrics_aggregator(responses, metrics, info):
@@ -41,19 +43,28 @@ def _dummy_metrics_writer(metrics, add_summary_fn):
 class RecSimGymEnv(gym.Env):
   """Class to wrap recommender system environment to gym.Env.
 
+  The action and observation spaces are built on first access and cached. The
+  observation space is only rebuilt when the schema of the candidate set of the
+  environment changes (see CandidateSet.schema), so the keys of its `doc` space
+  are the document IDs of the candidate set it was built from, not necessarily
+  the current ones.
+
   Attributes:
     game_over: A boolean indicating whether the current game has finished
     action_space: A gym.spaces object that specifies the space for possible
       actions.
     observation_space: A gym.spaces object that specifies the space for possible
       observations.
+    space_version: An integer incremented whenever the observation space
+      changes.
   """
 
   def __init__(self,
                raw_environment,
                reward_aggregator,
                metrics_aggregator=_dummy_metrics_aggregator,
-               metrics_writer=_dummy_metrics_writer):
+               metrics_writer=_dummy_metrics_writer,
+               structured_responses=False):
     """Initializes a RecSim environment conforming to gym.Env.
 
     Args:
@@ -62,11 +73,28 @@ class RecSimGymEnv(gym.Env):
       metrics_aggregator: A function aggregating metrics over all steps given
         responses and response_names.
       metrics_writer:  A function writing final metrics to TensorBoard.
+      structured_responses: A boolean indicating whether to observe the
+        responses to a slate as a structured array with one record per
+        response (see user.encode_responses), rather than as a tuple of
+        dictionaries. Records are indexed by response name like dictionaries,
+        but creating them allocates no per-response dictionary or arrays.
     """
     self._environment = raw_environment
     self._reward_aggregator = reward_aggregator
     self._metrics_aggregator = metrics_aggregator
     self._metrics_writer = metrics_writer
+    self._action_space = None
+    self._observation_space = None
+    self._candidate_set_schema = None
+    self._candidate_doc_ids = None
+    self._space_version = 0
+    self._response_dtype = None
+    if structured_responses:
+      user_model = raw_environment.user_model
+      if isinstance(raw_environment, environment.MultiUserEnvironment):
+        user_model = user_model[0]
+      self._response_dtype = (
+          user_model.get_response_model_ctor().response_dtype())
     self.reset_metrics()
 
   @property
@@ -85,14 +113,46 @@ class RecSimGymEnv(gym.Env):
     Each action is a vector that specified document slate. Each element in the
     vector corresponds to the index of the document in the candidate set.
     """
+    if self._action_space is not None:
+      return self._action_space
     action_space = spaces.MultiDiscrete(
         self._environment.num_candidates * np.ones(
             (self._environment.slate_size,)
         ))
     if isinstance(self._environment, environment.MultiUserEnvironment):
       action_space = spaces.Tuple([action_space] * self._environment.num_users)
+    self._action_space = action_space
     return action_space
 
+  @property
+  def space_version(self):
+    """Returns the version of the observation space.
+
+    The version is incremented whenever the observation space changes.
+    Consumers deriving data from the observation space, e.g. compiled layouts,
+    can compare versions to cheaply detect that the space has changed.
+    """
+    self._check_candidate_set_schema()
+    return self._space_version
+
+  def _check_candidate_set_schema(self):
+    """Keeps the cached observation space in sync with the candidate set.
+
+    A change of the candidate set schema invalidates the observation space and
+    increments its version. A change of the candidate documents alone only
+    re-keys the cached document space, since its structure is unchanged.
+    """
+    candidate_set = self._environment.candidate_set
+    schema = candidate_set.schema()
+    if schema != self._candidate_set_schema:
+      self._candidate_set_schema = schema
+      self._observation_space = None
+      self._space_version += 1
+    elif (self._observation_space is not None and
+          not np.array_equal(candidate_set.doc_ids, self._candidate_doc_ids)):
+      self._observation_space.spaces['doc'] = candidate_set.observation_space()
+      self._candidate_doc_ids = np.copy(candidate_set.doc_ids)
+
   @property
   def observation_space(self):
     """Returns the observation space of the environment.
@@ -101,6 +161,10 @@ class RecSimGymEnv(gym.Env):
     `response` that includes observation about user state, document and user
     response, respectively.
     """
+    self._check_candidate_set_schema()
+    if self._observation_space is not None:
+      return self._observation_space
+
     if isinstance(self._environment, environment.MultiUserEnvironment):
       user_obs_space = self._environment.user_model[0].observation_space()
       resp_obs_space = self._environment.user_model[0].response_space()
@@ -113,11 +177,14 @@ class RecSimGymEnv(gym.Env):
       user_obs_space = self._environment.user_model.observation_space()
       resp_obs_space = self._environment.user_model.response_space()
 
-    return spaces.Dict({
+    candidate_set = self._environment.candidate_set
+    self._observation_space = spaces.Dict({
         'user': user_obs_space,
-        'doc': self._environment.candidate_set.observation_space(),
+        'doc': candidate_set.observation_space(),
         'response': resp_obs_space,
     })
+    self._candidate_doc_ids = np.copy(candidate_set.doc_ids)
+    return self._observation_space
 
   def step(self, action):
     """Runs one timestep of the environment's dynamics.
@@ -141,24 +208,35 @@ class RecSimGymEnv(gym.Env):
         info (dict): Contains responses for the full slate for
           debugging/learning.
     """
-    user_obs, doc_obs, responses, done = self._environment.step(action)
-    if isinstance(self._environment, environment.MultiUserEnvironment):
-      all_responses = tuple(
-          tuple(
-              response.create_observation() for response in single_user_resps
-              ) for single_user_resps in responses
-          )
-    else:  # single user environment
-      all_responses = tuple(
-          response.create_observation() for response in responses
-          )
-    obs = dict(
-        user=user_obs,
-        doc=doc_obs,
-        response=all_responses)
+    with profiler.span('environment/step'):
+      user_obs, doc_obs, responses, done = self._environment.step(action)
+    with profiler.span('gym/observation'):
+      if self._response_dtype is not None:
+        if isinstance(self._environment, environment.MultiUserEnvironment):
+          all_responses = tuple(
+              user.encode_responses(single_user_resps, self._response_dtype)
+              for single_user_resps in responses)
+        else:
+          all_responses = user.encode_responses(responses,
+                                                self._response_dtype)
+      elif isinstance(self._environment, environment.MultiUserEnvironment):
+        all_responses = tuple(
+            tuple(
+                response.create_observation() for response in single_user_resps
+                ) for single_user_resps in responses
+            )
+      else:  # single user environment
+        all_responses = tuple(
+            response.create_observation() for response in responses
+            )
+      obs = dict(
+          user=user_obs,
+          doc=doc_obs,
+          response=all_responses)
 
     # extract rewards from responses
-    reward = self._reward_aggregator(responses)
+    with profiler.span('gym/reward'):
+      reward = self._reward_aggregator(responses)
     info = self.extract_env_info()
     return obs, reward, done, info
 
@@ -166,8 +244,8 @@ class RecSimGymEnv(gym.Env):
     user_obs, doc_obs = self._environment.reset()
     return dict(user=user_obs, doc=doc_obs, response=None)
 
-  def reset_sampler(self):
-    self._environment.reset_sampler()
+  def reset_sampler(self, episode=0):
+    self._environment.reset_sampler(episode)
 
   def render(self, mode='human'):
     raise NotImplementedError
@@ -190,6 +268,25 @@ class RecSimGymEnv(gym.Env):
     """
     self._metrics = collections.defaultdict(float)
 
+  @property
+  def metrics(self):
+    """Returns the dictionary of metrics aggregated since the last reset."""
+    return self._metrics
+
+  def merge_metrics(self, metrics):
+    """Adds metrics aggregated elsewhere (e.g. by an environment replica).
+
+    This assumes the metrics aggregator accumulates metrics by summation, as
+    utils.aggregate_video_cluster_metrics does.
+
+    Args:
+      metrics: A dictionary mapping from metric_name to its value in float.
+    """
+    if not metrics:
+      return
+    for key, value in metrics.items():
+      self._metrics[key] += value
+
   def update_metrics(self, responses, info=None):
     """Updates metrics with one step responses."""
     self._metrics = self._metrics_aggregator(
@@ -0,0 +1,104 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.recsim_gym."""
+
+import numpy as np
+from recsim import user
+from recsim.agents.dopamine import dqn_agent
+from recsim.environments import interest_evolution
+from recsim.environments import interest_exploration
+from recsim.environments import long_term_satisfaction
+import tensorflow.compat.v1 as tf
+
+
+class RecSimGymEnvTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(RecSimGymEnvTest, self).setUp()
+    self._env = interest_exploration.create_environment({
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    })
+
+  def test_cached_spaces(self):
+    observation_space = self._env.observation_space
+    action_space = self._env.action_space
+    version = self._env.space_version
+    # Resampling documents replaces the candidate set, not its schema.
+    self._env.reset()
+    observation, _, _, _ = self._env.step([0, 1])
+    self.assertIs(observation_space, self._env.observation_space)
+    self.assertIs(action_space, self._env.action_space)
+    self.assertEqual(version, self._env.space_version)
+    # The document space is re-keyed by the resampled document IDs.
+    self.assertEqual(list(observation['doc']),
+                     list(self._env.observation_space['doc'].spaces))
+    self.assertNotEqual(['0', '1', '2', '3', '4'], list(observation['doc']))
+
+    candidate_set = self._env.environment.candidate_set
+    candidate_set.remove_document(candidate_set.get_all_documents()[0])
+    self.assertEqual(version + 1, self._env.space_version)
+    self.assertLen(self._env.observation_space['doc'].spaces, 4)
+
+  def test_structured_responses(self):
+    for module in [
+        interest_evolution, interest_exploration, long_term_satisfaction
+    ]:
+      observations = []
+      for structured_responses in [False, True]:
+        env = module.create_environment({
+            'num_candidates': 5,
+            'slate_size': 3,
+            'resample_documents': True,
+            'seed': 0,
+            'structured_responses': structured_responses,
+        })
+        np.random.seed(0)
+        env.reset()
+        observations.append(env.step([0, 1, 2])[0])
+      response_space = env.observation_space['response']
+      response_ctor = env.environment.user_model.get_response_model_ctor()
+      # The declared dtype follows the keys of the response space.
+      self.assertEqual(
+          list(response_space[0].spaces),
+          list(response_ctor.response_dtype().names))
+      dict_responses = observations[0]['response']
+      records = observations[1]['response']
+      self.assertLen(records, 3)
+      for response, record in zip(dict_responses, records):
+        for key, value in response.items():
+          self.assertAllClose(value, record[key])
+      adapter = dqn_agent.ResponseAdapter(response_space)
+      self.assertAllClose(adapter.encode(dict_responses),
+                          adapter.encode(records))
+
+  def test_encode_responses_into(self):
+    responses = [
+        long_term_satisfaction.LTSResponse(clicked=True, engagement=200.),
+        long_term_satisfaction.LTSResponse()
+    ]
+    dtype = long_term_satisfaction.LTSResponse.response_dtype()
+    out = np.zeros(3, dtype=dtype)
+    records = user.encode_responses(responses, dtype, out=out)
+    self.assertLen(records, 2)
+    self.assertAllEqual([1, 0, 0], out['click'])
+    self.assertAllClose([100., 0., 0.], out['engagement'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -19,15 +19,22 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
+from concurrent import futures
+import multiprocessing
 import os
+import queue
 import time
 
 from absl import flags
 from dopamine.discrete_domains import checkpointer
 import gin.tf
-from gym import spaces
 import numpy as np
+from recsim import random_streams
+from recsim.simulator import checkpoint_watcher
 from recsim.simulator import environment
+from recsim.simulator import episode_logger
+from recsim.simulator import profiler
 import tensorflow.compat.v1 as tf
 
 
@@ -46,6 +53,10 @@ flags.DEFINE_string(
 flags.DEFINE_string(
     'episode_log_file', '',
     'Filename under base_dir to output simulated episodes in SequenceExample.')
+flags.DEFINE_enum(
+    'episode_log_format', episode_logger.TFRECORD, episode_logger.FORMATS,
+    'Format of the episode log: tf.SequenceExample records, or columnar '
+    'shards in npz, Parquet or Arrow IPC format.')
 flags.DEFINE_multi_string(
     'gin_files', [], 'List of paths to gin configuration files (e.g.'
     '"third_party/py/dopamine/agents/dqn/dqn.gin").')
@@ -57,6 +68,13 @@ flags.DEFINE_multi_string(
 
 FLAGS = flags.FLAGS
 
+# Seconds the learner waits for new transitions from the actors.
+_LEARNER_POLL_SECS = 0.01
+# Weight files kept for the actors, which may still be restoring older ones.
+_MAX_ACTOR_WEIGHTS_TO_KEEP = 3
+# Seconds between checks for completed concurrent evaluations.
+_EVAL_POLL_SECS = 0.1
+
 
 def load_gin_configs(gin_files, gin_bindings):
   """Loads gin configuration files.
@@ -71,6 +89,20 @@ def load_gin_configs(gin_files, gin_bindings):
       gin_files, bindings=gin_bindings, skip_unknown=False)
 
 
+class _AtomicCheckpointer(checkpointer.Checkpointer):
+  """A Checkpointer whose checkpoint files are never seen partially written.
+
+  Experiment data is written to a temporary file which is renamed once
+  complete. As before, the sentinel file marking the checkpoint as complete is
+  only written afterwards.
+  """
+
+  def _save_data_to_file(self, data, filename):
+    temp_filename = filename + '.tmp'
+    super(_AtomicCheckpointer, self)._save_data_to_file(data, temp_filename)
+    tf.io.gfile.rename(temp_filename, filename, overwrite=True)
+
+
 @gin.configurable
 class Runner(object):
   """Object that handles running experiments.
@@ -91,7 +123,10 @@ class Runner(object):
                env,
                episode_log_file='',
                checkpoint_file_prefix='ckpt',
-               max_steps_per_episode=27000):
+               max_steps_per_episode=27000,
+               episode_log_format=episode_logger.TFRECORD,
+               profile_sampling_rate=0.,
+               profile_max_trace_events=0):
     """Initializes the Runner object in charge of running a full experiment.
 
     Args:
@@ -104,6 +139,17 @@ class Runner(object):
       checkpoint_file_prefix: str, the prefix to use for checkpoint files.
       max_steps_per_episode: int, maximum number of steps after which an episode
         terminates.
+      episode_log_format: str, the format of the episode log, one of
+        episode_logger.FORMATS. With a columnar format ('npz', 'parquet' or
+        'arrow'), episodes are buffered in memory and written in bulk to
+        shards prefixed by episode_log_file.
+      profile_sampling_rate: float, the fraction of simulation steps whose
+        phases are timed, see profiler.py. With 0 (the default), profiling is
+        disabled. Histograms of the phase durations are written to
+        TensorBoard with the other metrics.
+      profile_max_trace_events: int, the maximum number of timed phases per
+        iteration written to a Chrome trace file, trace_<suffix>_<step>.json
+        in the output directory. With 0, no trace is written.
     """
     tf.logging.info('max_steps_per_episode = %s', max_steps_per_episode)
 
@@ -116,24 +162,39 @@ class Runner(object):
     self._checkpoint_file_prefix = checkpoint_file_prefix
     self._max_steps_per_episode = max_steps_per_episode
     self._episode_log_file = episode_log_file
+    self._episode_log_format = episode_log_format
     self._episode_writer = None
+    self._profiler = None
+    if profile_sampling_rate > 0:
+      self._profiler = profiler.Profiler(profile_sampling_rate,
+                                         profile_max_trace_events)
 
-  def _set_up(self, eval_mode):
-    """Sets up the runner by creating and initializing the agent."""
+  def _set_up(self, eval_mode, **agent_kwargs):
+    """Sets up the runner by creating and initializing the agent.
+
+    Args:
+      eval_mode: bool, whether the agent is in evaluation mode.
+      **agent_kwargs: Additional keyword arguments to create_agent_fn.
+    """
     # Reset the tf default graph to avoid name collisions from previous runs
     # before doing anything else.
     tf.reset_default_graph()
     self._summary_writer = tf.summary.FileWriter(self._output_dir)
     if self._episode_log_file:
-      self._episode_writer = tf.io.TFRecordWriter(
-          os.path.join(self._output_dir, self._episode_log_file))
+      self._episode_writer = episode_logger.create_episode_writer(
+          os.path.join(self._output_dir, self._episode_log_file),
+          self._env.observation_space,
+          multi_user=isinstance(self._env.environment,
+                                environment.MultiUserEnvironment),
+          file_format=self._episode_log_format)
     # Set up a session and initialize variables.
     self._sess = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
     self._agent = self._create_agent_fn(
         self._sess,
         self._env,
         summary_writer=self._summary_writer,
-        eval_mode=eval_mode)
+        eval_mode=eval_mode,
+        **agent_kwargs)
     # type check: env/agent must both be multi- or single-user
     if self._agent.multi_user and not isinstance(
         self._env.environment, environment.MultiUserEnvironment):
@@ -164,8 +225,8 @@ class Runner(object):
         checkpoint.
       start_step: The step number to be continued after the latest checkpoint.
     """
-    self._checkpointer = checkpointer.Checkpointer(self._checkpoint_dir,
-                                                   checkpoint_file_prefix)
+    self._checkpointer = _AtomicCheckpointer(self._checkpoint_dir,
+                                             checkpoint_file_prefix)
     start_iteration = 0
     start_step = 0
     # Check if checkpoint exists.
@@ -189,8 +250,8 @@ class Runner(object):
     return start_iteration, start_step
 
   def _log_one_step(self, user_obs, doc_obs, slate, responses, reward,
-                    is_terminal, sequence_example):
-    """Adds one step of agent-environment interaction into SequenceExample.
+                    is_terminal):
+    """Adds one step of agent-environment interaction to the episode log.
 
     Args:
       user_obs: An array of floats representing user state observations
@@ -199,55 +260,16 @@ class Runner(object):
       responses: A list of observations of responses for items in the slate
       reward: A float for the reward returned after this step
       is_terminal: A boolean for whether a terminal state has been reached
-      sequence_example: A SequenceExample proto for logging current episode
     """
-
-    def _add_float_feature(feature, values):
-      feature.feature.add(float_list=tf.train.FloatList(value=values))
-
-    def _add_int64_feature(feature, values):
-      feature.feature.add(int64_list=tf.train.Int64List(value=values))
-
     if self._episode_writer is None:
       return
-    fl = sequence_example.feature_lists.feature_list
-
-    if isinstance(self._env.environment, environment.MultiUserEnvironment):
-      for i, (single_user,
-              single_slate,
-              single_user_responses,
-              single_reward) in enumerate(zip(user_obs,
-                                              slate,
-                                              responses,
-                                              reward)):
-        user_space = list(self._env.observation_space.spaces['user'].spaces)[i]
-        _add_float_feature(fl['user_%d' % i], spaces.flatten(
-            user_space, single_user))
-        _add_int64_feature(fl['slate_%d' % i], single_slate)
-        _add_float_feature(fl['reward_%d' % i], [single_reward])
-        for j, response in enumerate(single_user_responses):
-          resp_space = self._env.observation_space.spaces['response'][i][0]
-          for k in response:
-            _add_float_feature(fl['response_%d_%d_%s' % (i, j, k)],
-                               spaces.flatten(resp_space, response))
-    else:  # single-user environment
-      _add_float_feature(
-          fl['user'],
-          spaces.flatten(self._env.observation_space.spaces['user'], user_obs))
-      _add_int64_feature(fl['slate'], slate)
-      for i, response in enumerate(responses):
-        resp_space = self._env.observation_space.spaces['response'][0]
-        for k in response:
-          _add_float_feature(fl['response_%d_%s' % (i, k)],
-                             spaces.flatten(resp_space, response))
-      _add_float_feature(fl['reward'], [reward])
-
-    for i, doc in enumerate(list(doc_obs.values())):
-      doc_space = list(
-          self._env.observation_space.spaces['doc'].spaces.values())[i]
-      _add_float_feature(fl['doc_%d' % i], spaces.flatten(doc_space, doc))
-
-    _add_int64_feature(fl['is_terminal'], [is_terminal])
+    self._episode_writer.log_step(user_obs, doc_obs, slate, responses, reward,
+                                  is_terminal)
+
+  def _flush_episode_log(self):
+    """Writes the logged episodes to disk."""
+    if self._episode_writer is not None:
+      self._episode_writer.flush()
 
   def _run_one_episode(self):
     """Executes a full trajectory of the agent interacting with the environment.
@@ -260,19 +282,25 @@ class Runner(object):
 
     start_time = time.time()
 
-    sequence_example = tf.train.SequenceExample()
-    observation = self._env.reset()
-    action = self._agent.begin_episode(observation)
+    profiler.set_profiler(self._profiler)
+    self._begin_profiled_step()
+    with profiler.span('gym/reset'):
+      observation = self._env.reset()
+    with profiler.span('agent/begin_episode'):
+      action = self._agent.begin_episode(observation)
 
     # Keep interacting until we reach a terminal state.
     while True:
       last_observation = observation
-      observation, reward, done, info = self._env.step(action)
-      self._log_one_step(last_observation['user'], last_observation['doc'],
-                         action, observation['response'], reward, done,
-                         sequence_example)
+      self._begin_profiled_step()
+      with profiler.span('gym/step'):
+        observation, reward, done, info = self._env.step(action)
+      with profiler.span('runner/log_one_step'):
+        self._log_one_step(last_observation['user'], last_observation['doc'],
+                           action, observation['response'], reward, done)
       # Update environment-specific metrics with responses to the slate.
-      self._env.update_metrics(observation['response'], info)
+      with profiler.span('runner/update_metrics'):
+        self._env.update_metrics(observation['response'], info)
 
       total_reward += reward
       step_number += 1
@@ -283,11 +311,13 @@ class Runner(object):
         # Stop the run loop once we reach the true end of episode.
         break
       else:
-        action = self._agent.step(reward, observation)
+        with profiler.span('agent/step'):
+          action = self._agent.step(reward, observation)
 
-    self._agent.end_episode(reward, observation)
+    with profiler.span('agent/end_episode'):
+      self._agent.end_episode(reward, observation)
     if self._episode_writer is not None:
-      self._episode_writer.write(sequence_example.SerializeToString())
+      self._episode_writer.end_episode()
 
     time_diff = time.time() - start_time
     self._update_episode_metrics(
@@ -297,6 +327,11 @@ class Runner(object):
 
     return step_number, total_reward
 
+  def _begin_profiled_step(self):
+    """Starts a step of the simulation loop, which may be profiled."""
+    if self._profiler is not None:
+      self._profiler.begin_step()
+
   def _initialize_metrics(self):
     """Initializes the metrics."""
     self._stats = {
@@ -306,6 +341,8 @@ class Runner(object):
     }
     # Initialize environment-specific metrics.
     self._env.reset_metrics()
+    if self._profiler is not None:
+      self._profiler.reset()
 
   def _update_episode_metrics(self, episode_length, episode_time,
                               episode_reward):
@@ -334,6 +371,13 @@ class Runner(object):
     # Environment-specific Tensorboard summaries.
     self._env.write_metrics(add_summary)
 
+    if self._profiler is not None and self._profiler.histograms:
+      self._profiler.write_summaries(self._summary_writer, step, suffix)
+      if self._profiler.max_trace_events:
+        self._profiler.write_trace(
+            os.path.join(self._output_dir,
+                         'trace_%s_%d.json' % (suffix, step)))
+
     self._summary_writer.flush()
 
   def _checkpoint_experiment(self, iteration, total_steps):
@@ -343,14 +387,181 @@ class Runner(object):
       iteration: int, iteration number for checkpointing.
       total_steps: int, total number of steps for all iterations so far.
     """
-    experiment_data = self._agent.bundle_and_checkpoint(self._checkpoint_dir,
-                                                        iteration)
+    self._write_checkpoint(
+        lambda: self._agent.bundle_and_checkpoint(self._checkpoint_dir,
+                                                  iteration), iteration,
+        total_steps)
+
+  def _write_checkpoint(self, write_agent_checkpoint, iteration, total_steps):
+    """Writes the checkpoint of the agent, then the experiment data.
+
+    Args:
+      write_agent_checkpoint: A function taking no arguments that checkpoints
+        the agent and returns its bundle dictionary.
+      iteration: int, iteration number for checkpointing.
+      total_steps: int, total number of steps for all iterations so far.
+    """
+    experiment_data = write_agent_checkpoint()
     if experiment_data:
       experiment_data['current_iteration'] = iteration
       experiment_data['total_steps'] = total_steps
       self._checkpointer.save_checkpoint(iteration, experiment_data)
 
 
+class _EvalShardRunner(Runner):
+  """Runs a shard of evaluation episodes inside a worker process.
+
+  The agent is restored from a checkpoint and frozen (eval_mode=True). Nothing
+  is written to disk; statistics and environment metrics are returned to the
+  parent EvalRunner to be merged.
+  """
+
+  def __init__(self, create_agent_fn, env, max_steps_per_episode):
+    super(_EvalShardRunner, self).__init__(
+        base_dir='',
+        create_agent_fn=create_agent_fn,
+        env=env,
+        max_steps_per_episode=max_steps_per_episode)
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._sess = tf.Session(
+          config=tf.ConfigProto(allow_soft_placement=True))
+      self._agent = self._create_agent_fn(
+          self._sess, self._env, summary_writer=None, eval_mode=True)
+      self._sess.run(tf.global_variables_initializer())
+      self._sess.run(tf.local_variables_initializer())
+
+  def run_episodes(self, checkpoint_dir, checkpoint_version, experiment_data,
+                   first_episode, num_episodes):
+    """Restores the agent and runs num_episodes evaluation episodes.
+
+    Args:
+      checkpoint_dir: str, the directory holding the training checkpoints.
+      checkpoint_version: int, the checkpoint to restore the agent from.
+      experiment_data: dict, the experiment data loaded from the checkpoint.
+      first_episode: int, the index of the first episode of the shard in the
+        evaluation phase.
+      num_episodes: int, the number of episodes to run.
+
+    Returns:
+      stats: A dictionary of per-episode statistics.
+      metrics: A dictionary of environment metrics aggregated over the
+        episodes.
+    """
+    with self._graph.as_default():
+      assert self._agent.unbundle(checkpoint_dir, checkpoint_version,
+                                  experiment_data)
+      self._env.reset_sampler(first_episode)
+      self._initialize_metrics()
+      for _ in range(num_episodes):
+        self._run_one_episode()
+    return self._stats, dict(self._env.metrics or {})
+
+
+def _run_eval_shard(shard):
+  """Runs one shard of a parallel evaluation phase in a worker process."""
+  gin.parse_config(shard['gin_config'], skip_unknown=True)
+  env = shard['create_environment_fn'](shard['env_config'])
+  # Seeds the global numpy RNG used by agents.
+  env.seed(shard['agent_seed'])
+  runner = _EvalShardRunner(shard['create_agent_fn'], env,
+                            shard['max_steps_per_episode'])
+  try:
+    return runner.run_episodes(shard['checkpoint_dir'],
+                               shard['checkpoint_version'],
+                               shard['experiment_data'],
+                               shard['first_episode'], shard['num_episodes'])
+  finally:
+    # Workers of concurrent evaluations run many shards.
+    runner._sess.close()  # pylint: disable=protected-access
+
+
+class _ActorRunner(Runner):
+  """Collects experience for a learner inside an actor process.
+
+  The agent stores its transitions in a shard of the learner's shared-memory
+  replay buffer and, before every episode, reloads the latest weights
+  published by the learner. Statistics and environment metrics of every
+  episode are sent to the learner through a queue.
+  """
+
+  def __init__(self, create_agent_fn, env, max_steps_per_episode,
+               replay_memory):
+    super(_ActorRunner, self).__init__(
+        base_dir='',
+        create_agent_fn=create_agent_fn,
+        env=env,
+        max_steps_per_episode=max_steps_per_episode)
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._sess = tf.Session(
+          config=tf.ConfigProto(allow_soft_placement=True))
+      self._agent = self._create_agent_fn(
+          self._sess,
+          self._env,
+          summary_writer=None,
+          eval_mode=False,
+          replay_memory=replay_memory)
+      self._saver = tf.train.Saver()
+      self._sess.run(tf.global_variables_initializer())
+      self._sess.run(tf.local_variables_initializer())
+
+  def run_episodes(self, weights_dir, episode_queue, stop_event):
+    """Runs episodes until stop_event is set.
+
+    Args:
+      weights_dir: str, the directory holding the weights published by the
+        learner.
+      episode_queue: A multiprocessing queue receiving the statistics and
+        environment metrics of every episode.
+      stop_event: A multiprocessing event signaling the actor to stop.
+    """
+    checkpoint = None
+    with self._graph.as_default():
+      while not stop_event.is_set():
+        latest_checkpoint = tf.train.latest_checkpoint(weights_dir)
+        if latest_checkpoint is not None and latest_checkpoint != checkpoint:
+          try:
+            self._saver.restore(self._sess, latest_checkpoint)
+            checkpoint = latest_checkpoint
+          except tf.errors.NotFoundError:
+            # Deleted by the learner since, the next ones will be restored.
+            pass
+        self._initialize_metrics()
+        self._run_one_episode()
+        episode_queue.put((self._stats, dict(self._env.metrics or {})))
+
+
+def _run_actor(actor):
+  """Runs an actor of the actor/learner training mode in a worker process."""
+  gin.parse_config(actor['gin_config'], skip_unknown=True)
+  env_config = dict(actor['env_config'], seed=actor['seed'])
+  env = actor['create_environment_fn'](env_config)
+  # Seeds the global numpy RNG used by agents.
+  env.seed(actor['seed'])
+  runner = _ActorRunner(actor['create_agent_fn'], env,
+                        actor['max_steps_per_episode'], actor['replay_memory'])
+  try:
+    runner.run_episodes(actor['weights_dir'], actor['episode_queue'],
+                        actor['stop_event'])
+  finally:
+    actor['replay_memory'].close()
+
+
+def derive_worker_seeds(seed, num_workers):
+  """Derives deterministic, statistically independent seeds for workers.
+
+  Args:
+    seed: int, the seed of the environment being replicated.
+    num_workers: int, the number of seeds to derive.
+
+  Returns:
+    A list of num_workers integer seeds.
+  """
+  streams = random_streams.RandomStreams(seed)
+  return [streams.integer_seed(worker) for worker in range(num_workers)]
+
+
 @gin.configurable
 class TrainRunner(Runner):
   """Object that handles running the training.
@@ -358,8 +569,47 @@ class TrainRunner(Runner):
   See main.py for a simple example to train an agent.
   """
 
-  def __init__(self, max_training_steps=250000, num_iterations=100,
-               checkpoint_frequency=1, **kwargs):
+  def __init__(self,
+               max_training_steps=250000,
+               num_iterations=100,
+               checkpoint_frequency=1,
+               num_actors=0,
+               create_environment_fn=None,
+               env_config=None,
+               max_pending_checkpoints=0,
+               actor_sync_steps=100,
+               **kwargs):
+    """Initializes the TrainRunner.
+
+    Args:
+      max_training_steps: int, the number of environment steps per iteration.
+      num_iterations: int, the number of training iterations.
+      checkpoint_frequency: int, the number of iterations between checkpoints.
+      num_actors: int, the number of actor processes. With 0 (the default),
+        episodes are simulated and learned from serially in this process.
+        Otherwise, actor processes simulate episodes and add their transitions
+        to a shared-memory replay buffer, from which this process (the
+        learner) trains. The agent must then be a DQNAgentRecSim and
+        create_agent_fn must pass additional keyword arguments to it. Actors
+        reload the weights that the learner publishes every actor_sync_steps
+        training steps.
+      create_environment_fn: A function that takes an env_config dictionary
+        and returns an environment replica. Required if num_actors > 0.
+      env_config: A dictionary of environment parameters, including `seed`,
+        passed to create_environment_fn. Each actor gets a copy whose seed is
+        derived deterministically from env_config['seed'].
+      max_pending_checkpoints: int, the number of checkpoints that may be
+        written in the background while training continues. With 0 (the
+        default), checkpoints are written synchronously. Otherwise, the
+        agent's state is snapshotted at the end of the iteration, and training
+        waits for the oldest pending checkpoint when there are too many. Each
+        pending snapshot holds a copy of the replay memory, so peak memory
+        grows by one replay buffer per pending checkpoint.
+      actor_sync_steps: int, the number of training steps of the learner
+        between publications of its weights to the actors, independently of
+        checkpoint_frequency. Only used if num_actors > 0.
+      **kwargs: Keyword arguments to the Runner.
+    """
     tf.logging.info(
         'max_training_steps = %s, number_iterations = %s,'
         'checkpoint frequency = %s iterations.', max_training_steps,
@@ -369,11 +619,33 @@ class TrainRunner(Runner):
     self._max_training_steps = max_training_steps
     self._num_iterations = num_iterations
     self._checkpoint_frequency = checkpoint_frequency
+    if num_actors > 0:
+      if create_environment_fn is None or env_config is None:
+        raise ValueError('The actor/learner mode requires '
+                         'create_environment_fn and env_config.')
+      if self._episode_log_file:
+        raise ValueError('Episode logging is not supported in the '
+                         'actor/learner mode.')
+    self._num_actors = num_actors
+    self._create_environment_fn = create_environment_fn
+    self._env_config = env_config
+    self._actors = []
+    self._max_pending_checkpoints = max_pending_checkpoints
+    self._pending_checkpoints = collections.deque()
+    # A single writer, so that checkpoints are completed in order.
+    self._checkpoint_executor = futures.ThreadPoolExecutor(max_workers=1)
 
     self._output_dir = os.path.join(self._base_dir, 'train')
     self._checkpoint_dir = os.path.join(self._output_dir, 'checkpoints')
+    self._actor_sync_steps = actor_sync_steps
+    self._actor_weights_dir = os.path.join(self._output_dir, 'actor_weights')
 
-    self._set_up(eval_mode=False)
+    if num_actors > 0:
+      self._set_up(eval_mode=False, num_replay_shards=num_actors)
+      self._weights_saver = tf.train.Saver(
+          max_to_keep=_MAX_ACTOR_WEIGHTS_TO_KEEP)
+    else:
+      self._set_up(eval_mode=False)
 
   def run_experiment(self):
     """Runs a full experiment, spread over multiple iterations."""
@@ -385,32 +657,172 @@ class TrainRunner(Runner):
                          self._num_iterations, start_iter)
       return
 
-    for iteration in range(start_iter, self._num_iterations):
-      tf.logging.info('Starting iteration %d', iteration)
-      total_steps = self._run_train_phase(total_steps)
-      if iteration % self._checkpoint_frequency == 0:
-        self._checkpoint_experiment(iteration, total_steps)
+    if self._num_actors > 0:
+      self._start_actors()
+    try:
+      for iteration in range(start_iter, self._num_iterations):
+        tf.logging.info('Starting iteration %d', iteration)
+        total_steps = self._run_train_phase(total_steps)
+        if iteration % self._checkpoint_frequency == 0:
+          self._checkpoint_experiment(iteration, total_steps)
+    finally:
+      self._wait_for_checkpoints(0)
+      if self._num_actors > 0:
+        self._stop_actors()
+
+  def _checkpoint_experiment(self, iteration, total_steps):
+    """Checkpoints experiment data, in the background if enabled.
+
+    Args:
+      iteration: int, iteration number for checkpointing.
+      total_steps: int, total number of steps for all iterations so far.
+    """
+    if self._max_pending_checkpoints <= 0:
+      super(TrainRunner, self)._checkpoint_experiment(iteration, total_steps)
+      return
+    # Bounds the number of snapshots held in memory.
+    self._wait_for_checkpoints(self._max_pending_checkpoints - 1)
+    write_agent_checkpoint = self._agent.checkpoint_snapshot(
+        self._checkpoint_dir, iteration)
+    self._pending_checkpoints.append(
+        self._checkpoint_executor.submit(self._write_checkpoint,
+                                         write_agent_checkpoint, iteration,
+                                         total_steps))
+
+  def _wait_for_checkpoints(self, max_pending):
+    """Waits until at most max_pending checkpoints are being written."""
+    while len(self._pending_checkpoints) > max_pending:
+      # Raises any error from writing the checkpoint.
+      self._pending_checkpoints.popleft().result()
 
   def _run_train_phase(self, total_steps):
     """Runs training phase and updates total_steps."""
 
     self._initialize_metrics()
 
-    num_steps = 0
-
-    while num_steps < self._max_training_steps:
-      episode_length, _ = self._run_one_episode()
-      num_steps += episode_length
+    if self._num_actors > 0:
+      num_steps = self._run_learner_steps()
+    else:
+      num_steps = 0
+      while num_steps < self._max_training_steps:
+        episode_length, _ = self._run_one_episode()
+        num_steps += episode_length
 
     total_steps += num_steps
     self._write_metrics(total_steps, suffix='train')
+    self._flush_episode_log()
     return total_steps
 
+  def _start_actors(self):
+    """Starts the actor processes, each filling one shard of the replay."""
+    # Forking a process with a live TensorFlow runtime is unsafe, so actors
+    # are spawned from scratch.
+    context = multiprocessing.get_context('spawn')
+    self._episode_queue = context.Queue()
+    self._stop_event = context.Event()
+    replay_memory = self._agent.replay_memory
+    # Actors start from the weights of the learner, which may have resumed.
+    tf.io.gfile.makedirs(self._actor_weights_dir)
+    self._publish_weights()
+    seeds = derive_worker_seeds(
+        self._env_config.get('seed', 0), self._num_actors)
+    gin_config = gin.config_str()
+    for seed, shard in zip(seeds, replay_memory.shards):
+      actor = {
+          'gin_config': gin_config,
+          'create_environment_fn': self._create_environment_fn,
+          'create_agent_fn': self._create_agent_fn,
+          'env_config': self._env_config,
+          'seed': seed,
+          'max_steps_per_episode': self._max_steps_per_episode,
+          'replay_memory': shard,
+          'weights_dir': self._actor_weights_dir,
+          'episode_queue': self._episode_queue,
+          'stop_event': self._stop_event,
+      }
+      process = context.Process(target=_run_actor, args=(actor,))
+      process.start()
+      self._actors.append(process)
+    self._num_trained_transitions = replay_memory.add_count
+
+  def _publish_weights(self):
+    """Saves the weights of the learner for the actors to reload."""
+    self._weights_saver.save(
+        self._sess,
+        os.path.join(self._actor_weights_dir, 'weights'),
+        global_step=self._agent.training_steps,
+        write_meta_graph=False)
+    self._steps_since_weights_published = 0
+
+  def _stop_actors(self):
+    """Stops the actor processes and frees the shared replay memory."""
+    self._stop_event.set()
+    # Actors only exit once the episodes they queued have been consumed.
+    while any(process.is_alive() for process in self._actors):
+      self._collect_actor_episodes()
+      time.sleep(_LEARNER_POLL_SECS)
+    for process in self._actors:
+      process.join()
+    self._actors = []
+    self._agent.replay_memory.close()
+
+  def _collect_actor_episodes(self):
+    """Merges the statistics of the episodes completed by the actors.
+
+    Returns:
+      The number of environment steps in the collected episodes.
+    """
+    num_steps = 0
+    while True:
+      try:
+        stats, metrics = self._episode_queue.get_nowait()
+      except queue.Empty:
+        return num_steps
+      for key, values in stats.items():
+        self._stats[key].extend(values)
+      self._env.merge_metrics(metrics)
+      num_steps += int(np.sum(stats['episode_length']))
+
+  def _run_learner_steps(self):
+    """Trains while the actors take max_training_steps environment steps.
+
+    The learner trains continuously, but runs at most one training step per
+    transition added by the actors, the ratio of the serial mode.
+
+    Returns:
+      The number of environment steps taken by the actors.
+
+    Raises:
+      RuntimeError: if all actor processes have exited.
+    """
+    replay_memory = self._agent.replay_memory
+    profiler.set_profiler(self._profiler)
+    num_steps = 0
+    while num_steps < self._max_training_steps:
+      num_steps += self._collect_actor_episodes()
+      if self._num_trained_transitions < replay_memory.add_count:
+        self._begin_profiled_step()
+        with profiler.span('agent/train_step'):
+          self._agent.train_step()
+        self._num_trained_transitions += 1
+        self._steps_since_weights_published += 1
+        if self._steps_since_weights_published >= self._actor_sync_steps:
+          self._publish_weights()
+      elif any(process.is_alive() for process in self._actors):
+        time.sleep(_LEARNER_POLL_SECS)
+      else:
+        raise RuntimeError('All actor processes have exited.')
+    return num_steps
+
 
 @gin.configurable
 class EvalRunner(Runner):
   """Object that handles running the evaluation.
 
+  Every checkpoint written by the training run is evaluated, in order. New
+  checkpoints are discovered by a CheckpointWatcher, which uses inotify when
+  available and polls the checkpoint directory otherwise.
+
   See main.py for a simple example to evaluate an agent.
   """
 
@@ -419,12 +831,58 @@ class EvalRunner(Runner):
                test_mode=False,
                min_interval_secs=30,
                train_base_dir=None,
+               num_eval_workers=1,
+               create_environment_fn=None,
+               env_config=None,
+               max_concurrent_evals=1,
                **kwargs):
+    """Initializes the EvalRunner.
+
+    Args:
+      max_eval_episodes: int, the number of episodes per evaluation phase.
+      test_mode: bool, whether to stop after evaluating one checkpoint, the
+        latest one when evaluation starts.
+      min_interval_secs: int, the number of seconds between checks for new
+        checkpoints when polling. With inotify, new checkpoints are seen
+        immediately and the directory is rescanned at this interval as a
+        safeguard.
+      train_base_dir: str, the base directory of the training run. Defaults to
+        base_dir.
+      num_eval_workers: int, the number of worker processes to shard evaluation
+        episodes across. With 1 (the default), episodes run serially in this
+        process.
+      create_environment_fn: A function that takes an env_config dictionary
+        and returns an environment replica. Required if num_eval_workers > 1.
+      env_config: A dictionary of environment parameters, including `seed`,
+        passed to create_environment_fn. Workers simulate their episodes as a
+        serial evaluation would, and seed the global numpy RNG of their agent
+        with a seed derived deterministically from env_config['seed'].
+      max_concurrent_evals: int, the number of checkpoints that may be
+        evaluated concurrently, each in num_eval_workers worker processes.
+        With more than 1, even a single worker runs in its own process, seeded
+        as for parallel evaluation, and requires
+        create_environment_fn and env_config. Results are written in
+        checkpoint order.
+      **kwargs: Keyword arguments to the Runner.
+    """
     tf.logging.info('max_eval_episodes = %s', max_eval_episodes)
     super(EvalRunner, self).__init__(**kwargs)
     self._max_eval_episodes = max_eval_episodes
     self._test_mode = test_mode
     self._min_interval_secs = min_interval_secs
+    if num_eval_workers > 1 or max_concurrent_evals > 1:
+      if create_environment_fn is None or env_config is None:
+        raise ValueError('Parallel evaluation requires create_environment_fn '
+                         'and env_config.')
+      if self._episode_log_file:
+        raise ValueError('Episode logging is not supported in parallel '
+                         'evaluation.')
+    self._num_eval_workers = num_eval_workers
+    self._max_concurrent_evals = max_concurrent_evals
+    self._create_environment_fn = create_environment_fn
+    self._env_config = env_config
+    self._checkpoint_version = None
+    self._experiment_data = None
 
     self._output_dir = os.path.join(self._base_dir,
                                     'eval_%s' % max_eval_episodes)
@@ -441,27 +899,83 @@ class EvalRunner(Runner):
     # Use the checkpointer class.
     self._checkpointer = checkpointer.Checkpointer(
         self._checkpoint_dir, self._checkpoint_file_prefix)
-    checkpoint_version = -1
-    # Check new checkpoints in a loop.
+    watcher = checkpoint_watcher.CheckpointWatcher(self._checkpoint_dir,
+                                                   self._min_interval_secs)
+    try:
+      if self._max_concurrent_evals > 1 and not self._test_mode:
+        self._run_concurrent_evals(watcher)
+      else:
+        self._run_serial_evals(watcher)
+    finally:
+      watcher.close()
+
+  def _load_checkpoint(self, checkpoint_version):
+    """Returns the experiment data of a checkpoint, or None if deleted."""
+    experiment_data = self._checkpointer.load_checkpoint(checkpoint_version)
+    if experiment_data is None:
+      # The training run only keeps its most recent checkpoints.
+      tf.logging.warning(
+          'Checkpoint %d was deleted before it could be evaluated.',
+          checkpoint_version)
+    return experiment_data
+
+  def _run_serial_evals(self, watcher):
+    """Evaluates the checkpoints one at a time as they are written."""
     while True:
-      # Check if checkpoint exists.
-      # Note that the existence of checkpoint 0 means that we have finished
-      # iteration 0 (so we will start from iteration 1).
-      latest_checkpoint_version = checkpointer.get_latest_checkpoint_number(
-          self._checkpoint_dir)
-      # checkpoints_iterator already makes sure a new checkpoint exists.
-      if latest_checkpoint_version <= checkpoint_version:
-        time.sleep(self._min_interval_secs)
-        continue
-      checkpoint_version = latest_checkpoint_version
-      experiment_data = self._checkpointer.load_checkpoint(
-          latest_checkpoint_version)
-      assert self._agent.unbundle(self._checkpoint_dir,
-                                  latest_checkpoint_version, experiment_data)
-
-      self._run_eval_phase(experiment_data['total_steps'])
+      checkpoint_versions = watcher.wait_for_new_versions()
       if self._test_mode:
-        break
+        checkpoint_versions = checkpoint_versions[-1:]
+      for checkpoint_version in checkpoint_versions:
+        experiment_data = self._load_checkpoint(checkpoint_version)
+        if experiment_data is None:
+          continue
+        assert self._agent.unbundle(self._checkpoint_dir, checkpoint_version,
+                                    experiment_data)
+        self._checkpoint_version = checkpoint_version
+        self._experiment_data = experiment_data
+
+        self._run_eval_phase(experiment_data['total_steps'])
+        if self._test_mode:
+          return
+
+  def _run_concurrent_evals(self, watcher):
+    """Evaluates up to max_concurrent_evals checkpoints at a time.
+
+    The episodes of every checkpoint are sharded across num_eval_workers
+    processes of a pool shared by all evaluations.
+
+    Args:
+      watcher: The CheckpointWatcher of the checkpoint directory.
+    """
+    queued_versions = collections.deque()
+    # The total steps and pending shard results of the running evaluations.
+    running_evals = collections.deque()
+    # Forking a process with a live TensorFlow runtime is unsafe, so workers
+    # are spawned from scratch.
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(self._max_concurrent_evals * self._num_eval_workers)
+    try:
+      while True:
+        while running_evals and running_evals[0][1].ready():
+          total_steps, results = running_evals.popleft()
+          self._initialize_metrics()
+          episode_rewards = self._merge_eval_results(results.get())
+          self._write_eval_results(total_steps, episode_rewards)
+        while (queued_versions and
+               len(running_evals) < self._max_concurrent_evals):
+          checkpoint_version = queued_versions.popleft()
+          experiment_data = self._load_checkpoint(checkpoint_version)
+          if experiment_data is None:
+            continue
+          shards = self._eval_shards(checkpoint_version, experiment_data)
+          running_evals.append((experiment_data['total_steps'],
+                                pool.map_async(_run_eval_shard, shards)))
+        queued_versions.extend(
+            watcher.wait_for_new_versions(
+                timeout=_EVAL_POLL_SECS if running_evals else None))
+    finally:
+      pool.terminate()
+      pool.join()
 
   def _run_eval_phase(self, total_steps):
     """Runs evaluation phase given model has been trained for total_steps."""
@@ -469,17 +983,93 @@ class EvalRunner(Runner):
     self._env.reset_sampler()
     self._initialize_metrics()
 
-    num_episodes = 0
-    episode_rewards = []
+    if self._num_eval_workers > 1:
+      episode_rewards = self._run_parallel_eval_episodes()
+    else:
+      num_episodes = 0
+      episode_rewards = []
+
+      while num_episodes < self._max_eval_episodes:
+        _, episode_reward = self._run_one_episode()
+        episode_rewards.append(episode_reward)
+        num_episodes += 1
 
-    while num_episodes < self._max_eval_episodes:
-      _, episode_reward = self._run_one_episode()
-      episode_rewards.append(episode_reward)
-      num_episodes += 1
+    self._write_eval_results(total_steps, episode_rewards)
 
+  def _write_eval_results(self, total_steps, episode_rewards):
+    """Writes the metrics and returns of an evaluation phase."""
     self._write_metrics(total_steps, suffix='eval')
+    self._flush_episode_log()
 
     output_file = os.path.join(self._output_dir, 'returns_%s' % total_steps)
     tf.logging.info('eval_file: %s', output_file)
     with tf.io.gfile.GFile(output_file, 'w+') as f:
       f.write(str(episode_rewards))
+
+  def _run_parallel_eval_episodes(self):
+    """Shards the evaluation episodes across a pool of worker processes.
+
+    Each worker builds its own environment replica from env_config, restores
+    the agent from the current checkpoint and runs a contiguous range of the
+    episodes. The random streams of the environment are keyed by episode, so
+    the workers simulate the same users and documents as a serial evaluation;
+    only the global numpy RNG of the agents is seeded per worker. Per-episode
+    statistics are concatenated in shard order and environment metrics are
+    summed, so results are deterministic for a given number of workers.
+
+    Returns:
+      A list of episode rewards.
+    """
+    shards = self._eval_shards(self._checkpoint_version, self._experiment_data)
+    # Forking a process with a live TensorFlow runtime is unsafe, so workers
+    # are spawned from scratch.
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(self._num_eval_workers)
+    try:
+      results = pool.map(_run_eval_shard, shards)
+    finally:
+      pool.close()
+      pool.join()
+    return self._merge_eval_results(results)
+
+  def _eval_shards(self, checkpoint_version, experiment_data):
+    """Returns the work of the workers evaluating a checkpoint."""
+    shard_sizes = [
+        len(shard) for shard in np.array_split(
+            np.arange(self._max_eval_episodes), self._num_eval_workers)
+    ]
+    first_episodes = np.cumsum([0] + shard_sizes[:-1]).tolist()
+    seeds = derive_worker_seeds(
+        self._env_config.get('seed', 0), self._num_eval_workers)
+    gin_config = gin.config_str()
+    shards = [{
+        'gin_config': gin_config,
+        'create_environment_fn': self._create_environment_fn,
+        'create_agent_fn': self._create_agent_fn,
+        'env_config': self._env_config,
+        'agent_seed': seed,
+        'max_steps_per_episode': self._max_steps_per_episode,
+        'checkpoint_dir': self._checkpoint_dir,
+        'checkpoint_version': checkpoint_version,
+        'experiment_data': experiment_data,
+        'first_episode': first_episode,
+        'num_episodes': num_episodes,
+    } for seed, first_episode, num_episodes in zip(seeds, first_episodes,
+                                                   shard_sizes)]
+    return shards
+
+  def _merge_eval_results(self, results):
+    """Merges the statistics and metrics of the shards of an evaluation.
+
+    Args:
+      results: A list of the (stats, metrics) pairs returned by the workers,
+        in shard order.
+
+    Returns:
+      A list of episode rewards.
+    """
+    for stats, metrics in results:
+      for key, values in stats.items():
+        self._stats[key].extend(values)
+      self._env.merge_metrics(metrics)
+    return list(self._stats['episode_reward'])
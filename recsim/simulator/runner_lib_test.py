@@ -0,0 +1,173 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.runner_lib."""
+
+import os
+
+import gin
+from recsim import agent
+from recsim.agents import full_slate_q_agent
+from recsim.environments import interest_exploration as ie
+from recsim.simulator import runner_lib
+import tensorflow.compat.v1 as tf
+from tensorflow.python.eager import context  # pylint: disable=g-direct-tensorflow-import
+
+_ENV_CONFIG = {
+    'num_candidates': 5,
+    'slate_size': 2,
+    'resample_documents': True,
+    'seed': 0,
+}
+
+
+class _FirstDocumentsAgent(agent.AbstractEpisodicRecommenderAgent):
+  """Recommends the first documents of the candidate set."""
+
+  def step(self, reward, observation):
+    del reward, observation  # Unused.
+    return list(range(self._slate_size))
+
+
+def _create_agent(sess, env, summary_writer, eval_mode):
+  del sess, eval_mode  # Unused.
+  return _FirstDocumentsAgent(env.action_space, summary_writer=summary_writer)
+
+
+def _create_dqn_agent(sess, env, summary_writer, eval_mode, **kwargs):
+  return full_slate_q_agent.FullSlateQAgent(
+      sess,
+      observation_space=env.observation_space,
+      action_space=env.action_space,
+      eval_mode=eval_mode,
+      summary_writer=summary_writer,
+      factorized_head=True,
+      min_replay_history=2,
+      update_period=1,
+      **kwargs)
+
+
+class RunnerLibTest(tf.test.TestCase):
+
+  def tearDown(self):
+    gin.clear_config()
+    super(RunnerLibTest, self).tearDown()
+
+  def test_derive_worker_seeds(self):
+    seeds = runner_lib.derive_worker_seeds(0, 4)
+    self.assertLen(seeds, 4)
+    self.assertLen(set(seeds), 4)
+    self.assertEqual(seeds, runner_lib.derive_worker_seeds(0, 4))
+    self.assertNotEqual(seeds, runner_lib.derive_worker_seeds(1, 4))
+
+  def test_atomic_checkpointer(self):
+    checkpoint_dir = self.get_temp_dir()
+    checkpointer = runner_lib._AtomicCheckpointer(checkpoint_dir, 'ckpt')
+    checkpointer.save_checkpoint(3, {'total_steps': 7})
+    self.assertEqual(
+        sorted(os.listdir(checkpoint_dir)),
+        ['ckpt.3', 'sentinel_checkpoint_complete.3'])
+    self.assertEqual(checkpointer.load_checkpoint(3), {'total_steps': 7})
+
+  def test_background_checkpoint(self):
+    base_dir = os.path.join(self.get_temp_dir(), 'background_checkpoint')
+    with context.graph_mode():
+      train_runner = runner_lib.TrainRunner(
+          base_dir=base_dir,
+          create_agent_fn=_create_agent,
+          env=ie.create_environment(_ENV_CONFIG),
+          max_training_steps=4,
+          max_steps_per_episode=4,
+          num_iterations=2,
+          max_pending_checkpoints=1)
+      train_runner.run_experiment()
+    checkpoint_dir = os.path.join(base_dir, 'train', 'checkpoints')
+    self.assertIn('sentinel_checkpoint_complete.1', os.listdir(checkpoint_dir))
+
+  def test_actor_learner_training(self):
+    base_dir = os.path.join(self.get_temp_dir(), 'actor_learner')
+    # Actors receive the gin configuration of the learner.
+    gin.bind_parameter('ShardedReplayBuffer.replay_capacity', 1000)
+    with context.graph_mode():
+      train_runner = runner_lib.TrainRunner(
+          base_dir=base_dir,
+          create_agent_fn=_create_dqn_agent,
+          env=ie.create_environment(_ENV_CONFIG),
+          max_training_steps=20,
+          max_steps_per_episode=4,
+          num_iterations=1,
+          num_actors=2,
+          actor_sync_steps=1,
+          create_environment_fn=ie.create_environment,
+          env_config=_ENV_CONFIG)
+      train_runner.run_experiment()
+    self.assertGreaterEqual(sum(train_runner._stats['episode_length']), 20)
+    weights_dir = os.path.join(base_dir, 'train', 'actor_weights')
+    latest_weights = tf.train.latest_checkpoint(weights_dir)
+    # Weights were published during the iteration, not only at its start.
+    self.assertGreater(int(latest_weights.rsplit('-', 1)[1]), 0)
+    checkpoint_dir = os.path.join(base_dir, 'train', 'checkpoints')
+    self.assertIn('sentinel_checkpoint_complete.0', os.listdir(checkpoint_dir))
+
+  def _run_eval(self, train_base_dir, num_eval_workers):
+    base_dir = os.path.join(self.get_temp_dir(),
+                            'eval_workers_%d' % num_eval_workers)
+    eval_runner = runner_lib.EvalRunner(
+        base_dir=base_dir,
+        train_base_dir=train_base_dir,
+        create_agent_fn=_create_agent,
+        env=ie.create_environment(_ENV_CONFIG),
+        max_eval_episodes=5,
+        max_steps_per_episode=4,
+        test_mode=True,
+        num_eval_workers=num_eval_workers,
+        create_environment_fn=ie.create_environment,
+        env_config=_ENV_CONFIG)
+    eval_runner.run_experiment()
+    return eval_runner
+
+  def test_parallel_eval(self):
+    train_base_dir = os.path.join(self.get_temp_dir(), 'train_run')
+    # The runners use TF1 graphs and sessions.
+    with context.graph_mode():
+      train_runner = runner_lib.TrainRunner(
+          base_dir=train_base_dir,
+          create_agent_fn=_create_agent,
+          env=ie.create_environment(_ENV_CONFIG),
+          max_training_steps=4,
+          max_steps_per_episode=4,
+          num_iterations=1)
+      train_runner.run_experiment()
+      serial = self._run_eval(train_base_dir, num_eval_workers=1)
+      parallel = self._run_eval(train_base_dir, num_eval_workers=2)
+      rerun = self._run_eval(train_base_dir, num_eval_workers=2)
+
+    stats = parallel._stats
+    self.assertLen(stats['episode_reward'], 5)
+    self.assertLen(stats['episode_length'], 5)
+    # Shards simulate the same episodes as a serial evaluation.
+    for key in ['episode_reward', 'episode_length']:
+      self.assertEqual(serial._stats[key], stats[key])
+      self.assertEqual(rerun._stats[key], stats[key])
+    self.assertNotEmpty(parallel._env.metrics)
+    self.assertEqual(serial._env.metrics, parallel._env.metrics)
+    self.assertEqual(rerun._env.metrics, parallel._env.metrics)
+    with tf.io.gfile.GFile(
+        os.path.join(parallel._output_dir, 'returns_4')) as f:
+      self.assertEqual(str(stats['episode_reward']), f.read())
+
+
+if __name__ == '__main__':
+  tf.test.main()
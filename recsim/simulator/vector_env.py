@@ -0,0 +1,475 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Vectorized wrappers stepping several RecSimGymEnv instances at once.
+
+A vector environment batches reset and step over num_envs replicas of a
+RecSimGymEnv and returns their observations stacked into arrays whose leading
+dimension indexes environments. The nested structure of an observation follows
+the observation space of the wrapped environment, where a Tuple of identical
+spaces is stacked into an extra axis rather than kept as a tuple:
+
+  user: An array of shape [num_envs, ...], or [num_envs, num_users, ...] for a
+    MultiUserEnvironment.
+  doc: An array (or dictionary of arrays) of shape
+    [num_envs, num_candidates, ...], in the order of the candidate set.
+  response: A dictionary of arrays of shape [num_envs, slate_size], or
+    [num_envs, num_users, slate_size] for a MultiUserEnvironment. Responses
+    are zero after a reset and for the positions of shorter slates.
+
+Episodes are reset automatically as soon as they are done, in which case the
+returned observation is the first observation of the next episode and the
+last observation of the finished one is returned in info under
+'terminal_observation'.
+
+SyncVectorEnv steps the replicas one after the other in the calling process.
+AsyncVectorEnv runs every replica in a worker process, which writes its
+observations straight into arrays in shared memory, so that only actions,
+rewards and infos go through pipes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import abc
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+import traceback
+
+from gym import spaces
+import numpy as np
+from recsim import random_streams
+import six
+
+_LEAF = 0
+_DICT = 1
+_TUPLE = 2
+_STACK = 3
+
+# Shared arrays are aligned to cache lines.
+_ALIGNMENT = 64
+
+
+def _compile(space):
+  """Returns the nested stacking spec of a gym space."""
+  if isinstance(space, spaces.Dict):
+    return (_DICT,
+            collections.OrderedDict(
+                (key, _compile(subspace))
+                for key, subspace in space.spaces.items()))
+  if isinstance(space, spaces.Tuple):
+    subspaces = space.spaces
+    if subspaces and all(subspace == subspaces[0] for subspace in subspaces):
+      return (_STACK, len(subspaces), _compile(subspaces[0]))
+    return (_TUPLE, tuple(_compile(subspace) for subspace in subspaces))
+  return (_LEAF, space.shape, space.dtype)
+
+
+def compile_observation_spec(observation_space):
+  """Returns the stacking spec of a RecSimGymEnv observation space.
+
+  The documents of the candidate set, keyed by document id in observations,
+  are stacked in candidate set order.
+
+  Args:
+    observation_space: The observation space of a RecSimGymEnv, a Dict space
+      with keys `user`, `doc` and `response`.
+
+  Returns:
+    A nested spec of the stacked observations.
+  """
+  doc_spaces = list(observation_space['doc'].spaces.values())
+  return (_DICT,
+          collections.OrderedDict([
+              ('user', _compile(observation_space['user'])),
+              ('doc', (_STACK, len(doc_spaces), _compile(doc_spaces[0]))),
+              ('response', _compile(observation_space['response'])),
+          ]))
+
+
+def _allocate(spec, shape, allocate_fn):
+  """Allocates the arrays of a spec with the given leading shape."""
+  kind = spec[0]
+  if kind == _LEAF:
+    return allocate_fn(shape + spec[1], spec[2])
+  if kind == _DICT:
+    return collections.OrderedDict(
+        (key, _allocate(subspec, shape, allocate_fn))
+        for key, subspec in spec[1].items())
+  if kind == _TUPLE:
+    return tuple(_allocate(subspec, shape, allocate_fn) for subspec in spec[1])
+  return _allocate(spec[2], shape + (spec[1],), allocate_fn)
+
+
+def _map_arrays(fn, arrays):
+  """Applies fn to every array of a nested structure of arrays."""
+  if isinstance(arrays, dict):
+    return collections.OrderedDict(
+        (key, _map_arrays(fn, value)) for key, value in arrays.items())
+  if isinstance(arrays, tuple):
+    return tuple(_map_arrays(fn, value) for value in arrays)
+  return fn(arrays)
+
+
+def _fill_zeros(arrays, index):
+
+  def fill(array):
+    array[index] = 0
+
+  _map_arrays(fill, arrays)
+
+
+def _write(spec, value, out, index):
+  """Writes a nested value into the arrays out at index."""
+  kind = spec[0]
+  if kind == _LEAF:
+    out[index] = value
+  elif kind == _DICT:
+    for key, subspec in spec[1].items():
+      _write(subspec, value[key], out[key], index)
+  elif kind == _TUPLE:
+    for subspec, subvalue, subout in zip(spec[1], value, out):
+      _write(subspec, subvalue, subout, index)
+  else:
+    if isinstance(value, dict):
+      value = value.values()
+    count = 0
+    for subvalue in value:
+      _write(spec[2], subvalue, out, index + (count,))
+      count += 1
+    if count < spec[1]:
+      _fill_zeros(out, index + (slice(count, None),))
+
+
+def write_observation(spec, observation, out, env_index):
+  """Writes the observation of one environment into stacked arrays.
+
+  Args:
+    spec: The spec returned by compile_observation_spec.
+    observation: An observation returned by RecSimGymEnv reset or step.
+    out: The stacked observation arrays.
+    env_index: The index of the environment in the leading dimension.
+  """
+  index = (env_index,)
+  for key, subspec in spec[1].items():
+    value = observation[key]
+    if value is None:
+      _fill_zeros(out[key], index)
+    else:
+      _write(subspec, value, out[key], index)
+
+
+def _seeded_configs(env_config, num_envs):
+  """Returns the env_configs of num_envs independently seeded replicas."""
+  streams = random_streams.RandomStreams(env_config.get('seed', 0))
+  return [
+      dict(env_config, seed=streams.integer_seed(i)) for i in range(num_envs)
+  ]
+
+
+@six.add_metaclass(abc.ABCMeta)
+class VectorEnv(object):
+  """Base class of environments stepping several RecSimGymEnvs at once.
+
+  Attributes:
+    num_envs: The number of environment replicas.
+    observation_space: The observation space of a single replica.
+    action_space: The action space of a single replica.
+  """
+
+  def __init__(self, num_envs, observation_space, action_space, copy=True):
+    """Initializes the stacked observation arrays.
+
+    Args:
+      num_envs: An integer representing the number of replicas.
+      observation_space: The observation space of a single replica.
+      action_space: The action space of a single replica.
+      copy: A boolean indicating whether to return copies of the stacked
+        observations. Otherwise, the arrays returned are overwritten by the
+        next call to reset or step.
+    """
+    if num_envs <= 0:
+      raise ValueError('num_envs must be positive, got %s.' % num_envs)
+    self._num_envs = num_envs
+    self._observation_space = observation_space
+    self._action_space = action_space
+    self._copy = copy
+    self._spec = compile_observation_spec(observation_space)
+
+  @property
+  def num_envs(self):
+    return self._num_envs
+
+  @property
+  def observation_space(self):
+    return self._observation_space
+
+  @property
+  def action_space(self):
+    return self._action_space
+
+  def _observations(self):
+    if self._copy:
+      return _map_arrays(np.copy, self._stacked_observations)
+    return self._stacked_observations
+
+  @abc.abstractmethod
+  def reset(self):
+    """Resets all replicas and returns their stacked first observations."""
+
+  @abc.abstractmethod
+  def step_async(self, actions):
+    """Starts stepping every replica with its action.
+
+    Args:
+      actions: A sequence of num_envs actions, e.g. an integer array of shape
+        [num_envs, slate_size], or [num_envs, num_users, slate_size] for a
+        MultiUserEnvironment.
+    """
+
+  @abc.abstractmethod
+  def step_wait(self):
+    """Waits for the step started by step_async to complete.
+
+    Returns:
+      A four-tuple of (observations, rewards, dones, infos) where:
+        observations: The stacked observations of the replicas.
+        rewards: A float array of shape [num_envs].
+        dones: A boolean array of shape [num_envs] indicating which episodes
+          ended, and were reset, at this step.
+        infos: A list of num_envs info dictionaries.
+    """
+
+  def step(self, actions):
+    """Steps every replica, see step_async and step_wait."""
+    self.step_async(actions)
+    return self.step_wait()
+
+  def close(self):
+    """Releases the resources held by the replicas."""
+
+
+class SyncVectorEnv(VectorEnv):
+  """A vector environment stepping its replicas in the calling process."""
+
+  def __init__(self, create_environment_fn, env_config, num_envs, copy=True):
+    """Creates num_envs replicas of an environment.
+
+    Args:
+      create_environment_fn: A function taking an env_config and returning a
+        RecSimGymEnv.
+      env_config: The configuration of the environment. Every replica gets an
+        independent seed derived from env_config['seed'].
+      num_envs: An integer representing the number of replicas.
+      copy: A boolean indicating whether to return copies of the stacked
+        observations.
+    """
+    self._envs = [
+        create_environment_fn(config)
+        for config in _seeded_configs(env_config, num_envs)
+    ]
+    super(SyncVectorEnv, self).__init__(num_envs,
+                                        self._envs[0].observation_space,
+                                        self._envs[0].action_space, copy)
+    self._stacked_observations = _allocate(self._spec, (num_envs,), np.zeros)
+    self._actions = None
+
+  @property
+  def envs(self):
+    """Returns the list of RecSimGymEnv replicas."""
+    return self._envs
+
+  def reset(self):
+    for i, env in enumerate(self._envs):
+      write_observation(self._spec, env.reset(), self._stacked_observations, i)
+    return self._observations()
+
+  def step_async(self, actions):
+    self._actions = actions
+
+  def step_wait(self):
+    rewards = np.zeros(self._num_envs)
+    dones = np.zeros(self._num_envs, dtype=bool)
+    infos = []
+    for i, (env, action) in enumerate(zip(self._envs, self._actions)):
+      observation, rewards[i], dones[i], info = env.step(action)
+      if dones[i]:
+        info = dict(info, terminal_observation=observation)
+        observation = env.reset()
+      write_observation(self._spec, observation, self._stacked_observations, i)
+      infos.append(info)
+    self._actions = None
+    return self._observations(), rewards, dones, infos
+
+
+class _SharedArrays(object):
+  """Allocates arrays one after the other in a shared memory buffer."""
+
+  def __init__(self, buf=None):
+    self._buf = buf
+    self.size = 0
+
+  def __call__(self, shape, dtype):
+    offset = self.size
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    self.size += -(-size // _ALIGNMENT) * _ALIGNMENT
+    if self._buf is None:
+      return None
+    return np.ndarray(shape, dtype=dtype, buffer=self._buf, offset=offset)
+
+
+def _run_worker(worker):
+  """Runs a replica of an AsyncVectorEnv in a worker process."""
+  connection = worker['connection']
+  env = worker['create_environment_fn'](worker['env_config'])
+  # Environments draw from their own random streams; this only seeds the global
+  # numpy RNG of the worker, as a standalone gym environment would.
+  env.seed(worker['env_config']['seed'])
+  shm = shared_memory.SharedMemory(name=worker['shm_name'])
+  spec = worker['spec']
+  observations = _allocate(spec, (worker['num_envs'],), _SharedArrays(shm.buf))
+  index = worker['index']
+  try:
+    while True:
+      command, data = connection.recv()
+      try:
+        if command == 'reset':
+          write_observation(spec, env.reset(), observations, index)
+          connection.send((True, None))
+        elif command == 'step':
+          observation, reward, done, info = env.step(data)
+          # The raw environment stays in the worker.
+          info = {key: value for key, value in info.items() if key != 'env'}
+          if done:
+            info['terminal_observation'] = observation
+            observation = env.reset()
+          write_observation(spec, observation, observations, index)
+          connection.send((True, (reward, done, info)))
+        elif command == 'close':
+          break
+        else:
+          raise ValueError('Unknown command: %s' % command)
+      except Exception:  # pylint: disable=broad-except
+        connection.send((False, traceback.format_exc()))
+  finally:
+    del observations
+    shm.close()
+    connection.close()
+
+
+class AsyncVectorEnv(VectorEnv):
+  """A vector environment stepping every replica in a worker process.
+
+  Workers are spawned from scratch, so create_environment_fn must be a
+  picklable module-level function. Stacked observations live in a shared
+  memory block owned by this object, which frees it in close().
+  """
+
+  def __init__(self, create_environment_fn, env_config, num_envs, copy=True):
+    """Starts num_envs worker processes, each running one replica.
+
+    Args:
+      create_environment_fn: A function taking an env_config and returning a
+        RecSimGymEnv.
+      env_config: The configuration of the environment. Every replica gets an
+        independent seed derived from env_config['seed'].
+      num_envs: An integer representing the number of replicas.
+      copy: A boolean indicating whether to return copies of the stacked
+        observations.
+    """
+    # The spaces are read from a replica built in this process.
+    prototype = create_environment_fn(env_config)
+    super(AsyncVectorEnv, self).__init__(num_envs, prototype.observation_space,
+                                         prototype.action_space, copy)
+    del prototype
+    layout = _SharedArrays()
+    _allocate(self._spec, (num_envs,), layout)
+    self._shm = shared_memory.SharedMemory(
+        create=True, size=max(layout.size, 1))
+    self._stacked_observations = _allocate(self._spec, (num_envs,),
+                                           _SharedArrays(self._shm.buf))
+
+    # Forking a process with a live TensorFlow runtime is unsafe, so workers
+    # are spawned from scratch.
+    context = multiprocessing.get_context('spawn')
+    self._connections = []
+    self._processes = []
+    for i, config in enumerate(_seeded_configs(env_config, num_envs)):
+      connection, worker_connection = context.Pipe()
+      worker = {
+          'create_environment_fn': create_environment_fn,
+          'env_config': config,
+          'shm_name': self._shm.name,
+          'spec': self._spec,
+          'num_envs': num_envs,
+          'index': i,
+          'connection': worker_connection,
+      }
+      process = context.Process(target=_run_worker, args=(worker,))
+      process.daemon = True
+      process.start()
+      worker_connection.close()
+      self._connections.append(connection)
+      self._processes.append(process)
+    self._closed = False
+
+  def _receive(self):
+    """Returns the replies of all workers, raising if any failed."""
+    replies = []
+    errors = []
+    for i, connection in enumerate(self._connections):
+      success, reply = connection.recv()
+      if not success:
+        errors.append('Worker %d failed:\n%s' % (i, reply))
+      replies.append(reply)
+    if errors:
+      raise RuntimeError('\n'.join(errors))
+    return replies
+
+  def reset(self):
+    for connection in self._connections:
+      connection.send(('reset', None))
+    self._receive()
+    return self._observations()
+
+  def step_async(self, actions):
+    for connection, action in zip(self._connections, actions):
+      connection.send(('step', action))
+
+  def step_wait(self):
+    rewards, dones, infos = zip(*self._receive())
+    return (self._observations(), np.array(rewards, dtype=np.float64),
+            np.array(dones, dtype=bool), list(infos))
+
+  def close(self):
+    """Stops the workers and frees the shared memory."""
+    if self._closed:
+      return
+    self._closed = True
+    for connection in self._connections:
+      try:
+        connection.send(('close', None))
+      except (BrokenPipeError, EOFError):
+        pass
+    for process in self._processes:
+      process.join()
+    for connection in self._connections:
+      connection.close()
+    # Views must be released before the memory can be closed.
+    self._stacked_observations = None
+    self._shm.close()
+    self._shm.unlink()
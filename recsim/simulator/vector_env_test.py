@@ -0,0 +1,139 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.simulator.vector_env."""
+
+import numpy as np
+from recsim.environments import interest_exploration as ie
+from recsim.environments import long_term_satisfaction as lts
+from recsim.simulator import environment
+from recsim.simulator import recsim_gym
+from recsim.simulator import vector_env
+import tensorflow.compat.v1 as tf
+
+_NUM_USERS = 3
+
+
+def _create_multi_user_environment(env_config):
+  user_models = [
+      lts.LTSUserModel(
+          env_config['slate_size'],
+          user_state_ctor=lts.LTSUserState,
+          response_model_ctor=lts.LTSResponse,
+          seed=env_config['seed'] + i) for i in range(_NUM_USERS)
+  ]
+  multi_user_env = environment.MultiUserEnvironment(
+      user_models, lts.LTSDocumentSampler(seed=env_config['seed']),
+      env_config['num_candidates'], env_config['slate_size'])
+  return recsim_gym.RecSimGymEnv(
+      multi_user_env, lambda responses: float(len(responses)))
+
+
+class VectorEnvTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(VectorEnvTest, self).setUp()
+    self._num_envs = 3
+    self._env_config = {
+        'num_candidates': 5,
+        'slate_size': 2,
+        'resample_documents': True,
+        'seed': 0,
+    }
+
+  def test_sync_vector_env(self):
+    vec_env = vector_env.SyncVectorEnv(ie.create_environment,
+                                       self._env_config, self._num_envs)
+    observations = vec_env.reset()
+    self.assertAllEqual((self._num_envs, 0), observations['user'].shape)
+    self.assertAllEqual((self._num_envs, 5),
+                        observations['doc']['quality'].shape)
+    self.assertAllEqual(np.zeros((self._num_envs, 2)),
+                        observations['response']['click'])
+    # Documents are stacked in candidate set order.
+    candidate_set = vec_env.envs[1].environment.candidate_set
+    doc_obs = candidate_set.create_observation().values()
+    self.assertAllClose([doc['quality'] for doc in doc_obs],
+                        observations['doc']['quality'][1])
+    # Replicas are seeded independently.
+    self.assertNotAllClose(observations['doc']['quality'][0],
+                           observations['doc']['quality'][1])
+
+    actions = np.tile([3, 1], (self._num_envs, 1))
+    next_observations, rewards, dones, infos = vec_env.step(actions)
+    self.assertAllEqual((self._num_envs,), rewards.shape)
+    self.assertFalse(np.any(dones))
+    self.assertLen(infos, self._num_envs)
+    # Responses are to the documents of the previous observation.
+    self.assertAllClose(observations['doc']['quality'][:, [3, 1]],
+                        next_observations['response']['quality'])
+
+  def test_auto_reset(self):
+    vec_env = vector_env.SyncVectorEnv(lts.create_environment,
+                                       self._env_config, self._num_envs)
+    vec_env.reset()
+    actions = np.tile([0, 1], (self._num_envs, 1))
+    for _ in range(1000):
+      observations, _, dones, infos = vec_env.step(actions)
+      if np.any(dones):
+        break
+    self.assertTrue(np.any(dones))
+    i = np.flatnonzero(dones)[0]
+    self.assertLen(infos[i]['terminal_observation']['response'], 2)
+    # The observation of a reset replica holds no responses.
+    self.assertAllEqual([0, 0], observations['response']['click'][i])
+
+  def test_multi_user(self):
+    vec_env = vector_env.SyncVectorEnv(_create_multi_user_environment,
+                                       self._env_config, self._num_envs)
+    observations = vec_env.reset()
+    self.assertAllEqual((self._num_envs, _NUM_USERS, 0),
+                        observations['user'].shape)
+    actions = np.tile([0, 1], (self._num_envs, _NUM_USERS, 1))
+    observations, rewards, _, _ = vec_env.step(actions)
+    self.assertAllEqual((self._num_envs, _NUM_USERS, 2),
+                        observations['response']['engagement'].shape)
+    self.assertAllEqual(np.ones((self._num_envs, _NUM_USERS)),
+                        observations['response']['click'][:, :, 0])
+    self.assertAllEqual(np.full(self._num_envs, _NUM_USERS), rewards)
+
+  def test_async_vector_env(self):
+    sync_env = vector_env.SyncVectorEnv(ie.create_environment,
+                                        self._env_config, self._num_envs)
+    async_env = vector_env.AsyncVectorEnv(ie.create_environment,
+                                          self._env_config, self._num_envs)
+    try:
+      self.assertEqual(sync_env.observation_space, async_env.observation_space)
+      observations = async_env.reset()
+      self.assertAllClose(sync_env.reset()['doc']['quality'],
+                          observations['doc']['quality'])
+      actions = np.tile([0, 1], (self._num_envs, 1))
+      observations, rewards, dones, infos = async_env.step(actions)
+      sync_observations = sync_env.step(actions)[0]
+      self.assertAllEqual((self._num_envs,), rewards.shape)
+      self.assertFalse(np.any(dones))
+      self.assertNotIn('env', infos[0])
+      self.assertAllClose(sync_observations['doc']['quality'],
+                          observations['doc']['quality'])
+      self.assertAllEqual((self._num_envs, 2),
+                          observations['response']['click'].shape)
+      with self.assertRaisesRegex(RuntimeError, 'Worker 0 failed'):
+        async_env.step(np.tile([0, 1, 2, 3], (self._num_envs, 1)))
+    finally:
+      async_env.close()
+
+
+if __name__ == '__main__':
+  tf.test.main()
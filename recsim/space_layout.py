@@ -0,0 +1,211 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compiled flat layouts of nested gym spaces.
+
+gym.spaces.flatten walks the nested Dict and Tuple structure of a space on
+every call and allocates an array for every leaf. A SpaceLayout does the walk
+once: it records, for every leaf (Box, Discrete, MultiBinary or MultiDiscrete)
+of the space, the path of keys leading to it together with its offset, size,
+shape and dtype in the flattened vector. Encoding an observation then reduces
+to a loop over the leaves writing straight into a preallocated buffer.
+
+The flattened vector is the same as the one produced by gym.spaces.flatten:
+Box and MultiBinary leaves are raveled, Discrete and MultiDiscrete leaves are
+one-hot encoded.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+from gym import spaces
+import numpy as np
+
+_BOX = 0
+_DISCRETE = 1
+_MULTI_DISCRETE = 2
+
+Leaf = collections.namedtuple(
+    'Leaf', ['path', 'space', 'kind', 'offset', 'size', 'shape', 'dtype'])
+
+
+def _leaves(space, path=()):
+  """Yields (path, space) for the leaves of space in flattening order."""
+  if isinstance(space, spaces.Dict):
+    for key, subspace in space.spaces.items():
+      for leaf in _leaves(subspace, path + (key,)):
+        yield leaf
+  elif isinstance(space, spaces.Tuple):
+    for i, subspace in enumerate(space.spaces):
+      for leaf in _leaves(subspace, path + (i,)):
+        yield leaf
+  else:
+    yield path, space
+
+
+def leaf_spaces(space):
+  """Returns the list of (path, space) of the basic spaces nested in space.
+
+  Args:
+    space: A gym space, possibly nesting Dict and Tuple spaces.
+
+  Returns:
+    A list of (path, leaf_space) tuples in flattening order, where path is the
+      tuple of keys and indices leading to leaf_space.
+  """
+  return list(_leaves(space))
+
+
+def get_path(observation, path):
+  """Returns the element of a nested observation at path."""
+  for key in path:
+    observation = observation[key]
+  return observation
+
+
+class SpaceLayout(object):
+  """The flat layout of a gym space.
+
+  Attributes:
+    space: The compiled gym space.
+    leaves: A list of Leaf tuples in flattening order.
+    size: The size of the flattened vector.
+    dtype: The dtype of the vector returned by gym.spaces.flatten.
+  """
+
+  def __init__(self, space):
+    """Compiles the layout of a gym space.
+
+    Args:
+      space: A gym space nesting Dict and Tuple spaces with Box, Discrete,
+        MultiBinary or MultiDiscrete leaves.
+
+    Raises:
+      NotImplementedError: if space contains another type of space.
+    """
+    self.space = space
+    self.leaves = []
+    offset = 0
+    for path, leaf_space in _leaves(space):
+      if isinstance(leaf_space, (spaces.Box, spaces.MultiBinary)):
+        kind = _BOX
+        size = int(np.prod(leaf_space.shape))
+      elif isinstance(leaf_space, spaces.Discrete):
+        kind = _DISCRETE
+        size = int(leaf_space.n)
+      elif isinstance(leaf_space, spaces.MultiDiscrete):
+        kind = _MULTI_DISCRETE
+        size = int(np.sum(leaf_space.nvec))
+      else:
+        raise NotImplementedError('Gym space type ' + str(type(leaf_space)) +
+                                  ' not implemented yet.')
+      self.leaves.append(
+          Leaf(path, leaf_space, kind, offset, size, leaf_space.shape,
+               leaf_space.dtype))
+      offset += size
+    self.size = offset
+    # Leaves are promoted to a common dtype, as np.concatenate would do.
+    self.dtype = (np.result_type(*[leaf.dtype for leaf in self.leaves])
+                  if self.leaves else np.dtype(np.float32))
+    self._multi_discrete_offsets = {
+        leaf.offset: leaf.offset + np.concatenate(
+            [[0], np.cumsum(leaf.space.nvec.ravel())[:-1]])
+        for leaf in self.leaves
+        if leaf.kind == _MULTI_DISCRETE
+    }
+
+  def encode_into(self, observation, out):
+    """Writes the flattened observation into out.
+
+    Args:
+      observation: An observation conforming to the space.
+      out: A 1-D array (or view) of at least self.size elements. Elements past
+        self.size are left untouched.
+
+    Returns:
+      out.
+    """
+    for path, space, kind, offset, size, _, _ in self.leaves:
+      value = observation
+      for key in path:
+        value = value[key]
+      if kind == _BOX:
+        out[offset:offset + size] = np.ravel(value)
+      elif kind == _DISCRETE:
+        out[offset:offset + size] = 0
+        out[offset + int(value) - getattr(space, 'start', 0)] = 1
+      else:
+        out[offset:offset + size] = 0
+        out[self._multi_discrete_offsets[offset] + np.ravel(value)] = 1
+    return out
+
+  def flatten(self, observation, dtype=None):
+    """Returns a new flattened array of the observation."""
+    out = np.empty(self.size, dtype=dtype or self.dtype)
+    return self.encode_into(observation, out)
+
+  def decode(self, buf):
+    """Reconstructs an observation from its flattened array.
+
+    Args:
+      buf: A 1-D array of at least self.size elements.
+
+    Returns:
+      The observation with the nested structure of the space.
+    """
+    return self._decode(self.space, buf, iter(self.leaves))
+
+  def _decode(self, space, buf, leaves):
+    if isinstance(space, spaces.Dict):
+      return collections.OrderedDict(
+          (key, self._decode(subspace, buf, leaves))
+          for key, subspace in space.spaces.items())
+    if isinstance(space, spaces.Tuple):
+      return tuple(self._decode(subspace, buf, leaves)
+                   for subspace in space.spaces)
+    _, space, kind, offset, size, shape, dtype = next(leaves)
+    values = buf[offset:offset + size]
+    if kind == _BOX:
+      return np.asarray(values, dtype=dtype).reshape(shape)
+    if kind == _DISCRETE:
+      return int(np.argmax(values)) + getattr(space, 'start', 0)
+    nvec = space.nvec.ravel()
+    starts = np.concatenate([[0], np.cumsum(nvec)[:-1]])
+    return np.array([
+        np.argmax(values[start:start + n]) for start, n in zip(starts, nvec)
+    ], dtype=dtype).reshape(shape)
+
+
+def compile_layouts(space_list):
+  """Compiles the layouts of a list of spaces.
+
+  Consecutive equal spaces, e.g. the observation spaces of candidate
+  documents, share a single SpaceLayout.
+
+  Args:
+    space_list: An iterable of gym spaces.
+
+  Returns:
+    A list of SpaceLayouts, one for each space.
+  """
+  layouts = []
+  for space in space_list:
+    if not layouts or space != layouts[-1].space:
+      layout = SpaceLayout(space)
+    layouts.append(layout)
+  return layouts
@@ -0,0 +1,87 @@
+# coding=utf-8
+# coding=utf-8
+# Copyright 2019 The RecSim Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for recsim.space_layout."""
+
+import collections
+
+from gym import spaces
+import numpy as np
+from recsim import space_layout
+import tensorflow.compat.v1 as tf
+
+
+class SpaceLayoutTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SpaceLayoutTest, self).setUp()
+    self._space = spaces.Dict({
+        'box': spaces.Box(low=-1.0, high=1.0, shape=(2, 3), dtype=np.float32),
+        'nested': spaces.Tuple((
+            spaces.Discrete(4),
+            spaces.MultiDiscrete([2, 3]),
+            spaces.MultiBinary(2),
+        )),
+        'scalar': spaces.Box(low=0.0, high=10.0, shape=(), dtype=np.float32),
+    })
+    self._observation = collections.OrderedDict([
+        ('box', np.arange(6, dtype=np.float32).reshape((2, 3)) / 10.0),
+        ('nested', (3, np.array([1, 2]), np.array([1, 0], dtype=np.int8))),
+        ('scalar', np.float32(7.0)),
+    ])
+
+  def test_flatten_matches_gym(self):
+    layout = space_layout.SpaceLayout(self._space)
+    expected = spaces.flatten(self._space, self._observation)
+    self.assertEqual(layout.size, spaces.flatdim(self._space))
+    self.assertAllClose(layout.flatten(self._observation), expected)
+
+  def test_encode_into_preallocated_buffer(self):
+    layout = space_layout.SpaceLayout(self._space)
+    out = np.full(layout.size + 2, -1.0, dtype=np.float32)
+    layout.encode_into(self._observation, out)
+    self.assertAllClose(out[:layout.size],
+                        spaces.flatten(self._space, self._observation))
+    self.assertAllEqual(out[layout.size:], [-1.0, -1.0])
+    # Encoding again must clear the previous one-hot entries.
+    self._observation['nested'] = (0, np.array([0, 0]), np.array([0, 1]))
+    layout.encode_into(self._observation, out)
+    self.assertAllClose(out[:layout.size],
+                        spaces.flatten(self._space, self._observation))
+
+  def test_decode(self):
+    layout = space_layout.SpaceLayout(self._space)
+    decoded = layout.decode(layout.flatten(self._observation))
+    self.assertAllClose(decoded['box'], self._observation['box'])
+    self.assertEqual(decoded['nested'][0], 3)
+    self.assertAllEqual(decoded['nested'][1], [1, 2])
+    self.assertAllEqual(decoded['nested'][2], [1, 0])
+    self.assertAllClose(decoded['scalar'], 7.0)
+
+  def test_compile_layouts_shares_equal_spaces(self):
+    box = spaces.Box(low=0.0, high=1.0, shape=(3,), dtype=np.float32)
+    layouts = space_layout.compile_layouts(
+        [box, box, spaces.Discrete(3), spaces.Discrete(3)])
+    self.assertIs(layouts[0], layouts[1])
+    self.assertIs(layouts[2], layouts[3])
+    self.assertIsNot(layouts[1], layouts[2])
+
+  def test_unsupported_space(self):
+    with self.assertRaises(NotImplementedError):
+      space_layout.SpaceLayout(spaces.Tuple((spaces.Space(),)))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -190,7 +190,7 @@ class SimpleSequentialUserModel(user.AbstractUserModel):
 
   def update_state(self, slate_documents, responses):
     doc = slate_documents[0]
-    next_state = np.random.choice(
+    next_state = self._rng.choice(
         6, p=self._transition_matrix[doc.action_id, self._user_state.state])
     self._user_state = SimpleSequentialUserState(next_state)
     return
@@ -261,7 +261,7 @@ class SimpleSequentialUserSampler(user.AbstractUserSampler):
                                                       **kwargs)
 
   def sample_user(self):
-    starting_state = np.random.choice(6, p=self._probs)
+    starting_state = self._rng.choice(6, p=self._probs)
     return SimpleSequentialUserState(starting_state)
 
 
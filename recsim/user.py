@@ -22,12 +22,28 @@ from __future__ import print_function
 import abc
 from gym import spaces
 import numpy as np
+from recsim import random_streams
 import six
 
+# Key of the stream of the user dynamics, relative to the user sampler seed.
+_USER_DYNAMICS_STREAM = 1
+
 
 @six.add_metaclass(abc.ABCMeta)
 class AbstractResponse(object):
-  """Abstract class to model a user response."""
+  """Abstract class to model a user response.
+
+  Responses are allocated for every slate, so they declare __slots__ rather
+  than carrying a per-instance __dict__. Subclasses should list their
+  attributes in __slots__ too.
+  """
+
+  __slots__ = ()
+
+  # Structured dtype of the record of a response, with one field per key of
+  # the response space, in the same order. Derived from the response space if
+  # None.
+  RESPONSE_DTYPE = None
 
   @staticmethod
   @abc.abstractmethod
@@ -38,10 +54,66 @@ class AbstractResponse(object):
   def create_observation(self):
     """Creates a tensor observation of this response."""
 
+  @classmethod
+  def response_dtype(cls):
+    """Returns the structured dtype of the records of this type of response."""
+    if cls.RESPONSE_DTYPE is not None:
+      return cls.RESPONSE_DTYPE
+    return np.dtype([(key, _field_dtype(space))
+                     for key, space in cls.response_space().spaces.items()])
+
+  def to_record(self):
+    """Returns the observation of this response as a record.
+
+    Subclasses declaring RESPONSE_DTYPE should override this method to build
+    the record from their attributes rather than from create_observation.
+
+    Returns:
+      A tuple of the observed values, in the order of the fields of
+        response_dtype().
+    """
+    observation = self.create_observation()
+    return tuple(observation[name] for name in self.response_dtype().names)
+
+
+def _field_dtype(space):
+  """Returns the dtype of a record field holding an element of space."""
+  if space.shape:
+    return (space.dtype, space.shape)
+  return space.dtype
+
+
+def encode_responses(responses, dtype, out=None):
+  """Encodes responses as a structured array, with one record per response.
+
+  Records can be indexed by field name like response observations, e.g.
+  records[i]['click'], without creating a dictionary and arrays per response.
+
+  Args:
+    responses: A list of AbstractResponses of the same type.
+    dtype: The response_dtype() of the responses.
+    out: An optional structured array of at least len(responses) records to
+      write the records into.
+
+  Returns:
+    A structured array of len(responses) records, a view of out if given.
+  """
+  records = [response.to_record() for response in responses]
+  if out is None:
+    return np.array(records, dtype=dtype)
+  out = out[:len(records)]
+  out[:] = records
+  return out
+
 
 @six.add_metaclass(abc.ABCMeta)
 class AbstractUserState(object):
-  """Abstract class to represent a user's state."""
+  """Abstract class to represent a user's state.
+
+  Subclasses should list their attributes in __slots__, see AbstractResponse.
+  """
+
+  __slots__ = ()
 
   # Number of features to represent the user's interests.
   NUM_FEATURES = None
@@ -72,14 +144,29 @@ class AbstractUserSampler(object):
     Args:
       user_ctor: A class/constructor for the type of user states that will be
         sampled.
-      seed: An integer for a random seed.
+      seed: An integer or np.random.SeedSequence seeding the random stream of
+        the sampler.
     """
     self._user_ctor = user_ctor
     self._seed = seed
     self.reset_sampler()
 
-  def reset_sampler(self):
-    self._rng = np.random.RandomState(self._seed)
+  @property
+  def seed(self):
+    return self._seed
+
+  def reset_sampler(self, key=()):
+    """Resets the random stream of the sampler.
+
+    The stream, self._rng, is a random_streams.RandomStream. It is a
+    np.random.Generator that also accepts the common np.random.RandomState
+    methods, but it draws different numbers for the same seed.
+
+    Args:
+      key: A tuple of non-negative integers identifying the stream, e.g. the
+        (episode, user) for which users are sampled.
+    """
+    self._rng = random_streams.make_stream(self._seed, key)
 
   @abc.abstractmethod
   def sample_user(self):
@@ -112,6 +199,19 @@ class AbstractUserModel(object):
     self._user_state = self._user_sampler.sample_user()
     self._response_model_ctor = response_model_ctor
     self._slate_size = slate_size
+    self._reset_rng()
+
+  def _reset_rng(self, key=()):
+    """Resets the random stream used to simulate responses and transitions.
+
+    The stream is derived from the seed of the user sampler, so it is
+    independent of the stream of initial user states.
+
+    Args:
+      key: A tuple of non-negative integers identifying the stream.
+    """
+    self._rng = random_streams.make_stream(self._user_sampler.seed,
+                                           (_USER_DYNAMICS_STREAM,) + key)
 
   ## Transition model
   @abc.abstractmethod
@@ -128,9 +228,18 @@ class AbstractUserModel(object):
     """Resets the user."""
     self._user_state = self._user_sampler.sample_user()
 
-  def reset_sampler(self):
-    """Resets the sampler."""
-    self._user_sampler.reset_sampler()
+  def reset_sampler(self, key=()):
+    """Resets the sampler and the random stream of the user dynamics.
+
+    Environments key both streams by (episode, user) at the start of every
+    episode, so that an episode is simulated the same way whether it is run
+    on its own or after other episodes.
+
+    Args:
+      key: A tuple of non-negative integers identifying the streams.
+    """
+    self._user_sampler.reset_sampler(key)
+    self._reset_rng(key)
 
   @abc.abstractmethod
   def is_terminal(self):
@@ -168,3 +277,156 @@ class AbstractUserModel(object):
   def create_observation(self):
     """Emits obesrvation about user's state."""
     return self._user_state.create_observation()
+
+
+@six.add_metaclass(abc.ABCMeta)
+class AbstractBatchedUserModel(object):
+  """Abstract class to represent the dynamics of a batch of independent users.
+
+  Unlike AbstractUserModel, which wraps a single user state object, a batched
+  user model holds the hidden state of num_users users as a struct-of-arrays:
+  a dictionary mapping state variable names to arrays whose leading dimension
+  indexes users. All methods operate on the whole batch in single NumPy calls.
+
+  Documents are passed to the batched dynamics as a dictionary mapping the
+  attribute names listed in DOC_ATTRIBUTES to arrays of shape
+  [num_users, slate_size, ...]. Responses are returned as a dictionary mapping
+  response names to arrays of shape [num_users, slate_size].
+  """
+
+  # Names of the document attributes consumed by the batched dynamics.
+  DOC_ATTRIBUTES = ()
+
+  def __init__(self, num_users, slate_size, seed=0):
+    """Initializes a new batched user model.
+
+    Args:
+      num_users: An integer representing the number of users in the batch.
+      slate_size: An integer representing the number of documents that can be
+        served to each user at any interaction.
+      seed: An integer or np.random.SeedSequence for the random stream.
+    """
+    if num_users <= 0:
+      raise ValueError('num_users must be positive, got %s.' % num_users)
+    self._num_users = num_users
+    self._slate_size = slate_size
+    self._seed = seed
+    self._state = None
+    self.reset_sampler()
+    self.reset()
+
+  @property
+  def num_users(self):
+    return self._num_users
+
+  def reset_sampler(self, key=()):
+    """Resets the sampler.
+
+    Args:
+      key: A tuple of non-negative integers identifying the random stream.
+    """
+    self._rng = random_streams.make_stream(self._seed, key)
+
+  def reset(self, mask=None):
+    """Resamples the hidden state of (a subset of) the users.
+
+    Args:
+      mask: An optional boolean array of shape [num_users]. If given, only the
+        users for which mask is True are resampled, otherwise all users are.
+    """
+    if mask is None:
+      self._state = self._sample_users(self._num_users)
+      return
+    mask = np.asarray(mask, dtype=bool)
+    num_reset = int(np.sum(mask))
+    if not num_reset:
+      return
+    sampled_state = self._sample_users(num_reset)
+    for key, value in sampled_state.items():
+      self._state[key][mask] = value
+
+  @abc.abstractmethod
+  def _sample_users(self, num_users):
+    """Samples initial hidden states for num_users users.
+
+    Args:
+      num_users: An integer representing the number of users to sample.
+
+    Returns:
+      A dictionary mapping state variable names to arrays of shape
+        [num_users, ...].
+    """
+
+  @abc.abstractmethod
+  def is_terminal(self):
+    """Returns a boolean array of shape [num_users] of finished sessions."""
+
+  @abc.abstractmethod
+  def simulate_response(self, slate_documents):
+    """Simulates the users' responses to a batch of slates.
+
+    Args:
+      slate_documents: A dictionary mapping the names in DOC_ATTRIBUTES to
+        arrays of shape [num_users, slate_size, ...].
+
+    Returns:
+      A dictionary mapping response names to arrays of shape
+        [num_users, slate_size].
+    """
+
+  @abc.abstractmethod
+  def update_state(self, slate_documents, responses):
+    """Updates the users' hidden states based on the slates and responses.
+
+    Args:
+      slate_documents: A dictionary mapping the names in DOC_ATTRIBUTES to
+        arrays of shape [num_users, slate_size, ...].
+      responses: A dictionary of response arrays as returned by
+        simulate_response.
+    """
+
+  @abc.abstractmethod
+  def create_observation(self):
+    """Returns an array of shape [num_users, ...] of user observations."""
+
+  def masked_update_state(self, slate_documents, responses, mask):
+    """Updates the hidden states of the users for which mask is True.
+
+    The dynamics are applied to the whole batch, after which the rows of the
+    users for which mask is False are restored, so that their states are left
+    unchanged.
+
+    Args:
+      slate_documents: A dictionary mapping the names in DOC_ATTRIBUTES to
+        arrays of shape [num_users, slate_size, ...].
+      responses: A dictionary of response arrays as returned by
+        simulate_response.
+      mask: A boolean array of shape [num_users].
+    """
+    frozen = ~np.asarray(mask, dtype=bool)
+    if not np.any(frozen):
+      self.update_state(slate_documents, responses)
+      return
+    frozen_state = {key: value[frozen] for key, value in self._state.items()}
+    self.update_state(slate_documents, responses)
+    for key, value in frozen_state.items():
+      self._state[key][frozen] = value
+
+  def _choose_items(self, scores, score_no_click):
+    """Samples at most one clicked item per slate from normalizable scores.
+
+    Args:
+      scores: A non-negative float array of shape [num_users, slate_size].
+      score_no_click: A non-negative float array of shape [num_users] holding
+        the score for the action of picking no document.
+
+    Returns:
+      A boolean array of shape [num_users, slate_size] with at most one True
+        entry per row, indicating the clicked item.
+    """
+    all_scores = np.concatenate([scores, score_no_click[:, np.newaxis]], axis=1)
+    cumulative = np.cumsum(all_scores, axis=1)
+    cumulative /= cumulative[:, -1:]
+    draws = self._rng.random((scores.shape[0], 1))
+    selected_index = np.sum(draws >= cumulative, axis=1)
+    return selected_index[:, np.newaxis] == np.arange(scores.shape[1])
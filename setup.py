@@ -77,6 +77,11 @@ setup(
 
     ],
     install_requires=install_requires,
+    entry_points={
+        'console_scripts': [
+            'recsim_benchmarks = recsim.benchmarks.run_benchmarks:run',
+        ],
+    },
     project_urls={  # Optional
         'Documentation': 'https://github.com/google-research/recsim',
         'Bug Reports': 'https://github.com/google-research/recsim/issues',